@@ -6,40 +6,718 @@
 
 import tkinter as tk
 from tkinter import filedialog as fd
-from time import sleep
+from time import sleep, perf_counter_ns
 import sys
 from os import path
 import re
-import RPi.GPIO as GPIO
 import threading
-import subprocess
-from requests import get
-
-PUL = [ 0, 0, 0 ]  # PUL pins
-DIR = [ 0, 0, 0 ]  # Controller Direction Pin (High for Controller default /
-                   # LOW to Force a Direction Change).
-delay = [0.0, 0.0, 0.0] # Delay between PUL pulses - effectively sets the motor
-                        # rotation speed.
+import heapq
+import argparse
+import os
+import mmap
+import struct
+import queue
+from math import sqrt
+from types import MappingProxyType
+from array import array
+from collections import deque
+
+# Modules which only some modes use (multiprocessing, asyncio, json, socket
+# and so on) are imported in the functions which use them, so that the user
+# interface does not wait for them when starting
+
+startup_times = [("imports", perf_counter_ns())] # (Phase, perf_counter_ns()
+                                                 # at its end); see
+                                                 # startupPhase()
+
+# Per-motor state is held as a structure of arrays, one typed array per field
+# indexed by motor, so that the motor loop reads plain numbers rather than
+# Python objects; see allocateMotors()
+motor_names = ["top", "middle", "bottom"] # Settings file sections of the motors
+PUL = array("i", [0, 0, 0]) # PUL pins
+DIR = array("i", [0, 0, 0]) # Controller Direction Pin (High for Controller
+                            # default / LOW to Force a Direction Change).
+delay = array("d", [0.0, 0.0, 0.0]) # Delay between PUL pulses - effectively sets
+                                    # the motor rotation speed.
 EMER = 0 # Emergency stop pin
-dirs = [True, True, True] # True for clockwise, False for anticlockwise
-operating = [False, False, False] # Allows each motor to be turned on or off
+dirs = array("B", [1, 1, 1]) # 1 for clockwise, 0 for anticlockwise
+operating = array("B", [0, 0, 0]) # Allows each motor to be turned on or off
                                   # independently
-rpm_0 = [False, False, False] # True if RPM set to 0 in GUI; prevents divide by 0 
+rpm_0 = array("B", [0, 0, 0]) # 1 if RPM set to 0 in GUI; prevents divide by 0
                               # error
+ramps = [None, None, None] # Ramp each motor follows to its new speed; see
+                           # MotionProfile
+current_interval = array("q", [0, 0, 0]) # Edge interval (ns) each motor is
+                                         # currently running at; 0 when stationary
+ramp_pending = array("B", [0, 0, 0]) # 1 whilst a ramp is on its way to the
+                                     # engine process
+steps = array("Q", [0, 0, 0]) # Number of pulses each motor has been sent
+position = array("q", [0, 0, 0]) # Net pulses each motor has been sent
+                                 # clockwise; anticlockwise pulses count down
+direction_changes = array("Q", [0, 0, 0]) # Number of times each motor's DIR
+                                          # level has changed
+missed_deadlines = array("Q", [0, 0, 0]) # Number of edges output more than
+                                         # GPIOHandler.late_fraction of their
+                                         # interval after they were due
+encoder_counts = array("q", [0, 0, 0]) # Net quadrature counts from each
+                                       # motor's encoder; see QuadratureEncoder
+stalled = array("B", [0, 0, 0]) # 1 once a motor has been stopped as stalled, 2
+                                # once the user interface has shown it
+late_peak = array("q", [0] * 6) # Two halves, each holding the latest (ns) each
+                                # motor's edges have been output; see
+                                # swapLatePeaks()
+telemetry_front = array("B", [0]) # Half of late_peak the motor loop writes to
+microstep_set = array("Q", [0, 0, 0]) # Masks of the BCM microstep pins each
+microstep_clear = array("Q", [0, 0, 0]) # motor's driver is switching high and
+                                        # low; see switchMicrosteps()
+microstep_pending = array("B", [0, 0, 0]) # 1 until the motor loop has written
+                                          # a motor's microstep masks
 gpio_handler = None
+step_rate_monitor = None # StepRateMonitor started with the motors; see
+                         # telemetrySnapshot()
 app = None
+gpio = None # GPIO backend used by the GPIO handler; see GPIOBackend
 
 version = "1.0.0"
 
 url_main = ("https://raw.githubusercontent.com/InventorHill/stepperHandler"
                 "/main/stepperHandler/")
 
+# Marks the end of a phase of starting up, so that how long each took can be
+# read from startup_times
+def startupPhase(name):
+    startup_times.append((name, perf_counter_ns()))
+
+# Returns the settings file sections for motor_count motors; the first three
+# keep their original names so that existing settings files still load
+def defaultMotorNames(motor_count):
+    names = ["top", "middle", "bottom"][:motor_count]
+    return names + ["motor_{0}".format(k + 1) for k in range(len(names),
+        motor_count)]
+
+# Returns the motor sections in a settings file, in order, or None if the file
+# cannot be read or contains none
+def readMotorNames(filepath):
+    try:
+        cfg = open(filepath, "r")
+        names = list(tokenizeSettings(cfg.read()))
+        cfg.close()
+    except OSError:
+        return None
+    names = [name for name in names if name not in ("all", "emergency")]
+    return names if names else None
+
+# Widget name prefix for a motor, e.g. "tp" for top or "m4" for motor_4
+def motorPrefix(name):
+    legacy = {"top" : "tp", "middle" : "md", "bottom" : "bt", "all" : "al"}
+    if name in legacy:
+        return legacy[name]
+    return "m" + name.split("_")[-1]
+
+def motorLabel(name):
+    if name.startswith("motor_"):
+        return "MOTOR {0}:".format(name.split("_")[-1])
+    return "{0} MOTOR:".format(name.upper())
+
+# Sizes the per-motor state arrays for the motors in names
+def allocateMotors(names):
+    global motor_names
+    global PUL
+    global DIR
+    global delay
+    global dirs
+    global operating
+    global rpm_0
+    global ramps
+    global current_interval
+    global ramp_pending
+    global steps
+    global position
+    global direction_changes
+    global missed_deadlines
+    global encoder_counts
+    global stalled
+    global late_peak
+    global telemetry_front
+    global microstep_set
+    global microstep_clear
+    global microstep_pending
+
+    motor_count = len(names)
+    motor_names = list(names)
+    PUL = array("i", [0]) * motor_count
+    DIR = array("i", [0]) * motor_count
+    delay = array("d", [0.0]) * motor_count
+    dirs = array("B", [1]) * motor_count
+    operating = array("B", [0]) * motor_count
+    rpm_0 = array("B", [0]) * motor_count
+    ramps = [None] * motor_count
+    current_interval = array("q", [0]) * motor_count
+    ramp_pending = array("B", [0]) * motor_count
+    steps = array("Q", [0]) * motor_count
+    position = array("q", [0]) * motor_count
+    direction_changes = array("Q", [0]) * motor_count
+    missed_deadlines = array("Q", [0]) * motor_count
+    encoder_counts = array("q", [0]) * motor_count
+    stalled = array("B", [0]) * motor_count
+    late_peak = array("q", [0]) * (2 * motor_count)
+    telemetry_front = array("B", [0])
+    microstep_set = array("Q", [0]) * motor_count
+    microstep_clear = array("Q", [0]) * motor_count
+    microstep_pending = array("B", [0]) * motor_count
+
+# Returns the settings for the motors in motor_names. Each setting is a
+# list of: widget name, window in which it will be found, value, error if
+# value incorrect, comment in settings file. Default comments are given for
+# the first motor only, but they can be changed by editing the settings file
+def settingsSchema(motor_names):
+    settings = {}
+
+    for i in range(len(motor_names)):
+        pre = motorPrefix(motor_names[i])
+        first = i == 0
+        settings[motor_names[i]] = {
+            "rpm" : [pre + "_rpm_ent", "main", "", "NaN",
+                "The motor's actual RPM" if first else ""],
+            "increment" : [pre + "_inc_ent", "main", "", "NaL", ("The letter "
+                "used to increment the RPM of the motor") if first else ""],
+            "decrement" : [pre + "_dec_ent", "main", "", "NaL", ("The letter "
+                "used to decrement the RPM of the motor") if first else ""],
+            "in_decrement_value" : [pre + "_inc_val_ent", "main", "", "NaN",
+                ("The value by which the motor's RPM is incremented or "
+                "decremented") if first else ""],
+            "direction" : ["cw_var", "main", True, "NaB", ("A binary value (1 "
+                "or 0) denoting the direction of the motor's rotation") if first
+                else ""],
+            "wrong_direction" : ["nul", "main", False, "NaB", ("Set this to 1 "
+                "if the motor is turning in the opposite direction to that "
+                "which was set in the GUI; otherwise, leave it at 0") if first
+                else ""],
+            "pulses_revolution" : [pre + "_spr_ent", "settings", "", "NaI",
+                ("The number of pulses per revolution set using the dip "
+                "switches on the controller") if first else ""],
+            "pul_pin" : [pre + "_pul_ent", "settings", "", "NaP", ("The "
+                "physical location of the PUL pin (odd on the left-hand side, "
+                "even on the right)") if first else ""],
+            "dir_pin" : [pre + "_dir_ent", "settings", "", "NaP", ("The "
+                "physical location of the DIR pin (odd on the left-hand side, "
+                "even on the right)") if first else ""],
+            "encoder_a_pin" : ["nul", "settings", "", "NaP", ("The physical "
+                "location of the encoder's A output, if the motor has an "
+                "encoder; leave blank for none") if first else ""],
+            "encoder_b_pin" : ["nul", "settings", "", "NaP", ("The physical "
+                "location of the encoder's B output; swap A and B if the "
+                "motor stalls as soon as it starts") if first else ""],
+            "encoder_counts" : ["nul", "settings", "", "NaI", ("The number of "
+                "encoder counts per revolution, counting both edges of A and "
+                "B (four times the lines per revolution)") if first else ""],
+            "stall_steps" : ["nul", "settings", "100", "NaN", ("How many steps "
+                "the encoder may fall behind or run ahead of the motor before "
+                "the motor is stopped as stalled") if first else ""],
+            "acceleration" : ["nul", "settings", "0", "NaN", ("The rate (RPM "
+                "per second) at which the motor's speed is ramped; 0 changes "
+                "the speed instantly") if first else ""],
+            "jerk" : ["nul", "settings", "0", "NaN", ("The rate (RPM per "
+                "second squared) at which the acceleration is ramped, giving "
+                "an S-curve; 0 for a trapezoidal ramp") if first else ""],
+            "microstep_pins" : ["nul", "settings", "", "NPL", ("The physical "
+                "locations of the controller's microstep pins, separated by "
+                "commas, if they are wired to the Pi; leave blank if the "
+                "microstepping is only set with the dip switches") if first
+                else ""],
+            "microsteps" : ["nul", "settings", "", "NaM", ("The pulses per "
+                "revolution the microstep pins can select, separated by "
+                "commas, each followed by a colon and the pin levels in order, "
+                "e.g. 200:000,400:100,800:010; the finest which keeps the "
+                "pulses within max_edge_rate is used. Not used for a motor "
+                "with an encoder") if first else ""]
+        }
+
+    settings["all"] = {
+        "increment" : ["al_inc_ent", "main", "", "NaL", ""],
+        "decrement" : ["al_dec_ent", "main", "", "NaL", ""],
+        "percentage" : ["al_inc_val_ent", "main", "", "NaN", ("The percentage "
+        "by which to increment or decrement all motors")],
+        "max_edge_rate" : ["nul", "settings", "", "NaN", ("The most edges (two "
+        "per pulse) a second that can be output for all motors together "
+        "without falling behind, as measured by --measure-capacity; RPMs "
+        "needing more are refused. Leave blank for no limit")]
+    }
+    settings["emergency"] = {
+        "stop_pin" : ["emer_stp_ent", "settings", "", "NaP", ("The physical "
+        "location of the emergency stop pin (odd on the left-hand side, even "
+        "on the right)")]
+    }
+
+    return settings
+
+
+# Widgets in each motor's row of MainWindow's main and settings views, by
+# widget name suffix: (suffix, column, grid options)
+main_motor_row = (
+    ("_mtr_lbl", 0, {"padx" : 5, "pady" : 5}),
+    ("_rpm_lbl", 1, {"padx" : 5, "pady" : 5}),
+    ("_rpm_ent", 2, {"padx" : 5, "pady" : 5}),
+    ("_inc_lbl", 3, {"padx" : 5, "pady" : 5}),
+    ("_inc_ent", 4, {"padx" : 5, "pady" : 5}),
+    ("_dec_lbl", 5, {"padx" : 5, "pady" : 5}),
+    ("_dec_ent", 6, {"padx" : 5, "pady" : 5}),
+    ("_inc_val_lbl", 7, {"padx" : 5, "pady" : 5}),
+    ("_inc_val_ent", 8, {"padx" : 5, "pady" : 5}),
+    ("_run_lbl", 9, {"padx" : 5, "pady" : 5}),
+    ("_run_chk", 10, {"pady" : 5}),
+    ("_cw_lbl", 11, {"padx" : 5}),
+    ("_cw_rdo", 12, {"padx" : 5}),
+    ("_acw_lbl", 13, {"padx" : 5}),
+    ("_acw_rdo", 14, {"padx" : 5}),
+    ("_sts_lbl", 15, {"padx" : 5, "pady" : 5})
+)
+settings_motor_row = (
+    ("_mtr_lbl", 0, {"padx" : 5}),
+    ("_spr_lbl", 1, {"padx" : 5}),
+    ("_spr_ent", 2, {"padx" : 5}),
+    ("_pul_lbl", 3, {"padx" : 5, "pady" : 5}),
+    ("_pul_ent", 4, {"padx" : 5, "pady" : 5}),
+    ("_dir_lbl", 5, {"padx" : 5, "pady" : 5}),
+    ("_dir_ent", 6, {"padx" : 5, "pady" : 5})
+)
+# The row of the main view for all motors
+main_all_row = (
+    ("al_mtr_lbl", 0, {"padx" : 5, "pady" : 5}),
+    ("al_inc_lbl", 3, {"padx" : 5, "pady" : 5}),
+    ("al_inc_ent", 4, {"padx" : 5, "pady" : 5}),
+    ("al_dec_lbl", 5, {"padx" : 5, "pady" : 5}),
+    ("al_dec_ent", 6, {"padx" : 5, "pady" : 5}),
+    ("al_inc_val_lbl", 7, {"padx" : 5, "pady" : 5}),
+    ("al_inc_val_ent", 8, {"padx" : 5, "pady" : 5})
+)
+
+# Returns where each widget of each of MainWindow's views is gridded within
+# the view's frame, as {view: [(widget name, grid options)]}, for the motors
+# in motor_names
+def viewLayout(motor_names):
+    def cell(name, row, column, options):
+        options = dict(options)
+        options.update({"row" : row, "column" : column})
+        return (name, options)
+
+    main = [
+        cell("vers_lbl", 0, 0, {"padx" : 5, "sticky" : "w"}),
+        cell("sett_btn", 1, 0, {"columnspan" : 4, "sticky" : "we", "padx" : 5,
+            "pady" : 5}),
+        cell("file_btn", 1, 4, {"columnspan" : 3, "sticky" : "we", "padx" : 5,
+            "pady" : 5}),
+        cell("file_lbl", 1, 7, {"columnspan" : 4, "sticky" : "we", "padx" : 5,
+            "pady" : 5})
+    ]
+    settings = []
+
+    # One row per motor, starting at row 2 of the main view
+    for i in range(len(motor_names)):
+        pre = motorPrefix(motor_names[i])
+        main += [cell(pre + suffix, i + 2, column, options)
+            for suffix, column, options in main_motor_row]
+        settings += [cell(pre + suffix, i, column, options)
+            for suffix, column, options in settings_motor_row]
+
+    row = len(motor_names) + 2
+    main += [cell(name, row, column, options)
+        for name, column, options in main_all_row]
+    main.append(cell("strt_btn", row + 1, 1, {"columnspan" : 7, "sticky" : "we",
+        "pady" : 5}))
+
+    row = len(motor_names)
+    settings += [
+        cell("emer_stp_lbl", row, 3, {"padx" : 5, "pady" : 5}),
+        cell("emer_stp_ent", row, 4, {"padx" : 5, "pady" : 5}),
+        cell("sv_btn", row + 1, 0, {"columnspan" : 3, "padx" : 5, "pady" : 5,
+            "sticky" : "we"}),
+        cell("cncl_btn", row + 1, 3, {"columnspan" : 4, "padx" : 5, "pady" : 5,
+            "sticky" : "we"})
+    ]
+
+    errors = [
+        cell("err_lbl", 0, 0, {"columnspan" : 3, "padx" : 5, "pady" : 5}),
+        cell("ok_btn", 1, 1, {"padx" : 5, "pady" : 5})
+    ]
+
+    return {"main" : main, "settings" : settings, "errors" : errors}
+
+# Checks for each kind of setting, by error code; each returns the value to
+# store for the text in the settings file, or raises ValueError. An empty
+# value is always allowed, as the user can fill it in from the GUI
+def checkNumber(text, pins):
+    if float(text) < 0:
+        raise ValueError("Neg")
+    return text
+
+def checkInteger(text, pins):
+    if int(text) < 0:
+        raise ValueError("Neg")
+    return text
+
+def checkLetter(text, pins):
+    if not (text.isalpha() and len(text) == 1):
+        raise ValueError("NaL")
+    return text
+
+def checkPin(text, pins):
+    if int(text) not in pins:
+        raise ValueError("NaP")
+    return text
+
+def checkBinary(text, pins):
+    if text != "0" and text != "1":
+        raise ValueError("NaB")
+    return text == "1"
+
+def checkPins(text, pins):
+    for pin in text.split(","):
+        checkPin(pin.strip(), pins)
+    return text
+
+def checkMicrosteps(text, pins):
+    lengths = set()
+    for mode in text.split(","):
+        pulses_revolution, _, levels = mode.strip().partition(":")
+        if (not pulses_revolution.isdigit() or int(pulses_revolution) == 0
+        or levels.strip("01") != "" or levels == ""):
+            raise ValueError("NaM")
+        lengths.add(len(levels))
+    if len(lengths) != 1:
+        raise ValueError("NaM")
+    return text
+
+setting_types = {
+    "NaN" : checkNumber,
+    "NaI" : checkInteger,
+    "NaL" : checkLetter,
+    "NaP" : checkPin,
+    "NaB" : checkBinary,
+    "NPL" : checkPins,
+    "NaM" : checkMicrosteps
+}
+
+# Splits the text of a settings file, in a single pass, into
+# {section: {key: (value, comment)}}; lines outside a section or without an =
+# are ignored
+def tokenizeSettings(text):
+    sections = {}
+    section = None
+
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            section = sections.setdefault(line[1:-1], {})
+        elif section is not None and "=" in line:
+            setting, _, comment = line.partition("//")
+            key, _, value = setting.partition("=")
+            section[key.strip()] = (value.strip(), comment.strip())
+
+    return sections
+
+# Line of a settings file for the setting key
+def formatSetting(key, value, comment):
+    comment = " // {0}".format(comment) if comment != "" else ""
+    return "{0} = {1}{2}".format(key, value, comment)
+
+# A settings file on disk, read into and written from a settings dictionary
+# laid out as by settingsSchema(). The value and comment of every setting as
+# last read or written are remembered, so writing settings that have not
+# changed does nothing, and otherwise only the changed lines are reformatted
+# before the file is atomically replaced
+class SettingsFile:
+    def __init__(self, filepath, pins=None):
+        self.filepath = filepath
+        self.pins = pins if pins is not None else header_40 # Physical pins
+                                                            # accepted for NaP
+        self.saved = {} # (section, key): (value, comment) as on disk
+        self.lines = [] # Lines of the file as on disk
+        self.line_index = {} # (section, key): index in lines
+        self.newline = "\n" # Line ending of the file as on disk, which is kept
+                            # when it is written
+
+    # Returns a copy of settings with the values and comments from the file.
+    # Raises OSError if it cannot be read and ValueError if a value is invalid
+    def read(self, settings):
+        cfg = open(self.filepath, "r", newline="")
+        text = cfg.read()
+        cfg.close()
+        self.newline = "\r\n" if "\r\n" in text else "\n"
+        sections = tokenizeSettings(text)
+
+        settings = {section : {key : list(settings[section][key])
+            for key in settings[section]} for section in settings}
+        self.saved = {}
+
+        for section in sections:
+            if section not in settings:
+                continue
+            schema = settings[section]
+            for key, (value, comment) in sections[section].items():
+                if key not in schema:
+                    continue
+                schema[key][4] = comment
+                if value != "":
+                    try:
+                        schema[key][2] = setting_types[schema[key][3]](value,
+                            self.pins)
+                    except ValueError:
+                        raise ValueError("{0}: Invalid Data {1}".format(
+                            schema[key][3], value))
+                self.saved[(section, key)] = (value, comment)
+
+        self.layout(settings)
+        return settings
+
+    # Lays out lines and line_index for settings, keeping the lines of settings
+    # already saved
+    def layout(self, settings):
+        self.lines = []
+        self.line_index = {}
+
+        for section in settings:
+            self.lines.append("[{0}]".format(section))
+            for key in settings[section]:
+                self.line_index[(section, key)] = len(self.lines)
+                if (section, key) in self.saved:
+                    self.lines.append(formatSetting(key,
+                        *self.saved[(section, key)]))
+                else:
+                    self.lines.append(None) # Filled in by write()
+            self.lines.append("")
+        # No blank line after the last section
+        self.lines.pop()
+
+    # Writes settings to the file if any have changed since the file was last
+    # read or written; returns True if the file was written
+    def write(self, settings):
+        changed = False
+
+        if len(self.line_index) != sum(len(settings[section])
+            for section in settings):
+            self.layout(settings)
+
+        for section in settings:
+            for key in settings[section]:
+                value = settings[section][key][2]
+                if value is True or value is False:
+                    value = "1" if value else "0"
+                # Comments are kept on one line, without surrounding whitespace
+                comment = re.sub("[\r\n]", "",
+                    settings[section][key][4]).strip()
+                if self.saved.get((section, key)) != (value, comment):
+                    self.saved[(section, key)] = (value, comment)
+                    self.lines[self.line_index[(section, key)]] = formatSetting(
+                        key, value, comment)
+                    changed = True
+
+        if changed:
+            atomicWrite(self.filepath, self.newline.join(self.lines))
+        return changed
+
+# Returns the edge interval (ns) at which a motor with pulses_revolution
+# pulses per revolution turns at rpm, or 0 if it does not turn
+def rpmInterval(rpm, pulses_revolution):
+    if rpm > 0.0 and pulses_revolution > 0.0:
+        return int(30e9 / (pulses_revolution * rpm))
+    return 0
+
+# Edge intervals (ns) for a motor's RPMs, in steps of quantum RPM up to
+# max_rpm, so that changing speed is a lookup; RPMs are held to the nearest
+# quantum, and those above max_rpm are calculated
+class IntervalTable:
+    quantum = 0.01
+    max_rpm = 600.0
+
+    def __init__(self, pulses_revolution):
+        self.pulses_revolution = pulses_revolution
+        count = int(round(self.max_rpm / self.quantum))
+        scale = 30e9 / (pulses_revolution * self.quantum) if (
+            pulses_revolution > 0.0) else 0.0
+        self.intervals = array("q", [0] + [int(scale / k)
+            for k in range(1, count + 1)])
+
+    def quantise(self, rpm):
+        return round(rpm / self.quantum) * self.quantum
+
+    def interval(self, rpm):
+        k = int(round(rpm / self.quantum))
+        if k <= 0:
+            return 0
+        if k < len(self.intervals):
+            return self.intervals[k]
+        return rpmInterval(k * self.quantum, self.pulses_revolution)
+
+# Sets motor index running at interval ns per edge, ramping to it with
+# profile (a MotionProfile); an interval of 0 ramps the motor to a stop. If the
+# motor's microstep pins are being switched, set_mask and clear_mask are their
+# new levels and scale the ratio of the old pulses per revolution to the new;
+# the motor loop makes the switch on the edge the ramp starts from
+def setSpeed(index, interval, profile, scale=1.0, set_mask=0, clear_mask=0):
+    global delay
+    global rpm_0
+    global ramps
+
+    # The motor loop takes the speed from the ramp, which ends at interval, so
+    # delay and rpm_0 are only for the rest of the program
+    ramps[index] = Ramp(profile, interval, scale, set_mask, clear_mask)
+    if interval:
+        delay[index] = interval / 1e9
+        rpm_0[index] = False
+    else:
+        rpm_0[index] = True
+
+# Switches motor index's microstep pins to the levels in set_mask and
+# clear_mask; the motor loop writes them with the DIR pins, ahead of the
+# motor's next edge
+def switchMicrosteps(index, set_mask, clear_mask):
+    global microstep_set
+    global microstep_clear
+    global microstep_pending
+
+    microstep_set[index] = set_mask
+    microstep_clear[index] = clear_mask
+    microstep_pending[index] = 1 # Set last, so the masks are already written
+
+# Keeps the edges the motors need, at two per pulse, within what the motor loop
+# can output, as measured by capacityTest() and kept as max_edge_rate in the
+# settings. A motor whose controller's microstep pins are wired to the Pi is
+# switched to the finest resolution that fits, the motor needing the most
+# edges being made coarser first, so that a motor is only stepped coarsely
+# when the others leave it no room; any other motor keeps its pulses per
+# revolution
+class StepPlanner:
+    headroom = 0.9 # Fraction of max_edge_rate planned up to, as a margin for
+                   # load from the rest of the system
+    tables = {} # IntervalTable for each pulses per revolution, built when first
+                # needed and kept for every planner, as they take a while
+
+    def __init__(self, settings, pins):
+        global motor_names
+
+        self.max_edge_rate = float(settings["all"]["max_edge_rate"][2] or 0)
+        self.modes = [] # Each motor's (pulses per revolution, set mask, clear
+                        # mask) for each resolution, coarsest first
+        self.pins = [] # BCM microstep pins of every motor
+        self.settings = [settings[name] for name in motor_names]
+        self.profiles = {} # MotionProfile for (motor, resolution)
+        for setting in self.settings:
+            config = microstepConfig(setting, pins)
+            # The stall check compares the encoder with pulses at one resolution
+            if config is None or encoderConfig(setting, pins) is not None:
+                self.modes.append([(float(setting["pulses_revolution"][2]), 0,
+                    0)])
+            else:
+                self.pins += config[0]
+                self.modes.append(config[1])
+        self.mode = [len(modes) - 1 for modes in self.modes]
+        self.rpm = [0.0] * len(motor_names)
+
+        for i in range(len(self.modes)):
+            if len(self.modes[i]) > 1:
+                switchMicrosteps(i, *self.modes[i][self.mode[i]][1:])
+
+    def edgeRate(self, index, mode, rpm):
+        return self.modes[index][mode][0] * rpm / 30.0
+
+    def pulsesRevolution(self):
+        return [self.modes[i][self.mode[i]][0] for i in range(len(self.modes))]
+
+    def table(self, index):
+        pulses_revolution = self.modes[index][self.mode[index]][0]
+        if pulses_revolution not in self.tables:
+            self.tables[pulses_revolution] = IntervalTable(pulses_revolution)
+        return self.tables[pulses_revolution]
+
+    def profile(self, index):
+        key = (index, self.mode[index])
+        if key not in self.profiles:
+            self.profiles[key] = MotionProfile(self.modes[index][key[1]][0],
+                float(self.settings[index]["acceleration"][2] or 0),
+                float(self.settings[index]["jerk"][2] or 0))
+        return self.profiles[key]
+
+    # Chooses every motor's resolution for the RPMs in rpms, by motor index,
+    # with the others at their last RPMs; returns the motors whose resolution
+    # changed, by index, with the ratio of each one's old pulses per
+    # revolution to its new. Raises ValueError, changing nothing, if even the
+    # coarsest resolutions need more edges than max_edge_rate allows
+    def plan(self, rpms):
+        wanted = list(self.rpm)
+        for index in rpms:
+            wanted[index] = rpms[index]
+        modes = [len(modes) - 1 for modes in self.modes]
+        rates = [self.edgeRate(i, modes[i], wanted[i])
+            for i in range(len(modes))]
+
+        limit = self.max_edge_rate * self.headroom
+        while self.max_edge_rate and sum(rates) > limit:
+            coarser = [i for i in range(len(modes)) if modes[i] and rates[i]]
+            if not coarser:
+                raise ValueError(("The motors need {0:.0f} edges a second; "
+                    "only {1:.0f} can be output").format(sum(rates), limit))
+            i = max(coarser, key=lambda i: rates[i])
+            modes[i] -= 1
+            rates[i] = self.edgeRate(i, modes[i], wanted[i])
+
+        changed = {i : self.modes[i][self.mode[i]][0] / self.modes[i][modes[i]][0]
+            for i in range(len(modes)) if modes[i] != self.mode[i]}
+        self.rpm = wanted
+        self.mode = modes
+        return changed
+
+    # Returns the set and clear masks of motor index's microstep pins at its
+    # current resolution
+    def masks(self, index):
+        return self.modes[index][self.mode[index]][1:]
+
+    # Raises ValueError if a coordinated move at rate steps a second, for the
+    # motor with the most steps, needs more edges than max_edge_rate allows
+    def checkMove(self, deltas, rate):
+        longest = max([abs(int(delta)) for delta in deltas] + [0])
+        if not (self.max_edge_rate and longest and rate > 0):
+            return
+        rate = 2.0 * rate * sum(abs(int(delta)) for delta in deltas) / longest
+        if rate > self.max_edge_rate * self.headroom:
+            raise ValueError(("The move needs {0:.0f} edges a second; only "
+                "{1:.0f} can be output").format(rate, self.max_edge_rate
+                * self.headroom))
+
+# Sets each motor (by index) in rpms to its RPM, as setSpeed() does, once
+# planner (a StepPlanner) has chosen every motor's resolution; a motor whose
+# resolution changes has its speed set again at the new one, with its
+# microstep pins switched on the edge its ramp starts from. Returns the RPM each motor in rpms was set to, held to its
+# interval table's quantum. Raises ValueError, changing nothing, if the motors
+# cannot be sent pulses that fast
+def planSpeeds(planner, rpms):
+    rpms = {index : max(0.0, float(rpms[index])) for index in rpms}
+    changed = planner.plan(rpms)
+    quantised = {}
+    for index in sorted(set(rpms) | set(changed)):
+        table = planner.table(index)
+        rpm = table.quantise(planner.rpm[index])
+        if index in changed:
+            setSpeed(index, table.interval(rpm), planner.profile(index),
+                changed[index], *planner.masks(index))
+        else:
+            setSpeed(index, table.interval(rpm), planner.profile(index))
+        if index in rpms:
+            quantised[index] = rpm
+    return quantised
+
 # Class to interact with the user
 class MainWindow(tk.Tk):
     started = False
 
     letter_pressed = 0 # Number of letters currently being pressed
 
+    keymap = None # Letter: action; see compileKeymap(). None when out of date
+    pending_rpm = {} # Motor index: RPM change waiting for the next frame
+    pending_percentage = 1.0 # Factor for all motors waiting for the next frame
+    flush_id = None # Tk after() ID of the next flushIncrements() call
+    frame_interval = 16 # Milliseconds between batched RPM updates
+
     titles = [ "main", "settings", "error"]
     window_name = "main" # Title of window currently shown
     main_window = True # When the OK button is pressed on the error window,
@@ -52,10 +730,11 @@ class MainWindow(tk.Tk):
         "errors" : None
     } # Allows iteration through widgets
 
-    tp_mtr_run = None
-    md_mtr_run = None
-    bt_mtr_run = None
-    cw_var = None
+    frames = {} # Frame holding each view's widgets
+    layout = {} # Where each view's widgets are gridded; see viewLayout()
+
+    mtr_run = [] # BooleanVar for each motor's RUNNING checkbox
+    cw_var = [] # BooleanVar for each motor's direction radio buttons
     bcm_pins = None
 
     entries = {
@@ -71,7 +750,12 @@ class MainWindow(tk.Tk):
          "NaL" : "THE VALUE ENTERED WAS NOT A LETTER",
          "AlU" : "THE VALUE ENTERED HAS ALREADY BEEN USED",
          "Unc" : "NOT ALL FIELDS HAVE BEEN FILLED IN",
-         "Set" : "ERROR IN SETTINGS FILE\nNO DATA HAS BEEN ENTERED INTO FIELDS"
+         "Set" : "ERROR IN SETTINGS FILE\nNO DATA HAS BEEN ENTERED INTO FIELDS",
+         "Stl" : "A MOTOR HAS STALLED AND HAS BEEN STOPPED",
+         "Prf" : "ERROR IN PROFILE FILE\nPLAYBACK HAS STOPPED",
+         "Cap" : "THE MOTORS CANNOT BE SENT PULSES\nFAST ENOUGH FOR THAT RPM",
+         "Mst" : ("THE MICROSTEPS IN THE SETTINGS FILE\nDO NOT MATCH THE "
+             "MICROSTEP PINS")
     }
 
     pins = [] # Pins to use with motors and emergency stop
@@ -83,88 +767,26 @@ class MainWindow(tk.Tk):
 
     settings_filename = None
 
-    settings = {
-        "top": {
-            "rpm" : ["tp_rpm_ent", "main", "", "NaN", "The motor's actual RPM"],
-            "increment" : ["tp_inc_ent", "main", "", "NaL", ("The letter used to "
-                "increment the RPM of the motor")],
-            "decrement" : ["tp_dec_ent", "main", "", "NaL", ("The letter used to "
-                "decrement the RPM of the motor")],
-            "in_decrement_value" : ["tp_inc_val_ent", "main", "", "NaN", ("The "
-                "value by which the motor's RPM is incremented or decremented")],
-            "direction" : ["nul", "main", True, "NaB", ("A binary value (1 or 0) "
-                "denoting the direction of the motor's rotation")],
-            "pulses_revolution" : ["tp_spr_ent", "settings", "", "NaI", ("The "
-                "number of pulses per revolution set using the dip switches on the "
-                "controller")],
-            "pul_pin" : ["tp_pul_ent", "settings", "", "NaP", ("The physical "
-                "location of the PUL pin (odd on the left-hand side, even on the "
-                "right)")],
-            "dir_pin" : ["tp_dir_ent", "settings", "", "NaP", ("The physical "
-                "location of the DIR pin (odd on the left-hand side, even on the "
-                "right)")]
-        },
-        "middle" : {
-            "rpm" : ["md_rpm_ent", "main", "", "NaN", ""],
-            "increment" : ["md_inc_ent", "main", "", "NaL", ""],
-            "decrement" : ["md_dec_ent", "main", "", "NaL", ""],
-            "in_decrement_value" : ["md_inc_val_ent", "main", "", "NaN", ""],
-            "direction" : ["nul", "main", True, "NaB", ""],
-            "pulses_revolution" : ["md_spr_ent", "settings", "", "NaI", ""],
-            "pul_pin" : ["md_pul_ent", "settings", "", "NaP", ""],
-            "dir_pin" : ["md_dir_ent", "settings", "", "NaP", ""]
-        },
-        "bottom" : {
-            "rpm" : ["bt_rpm_ent", "main", "", "NaN", ""],
-            "increment" : ["bt_inc_ent", "main", "", "NaL", ""],
-            "decrement" : ["bt_dec_ent", "main", "", "NaL", ""],
-            "in_decrement_value" : ["bt_inc_val_ent", "main", "", "NaN", ""],
-            "direction" : ["cw_var", "main", True, "NaB", ""],
-            "wrong_direction" : ["nul", "main", False, "NaB", ("Set this to 1 if "
-            "the motor is turning in the opposite direction to that which was set "
-            "in the GUI; otherwise, leave it at 0")],
-            "pulses_revolution" : ["bt_spr_ent", "settings", "", "NaI", ""],
-            "pul_pin" : ["bt_pul_ent", "settings", "", "NaP", ""],
-            "dir_pin" : ["bt_dir_ent", "settings", "", "NaP", ""]
-        },
-        "all" : {
-            "increment" : ["al_inc_ent", "main", "", "NaL", ""],
-            "decrement" : ["al_dec_ent", "main", "", "NaL", ""],
-            "percentage" : ["al_inc_val_ent", "main", "", "NaN", ("The percentage "
-            "by which to increment or decrement all motors")]
-        },
-        "emergency" : {
-            "stop_pin" : ["emer_stp_ent", "settings", "", "NaP", ("The physical "
-            "location of the emergency stop pin (odd on the left-hand side, even "
-            "on the right)")]
-        }
-    } # Widget name, window in which it will be found, value, error if value
-      # incorrect, comment in settings file. Default comments are provided here,
-      # but they can be changed by editing the settings file
-
-    disable_widgets = [
-        "tp_rpm_ent",
-        "tp_inc_ent",
-        "tp_dec_ent",
-        "md_rpm_ent",
-        "md_inc_ent",
-        "md_dec_ent",
-        "bt_rpm_ent",
-        "bt_inc_ent",
-        "bt_dec_ent",
-        "bt_acw_rdo",
-        "bt_cw_rdo",
-        "al_inc_ent",
-        "al_dec_ent",
-        "sett_btn"
-    ] # Widgets to be disabled when motors have been started
+    settings = {} # Built by settingsSchema(); see there for the format
+
+    settings_file = None # SettingsFile the settings were read from
+
+    disable_widgets = [] # Widgets to be disabled when motors have been started
+
+    rpm = [] # Each motor's RPM whilst running; the RPM entries display these
+    rpm_vars = [] # StringVars of the RPM entries
+    planner = None # StepPlanner choosing the motors' intervals, built on start
+
+    status_strip = None # StatusStrip working out the status labels' text
+    status_interval = 250 # Milliseconds between status strip updates
+
+    player = None # ProfilePlayer started with the motors, if any
+    recorder = None # ProfileRecorder writing every RPM change, if any
 
     # Called when the class is created
     def __init__(self):
         global widgets
-        global tp_mtr_run
-        global md_mtr_run
-        global bt_mtr_run
+        global mtr_run
         global pins
         global letters
         global entries
@@ -174,11 +796,16 @@ class MainWindow(tk.Tk):
         global version
         global settings_filepath
         global settings_filename
+        global motor_names
 
         super().__init__()
 
+        self.settings = settingsSchema(motor_names)
+        self.rpm = [0.0] * len(motor_names)
+
         # Get GPIO pins
-        self.bcm_pins = str(subprocess.run("pinout", stdout=subprocess.PIPE))
+        self.bcm_pins = boardPins()
+        startupPhase("board pins")
 
         self.settings_filename = tk.StringVar()
         self.settings_filename.set("stepperSettings.cfg")
@@ -199,221 +826,226 @@ class MainWindow(tk.Tk):
         self.bind_all("<Control-X>", lambda event: self.onClosing())
         self.bind_all("<Return>", lambda event: self.specialPress("return", ""))
 
-        self.tp_mtr_run = tk.BooleanVar(self.master, False)
-        self.md_mtr_run = tk.BooleanVar(self.master, False)
-        self.bt_mtr_run = tk.BooleanVar(self.master, False)
-        self.cw_var = tk.BooleanVar(self.master, True)
+        self.mtr_run = [tk.BooleanVar(self.master, False) for motor in motor_names]
+        self.cw_var = [tk.BooleanVar(self.master, True) for motor in motor_names]
 
         vnan = (self.register(self.validateNan), "%P")
-        vnai = (self.register(self.validateNai), "%P")
         vnal = (self.register(self.validateAlu), "%P", False)
-        vpin = (self.register(self.validateAlu), "%P", True)
 
         self.getVersion()
 
+        # Each view is built once, in a frame of its own; see createWindow()
+        # and buildView()
+        self.widgets = {name : None for name in self.widgets}
+        self.entries = {name : [] for name in self.entries}
+        self.pins = []
+        self.letters = []
+        self.disable_widgets = []
+        self.layout = viewLayout(motor_names)
+        self.frames = {name : tk.Frame(self.master) for name in self.widgets}
+        main_frame = self.frames["main"]
+
         # Define all widgets
         self.widgets["main"] = {
-            "vers_lbl" : tk.Label(self.master, text="v{0}".format(version)),
-            "sett_btn" : tk.Button(self.master, text="SETTINGS (ALT + S)",
+            "vers_lbl" : tk.Label(main_frame, text="v{0}".format(version)),
+            "sett_btn" : tk.Button(main_frame, text="SETTINGS (ALT + S)",
                 command=(self.register(self.createWindow), "settings")),
 
-            "file_lbl" : tk.Label(self.master, textvariable=self.settings_filename),
+            "file_lbl" : tk.Label(main_frame, textvariable=self.settings_filename),
 
-            "file_btn" : tk.Button(self.master, text="CHANGE SETTINGS FILE",
-                command=self.selectSettingsFile),
-
-            "tp_mtr_lbl" : tk.Label(self.master, text="TOP MOTOR:"),
-            "tp_rpm_lbl" : tk.Label(self.master, text="RPM"),
-            "tp_inc_lbl" : tk.Label(self.master, text="INCREMENT\nRPM LETTER"),
-            "tp_inc_val_lbl" : tk.Label(self.master, text="IN/DECREMENT\nVALUE"),
-            "tp_dec_lbl" : tk.Label(self.master, text="DECREMENT\nRPM LETTER"),
-            "tp_run_lbl" : tk.Label(self.master, text="RUNNING"),
-            "tp_run_chk" : tk.Checkbutton(self.master, variable=self.tp_mtr_run,
-                onvalue=True, offvalue=False, command=self.checkPressed),
-            "tp_rpm_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main", "tp_rpm_ent")),
-            "tp_inc_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal,
-                invalidcommand=(self.register(self.invalid), "main", "tp_inc_ent")),
-            "tp_inc_val_ent" : tk.Entry(self.master, width=3,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main",
-                "tp_inc_val_ent")),
-            "tp_dec_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal, 
-                invalidcommand=(self.register(self.invalid), "main", "tp_dec_ent")),
-
-            "md_mtr_lbl" : tk.Label(self.master, text="MIDDLE MOTOR:"),
-            "md_rpm_lbl" : tk.Label(self.master, text="RPM"),
-            "md_inc_lbl" : tk.Label(self.master, text="INCREMENT\nRPM LETTER"),
-            "md_inc_val_lbl" : tk.Label(self.master, text="IN/DECREMENT\nVALUE"),
-            "md_dec_lbl" : tk.Label(self.master, text="DECREMENT\nRPM LETTER"),
-            "md_run_lbl" : tk.Label(self.master, text="RUNNING"),
-            "md_run_chk" : tk.Checkbutton(self.master, variable=self.md_mtr_run,
-                onvalue=True, offvalue=False, command=self.checkPressed),
-            "md_rpm_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main", "md_rpm_ent")),
-            "md_inc_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal,
-                invalidcommand=(self.register(self.invalid), "main", "md_inc_ent")),
-            "md_inc_val_ent" : tk.Entry(self.master, width=3,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main",
-                "md_inc_val_ent")),
-            "md_dec_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal,
-                invalidcommand=(self.register(self.invalid), "main", "md_dec_ent")),
-
-            "bt_mtr_lbl" : tk.Label(self.master, text="BOTTOM MOTOR:"),
-            "bt_rpm_lbl" : tk.Label(self.master, text="RPM"),
-            "bt_inc_lbl" : tk.Label(self.master, text="INCREMENT\nRPM LETTER"),
-            "bt_inc_val_lbl" : tk.Label(self.master, text="IN/DECREMENT\nVALUE"),
-            "bt_dec_lbl" : tk.Label(self.master, text="DECREMENT\nRPM LETTER"),
-            "bt_run_lbl" : tk.Label(self.master, text="RUNNING"),
-            "bt_run_chk" : tk.Checkbutton(self.master, variable=self.bt_mtr_run,
-                onvalue=True, offvalue=False, command=self.checkPressed),
-            "bt_rpm_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main", "bt_rpm_ent")),
-            "bt_inc_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal,
-                invalidcommand=(self.register(self.invalid), "main", "bt_inc_ent")),
-            "bt_inc_val_ent" : tk.Entry(self.master, width=3,
-                validate="focusout", validatecommand=vnan,
-                invalidcommand=(self.register(self.invalid), "main",
-                "bt_inc_val_ent")),
-            "bt_dec_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vnal,
-                invalidcommand=(self.register(self.invalid), "main", "bt_dec_ent")),
-
-            "bt_acw_lbl" : tk.Label(self.master, text="COUNTER-\nCLOCKWISE"),
-            "bt_cw_lbl" : tk.Label(self.master, text="CLOCKWISE"),
-            "bt_acw_rdo" : tk.Radiobutton(self.master, variable=self.cw_var,
-                value=False),
-            "bt_cw_rdo" : tk.Radiobutton(self.master, variable=self.cw_var,
-                value=True),
+            "file_btn" : tk.Button(main_frame, text="CHANGE SETTINGS FILE",
+                command=self.selectSettingsFile)
+        }
 
-            "al_mtr_lbl" : tk.Label(self.master, text="ALL MOTORS:"),
-            "al_inc_lbl" : tk.Label(self.master, text=("INCREMENT\nPERCENTAGE\n"
+        for i in range(len(motor_names)):
+            pre = motorPrefix(motor_names[i])
+            self.widgets["main"].update({
+                pre + "_mtr_lbl" : tk.Label(main_frame,
+                    text=motorLabel(motor_names[i])),
+                pre + "_rpm_lbl" : tk.Label(main_frame, text="RPM"),
+                pre + "_inc_lbl" : tk.Label(main_frame,
+                    text="INCREMENT\nRPM LETTER"),
+                pre + "_inc_val_lbl" : tk.Label(main_frame,
+                    text="IN/DECREMENT\nVALUE"),
+                pre + "_dec_lbl" : tk.Label(main_frame,
+                    text="DECREMENT\nRPM LETTER"),
+                pre + "_run_lbl" : tk.Label(main_frame, text="RUNNING"),
+                pre + "_run_chk" : tk.Checkbutton(main_frame,
+                    variable=self.mtr_run[i], onvalue=True, offvalue=False,
+                    command=self.checkPressed),
+                pre + "_acw_lbl" : tk.Label(main_frame,
+                    text="COUNTER-\nCLOCKWISE"),
+                pre + "_cw_lbl" : tk.Label(main_frame, text="CLOCKWISE"),
+                pre + "_acw_rdo" : tk.Radiobutton(main_frame,
+                    variable=self.cw_var[i], value=False),
+                pre + "_cw_rdo" : tk.Radiobutton(main_frame,
+                    variable=self.cw_var[i], value=True),
+                # Fixed width, so that updates never resize the window
+                pre + "_sts_lbl" : tk.Label(main_frame, text="", width=42,
+                    anchor="w"),
+                pre + "_rpm_ent" : tk.Entry(main_frame, width=5,
+                    validate="focusout", validatecommand=vnan,
+                    invalidcommand=(self.register(self.invalid), "main",
+                    pre + "_rpm_ent")),
+                pre + "_inc_ent" : tk.Entry(main_frame, width=2,
+                    validate="focusout", validatecommand=vnal,
+                    invalidcommand=(self.register(self.invalid), "main",
+                    pre + "_inc_ent")),
+                pre + "_inc_val_ent" : tk.Entry(main_frame, width=3,
+                    validate="focusout", validatecommand=vnan,
+                    invalidcommand=(self.register(self.invalid), "main",
+                    pre + "_inc_val_ent")),
+                pre + "_dec_ent" : tk.Entry(main_frame, width=2,
+                    validate="focusout", validatecommand=vnal,
+                    invalidcommand=(self.register(self.invalid), "main",
+                    pre + "_dec_ent"))
+            })
+            self.disable_widgets += [pre + "_rpm_ent", pre + "_inc_ent",
+                pre + "_dec_ent", pre + "_acw_rdo", pre + "_cw_rdo"]
+
+        self.widgets["main"].update({
+            "al_mtr_lbl" : tk.Label(main_frame, text="ALL MOTORS:"),
+            "al_inc_lbl" : tk.Label(main_frame, text=("INCREMENT\nPERCENTAGE\n"
                 "LETTER")),
-            "al_dec_lbl" : tk.Label(self.master, text=("DECREMENT\nPERCENTAGE\n"
+            "al_dec_lbl" : tk.Label(main_frame, text=("DECREMENT\nPERCENTAGE\n"
                 "LETTER")),
-            "al_inc_val_lbl" : tk.Label(self.master, text=("IN/DECREMENT\nPERCENT"
+            "al_inc_val_lbl" : tk.Label(main_frame, text=("IN/DECREMENT\nPERCENT"
                 "AGE\nVALUE")),
-            "al_inc_ent" : tk.Entry(self.master, width=2,
+            "al_inc_ent" : tk.Entry(main_frame, width=2,
                 validate="focusout", validatecommand=vnal,
                 invalidcommand=(self.register(self.invalid), "main", "al_inc_ent")),
-            "al_dec_ent" : tk.Entry(self.master, width=2,
+            "al_dec_ent" : tk.Entry(main_frame, width=2,
                 validate="focusout", validatecommand=vnal,
                 invalidcommand=(self.register(self.invalid), "main", "al_dec_ent")),
-            "al_inc_val_ent" : tk.Entry(self.master, width=3,
+            "al_inc_val_ent" : tk.Entry(main_frame, width=3,
                 validate="focusout", validatecommand=vnan,
                 invalidcommand=(self.register(self.invalid), "main",
                 "al_inc_val_ent")),
 
-            "strt_btn" : tk.Button(self.master, text="START ALL (SHIFT + S)",
+            "strt_btn" : tk.Button(main_frame, text="START ALL (SHIFT + S)",
                 command=self.startPressed)
-        }
-
-        self.widgets["settings"] = {
-            "tp_mtr_lbl" : tk.Label(self.master, text="TOP MOTOR:"),
-            "tp_spr_lbl" : tk.Label(self.master, text=("MICROSTEPS (PULSES)\n "
-                "PER REVOLUTION")),
-            "tp_pul_lbl" : tk.Label(self.master, text="PUL PHYSICAL\nPIN"),
-            "tp_dir_lbl" : tk.Label(self.master, text="DIR PHYSICAL\nPIN"),
-            "tp_spr_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnai,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "tp_spr_ent")),
-            "tp_pul_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "tp_pul_ent")),
-            "tp_dir_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "tp_dir_ent")),
-
-            "md_mtr_lbl" : tk.Label(self.master, text="MIDDLE MOTOR:"),
-            "md_spr_lbl" : tk.Label(self.master, text=("MICROSTEPS (PULSES)\n "
-                "PER REVOLUTION")),
-            "md_pul_lbl" : tk.Label(self.master, text="PUL PHYSICAL\nPIN"),
-            "md_dir_lbl" : tk.Label(self.master, text="DIR PHYSICAL\nPIN"),
-            "md_spr_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnai,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "md_spr_ent")),
-            "md_pul_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "md_pul_ent")),
-            "md_dir_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "md_dir_ent")),
-
-            "bt_mtr_lbl" : tk.Label(self.master, text="BOTTOM MOTOR:"),
-            "bt_spr_lbl" : tk.Label(self.master, text=("MICROSTEPS (PULSES)\n "
-                "PER REVOLUTION")),
-            "bt_pul_lbl" : tk.Label(self.master, text="PUL PHYSICAL\nPIN"),
-            "bt_dir_lbl" : tk.Label(self.master, text="DIR PHYSICAL\nPIN"),
-            "bt_spr_ent" : tk.Entry(self.master, width=5,
-                validate="focusout", validatecommand=vnai,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "bt_spr_ent")),
-            "bt_pul_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "bt_pul_ent")),
-            "bt_dir_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "bt_dir_ent")),
-
-            "emer_stp_lbl" : tk.Label(self.master, text=("EMERGENCY STOP\n"
-                "PHYSICAL PIN")),
-            "emer_stp_ent" : tk.Entry(self.master, width=2,
-                validate="focusout", validatecommand=vpin,
-                invalidcommand=(self.register(self.invalid), "settings",
-                "emer_stp_ent")),
-
-            "sv_btn" : tk.Button(self.master, text="SAVE SETTINGS (CTRL + S)",
-                command=self.savePressed),
-            "cncl_btn" : tk.Button(self.master, text="CANCEL (CTRL + C)",
-                command=self.cancelPressed)
-        }
-
-        self.widgets["errors"] = {
-            "err_lbl" : tk.Label(self.master, text=("THE VALUE ENTERED WAS NOT "
-                "A NUMBER")),
-            "ok_btn" : tk.Button(self.master, text="OK (ENTER)",
-                command=(self.register(self.createWindow), "unknown"))
-        }
+        })
+        self.disable_widgets += ["al_inc_ent", "al_dec_ent", "sett_btn"]
+
+        # The keymap is recompiled whenever an in/decrement value changes
+        for motor in motor_names + ["all"]:
+            inc_val = tk.StringVar(self.master)
+            inc_val.trace_add("write", self.keymapChanged)
+            self.widgets["main"]["{0}_inc_val_ent".format(
+                motorPrefix(motor))].configure(textvariable=inc_val)
+
+        # Whilst running, the RPM entries are only ever set through these
+        self.rpm_vars = []
+        for motor in motor_names:
+            rpm_var = tk.StringVar(self.master)
+            self.widgets["main"]["{0}_rpm_ent".format(
+                motorPrefix(motor))].configure(textvariable=rpm_var)
+            self.rpm_vars.append(rpm_var)
 
         for key in self.widgets["main"]:
             if "_inc_ent" in key or "_dec_ent" in key:
                 self.letters.append(key)
             if "_ent" in key:
                 self.entries["main"].append(key)
-        
-        for key in self.widgets["settings"]:
-            if (("_pul_" in key or "_dir_" in key or "emer_" in key) 
+
+        # The settings view is only built when it is first shown, so its
+        # entries are found from the layout
+        for key, options in self.layout["settings"]:
+            if (("_pul_" in key or "_dir_" in key or "emer_" in key)
             and "_lbl" not in key and "_chk" not in key):
                 self.pins.append(key)
             if "_ent" in key:
                 self.entries["settings"].append(key)
 
+        for key, options in self.layout["main"]:
+            self.widgets["main"][key].grid(**options)
+        startupPhase("main view")
+
         self.resizable(False, False)
 
         if self.readFile():
             self.createWindow(name="main")
+        startupPhase("settings file")
 
         # When the X in top right corner is pressed, the following procedure
         # will be called
         self.protocol("WM_DELETE_WINDOW", self.onClosing)
 
+        self.status_strip = StatusStrip(len(motor_names))
+        self.after(self.status_interval, self.updateStatus)
+
+    # Builds the widgets of the settings or error view in its frame, the
+    # first time the view is needed, and grids them from the layout; the main
+    # view is built with the window
+    def buildView(self, name):
+        global motor_names
+
+        if self.widgets[name] is not None:
+            return
+        settings_frame = self.frames["settings"]
+        errors_frame = self.frames["errors"]
+        vnai = (self.register(self.validateNai), "%P")
+        vpin = (self.register(self.validateAlu), "%P", True)
+
+        if name == "settings":
+            self.widgets["settings"] = {}
+
+            for motor in motor_names:
+                pre = motorPrefix(motor)
+                self.widgets["settings"].update({
+                    pre + "_mtr_lbl" : tk.Label(settings_frame,
+                        text=motorLabel(motor)),
+                    pre + "_spr_lbl" : tk.Label(settings_frame, text=(
+                        "MICROSTEPS (PULSES)\n PER REVOLUTION")),
+                    pre + "_pul_lbl" : tk.Label(settings_frame,
+                        text="PUL PHYSICAL\nPIN"),
+                    pre + "_dir_lbl" : tk.Label(settings_frame,
+                        text="DIR PHYSICAL\nPIN"),
+                    pre + "_spr_ent" : tk.Entry(settings_frame, width=5,
+                        validate="focusout", validatecommand=vnai,
+                        invalidcommand=(self.register(self.invalid),
+                        "settings", pre + "_spr_ent")),
+                    pre + "_pul_ent" : tk.Entry(settings_frame, width=2,
+                        validate="focusout", validatecommand=vpin,
+                        invalidcommand=(self.register(self.invalid),
+                        "settings", pre + "_pul_ent")),
+                    pre + "_dir_ent" : tk.Entry(settings_frame, width=2,
+                        validate="focusout", validatecommand=vpin,
+                        invalidcommand=(self.register(self.invalid),
+                        "settings", pre + "_dir_ent"))
+                })
+
+            self.widgets["settings"].update({
+                "emer_stp_lbl" : tk.Label(settings_frame, text=(
+                    "EMERGENCY STOP\nPHYSICAL PIN")),
+                "emer_stp_ent" : tk.Entry(settings_frame, width=2,
+                    validate="focusout", validatecommand=vpin,
+                    invalidcommand=(self.register(self.invalid), "settings",
+                    "emer_stp_ent")),
+
+                "sv_btn" : tk.Button(settings_frame,
+                    text="SAVE SETTINGS (CTRL + S)", command=self.savePressed),
+                "cncl_btn" : tk.Button(settings_frame, text="CANCEL (CTRL + C)",
+                    command=self.cancelPressed)
+            })
+
+            # Filled in with the settings read when the window was created
+            for section in self.settings:
+                for key in self.settings[section]:
+                    widget, window, value = self.settings[section][key][:3]
+                    if window == "settings" and widget != "nul":
+                        self.widgets["settings"][widget].insert(0, value)
+        elif name == "errors":
+            self.widgets["errors"] = {
+                "err_lbl" : tk.Label(errors_frame, text=("THE VALUE ENTERED "
+                    "WAS NOT A NUMBER")),
+                "ok_btn" : tk.Button(errors_frame, text="OK (ENTER)",
+                    command=(self.register(self.createWindow), "unknown"))
+            }
+
+        for key, options in self.layout[name]:
+            self.widgets[name][key].grid(**options)
+
     # Defined keypress with modifier
     def specialPress(self, modifier, letter):
         global window_name
@@ -462,8 +1094,7 @@ class MainWindow(tk.Tk):
         global window_name
         global letter_pressed
         global started
-        global operating
-        global widgets
+        global keymap
 
         if self.started:
             # Ensures modifier key has not been pressed
@@ -473,17 +1104,6 @@ class MainWindow(tk.Tk):
                 return
 
             if self.letter_pressed == 1:
-                increment_letters = [
-                    self.settings["top"]["increment"][2].lower(),
-                    self.settings["top"]["decrement"][2].lower(),
-                    self.settings["middle"]["increment"][2].lower(),
-                    self.settings["middle"]["decrement"][2].lower(),
-                    self.settings["bottom"]["increment"][2].lower(),
-                    self.settings["bottom"]["decrement"][2].lower(),
-                    self.settings["all"]["increment"][2].lower(),
-                    self.settings["all"]["decrement"][2].lower()
-                ]
-
                 if not str(e.char).isdigit():
                     focussed_widget = self.focus_get()
                     if isinstance(focussed_widget, tk.Entry):
@@ -491,30 +1111,85 @@ class MainWindow(tk.Tk):
                         focussed_widget.delete(0, tk.END)
                         focussed_widget.insert(0, txt)
 
-                settings_keys = list(self.settings.keys())
-                for i in range(4):
-                    motor = settings_keys[i]
-                    widget_name = "{0}{1}_inc_val_ent".format(motor[0:1],
-                        motor[2:3])
-                    key_name = "in_decrement_value" if i < 3 else "percentage"
-                    if self.widgets["main"][widget_name].get() == "":
-                        self.widgets["main"][widget_name].delete(0, tk.END)
-                        self.widgets["main"][widget_name].insert(0,
-                            self.settings[motor][key_name][2])
-                # Calls increment procedure if letter pressed corresponds to a set
+                if self.keymap is None:
+                    self.compileKeymap()
+
+                # Queues the increment if letter pressed corresponds to a set
                 # increment/decrement letter
-                if e.char.lower() in increment_letters:
-                    index = increment_letters.index(e.char.lower())
-                    motor = ("top" if index < 2 else "middle" if index < 4 
-                        else "bottom" if index < 6 else "all")
-                    widget_name = "{0}{1}_inc_val_ent".format(motor[0:1],
-                        motor[2:3])
-                    key_name = "in_decrement_value" if index < 6 else "percentage"
-                    inc_dec = self.widgets["main"][widget_name].get()
-                    self.settings[motor][key_name][2] = inc_dec
-                    if index >= 6 or operating[int((index - (index % 2)) / 2)]:
-                        self.setIncrement(motor, 
-                            (1 if index % 2 == 0 else -1) * float(inc_dec))
+                action = self.keymap.get(e.char.lower())
+                if action is not None:
+                    self.queueIncrement(action)
+
+    # Builds the dispatch table from each increment/decrement letter to its
+    # action: (motor indices, delta, mode), where mode is "rpm" for a single
+    # motor's RPM step or "percentage" for the all motors step
+    def compileKeymap(self):
+        global motor_names
+
+        keymap = {}
+
+        for motor in motor_names + ["all"]:
+            widget = self.widgets["main"]["{0}_inc_val_ent".format(
+                motorPrefix(motor))]
+            key_name = "percentage" if motor == "all" else "in_decrement_value"
+            if widget.get() == "":
+                widget.insert(0, self.settings[motor][key_name][2])
+            inc_dec = widget.get()
+            self.settings[motor][key_name][2] = inc_dec
+
+            try:
+                delta = float(inc_dec)
+            except ValueError:
+                delta = 0.0
+
+            if motor == "all":
+                action = (tuple(range(len(motor_names))), delta, "percentage")
+            else:
+                action = ((motor_names.index(motor),), delta, "rpm")
+            keymap[self.settings[motor]["increment"][2].lower()] = action
+            keymap[self.settings[motor]["decrement"][2].lower()] = (action[0],
+                -delta, action[2])
+
+        self.keymap = keymap
+
+    # Called whenever an in/decrement value is edited
+    def keymapChanged(self, *args):
+        global keymap
+
+        self.keymap = None
+
+    # Adds a key's action to those waiting to be applied, so that however
+    # quickly a held key repeats, the RPMs are updated once per frame
+    def queueIncrement(self, action):
+        global operating
+
+        indices, delta, mode = action
+        if mode == "rpm":
+            if operating[indices[0]]:
+                self.pending_rpm[indices[0]] = (self.pending_rpm.get(indices[0],
+                    0.0) + delta)
+        else:
+            self.pending_percentage *= 1.0 + delta / 100.0
+
+        if self.flush_id is None:
+            self.flush_id = self.after(self.frame_interval, self.flushIncrements)
+
+    def flushIncrements(self):
+        global motor_names
+
+        self.flush_id = None
+        pending_rpm = self.pending_rpm
+        pending_percentage = self.pending_percentage
+        self.pending_rpm = {}
+        self.pending_percentage = 1.0
+
+        if not self.started:
+            return
+
+        for index in pending_rpm:
+            self.setIncrement(index, pending_rpm[index])
+        if pending_percentage != 1.0:
+            self.setIncrement("all", (pending_percentage - 1.0) * 100.0)
 
     # Called for all times key is released
     def keyrelease(self, e):
@@ -533,19 +1208,54 @@ class MainWindow(tk.Tk):
             self.startPressed()
 
         gpio_handler.stopThreads()
+        if self.recorder is not None:
+            self.recorder.close()
         self.writeFile()
         self.destroy()
 
     # Called whenever the state of a checkbox is changed
     def checkPressed(self):
-        global tp_mtr_run
-        global md_mtr_run
-        global bt_mtr_run
+        global mtr_run
         global operating
+        global started
+        global motor_names
+
+        was_operating = operating[:]
+        for i in range(len(operating)):
+            operating[i] = self.mtr_run[i].get()
 
-        operating[0] = self.tp_mtr_run.get()
-        operating[1] = self.md_mtr_run.get()
-        operating[2] = self.bt_mtr_run.get()
+        # Motors switched on whilst running ramp up from stationary
+        if self.started:
+            for i in range(len(operating)):
+                if operating[i] and not was_operating[i]:
+                    self.setIncrement(i, 0.0)
+
+    # Shows what the motors are actually doing in the status strip whilst they
+    # are running and the main view is shown, changing only the labels whose
+    # text has changed
+    def updateStatus(self):
+        global motor_names
+
+        if self.started and self.window_name == "main":
+            for i, text in self.status_strip.update(
+                self.planner.pulsesRevolution()):
+                self.widgets["main"][motorPrefix(motor_names[i])
+                    + "_sts_lbl"].configure(text=text)
+        self.after(self.status_interval, self.updateStatus)
+
+    # Unticks the motors the GPIO handler has stopped as stalled, and tells the
+    # user; ticking one again restarts it
+    def showStalls(self):
+        global stalled
+
+        shown = False
+        for i in range(len(stalled)):
+            if stalled[i] == 1:
+                stalled[i] = 2
+                self.mtr_run[i].set(False)
+                shown = True
+        if shown:
+            self.createWindow(name="errors", error="Stl")
 
     # Restores values set in settings to widgets in settings window when
     # cancel button pressed
@@ -565,54 +1275,66 @@ class MainWindow(tk.Tk):
         self.createWindow("main")
 
     # Called when the user presses the key to either increment or decrement
-    # a motor's RPM
-    def setIncrement(self, motor_name, value):
-        global settings
-        global delay
-        global widgets
+    # a motor's (by index) or all motors' RPM; returns False if the new RPMs
+    # were refused
+    def setIncrement(self, motor, value):
         global operating
-        global rpm_0
-
-        motors = (["top", "middle", "bottom"] if motor_name == "all"
-            else [motor_name])
 
-        if motor_name == "all":
+        if motor == "all":
             for op in operating:
                 if not op:
-                    return
-        
-        for motor in motors:
-            index = list(self.settings.keys()).index(motor)
-            widget_name = "{0}{1}_rpm_ent".format(motor[0:1], motor[2:3])
-            rpm = float(self.widgets["main"][widget_name].get())
-            rpm += value if motor_name != "all" else float(rpm * value) / 100.0
-            rpm = 0.0 if rpm < 0.0 else rpm
-
-            # Removes last characters (.0) if rpm is integer; this looks nicer on
-            # the GUI
-            rpm_str = str(rpm)[:-2] if str(rpm)[-2:] == ".0" else str(rpm)
-
-            self.widgets["main"][widget_name].configure(state="normal")
-            self.widgets["main"][widget_name].delete(0, tk.END)
-            self.widgets["main"][widget_name].insert(0, rpm_str)
-            self.widgets["main"][widget_name].configure(state="disabled")
-
-            if rpm <= 0.0:
-                rpm_0[index] = True
-                continue
-            else:
-                rpm_0[index] = False
+                    return True
+            indices = range(len(self.rpm))
+        else:
+            indices = (motor,)
 
-            _delay = ((30.0 / (float(self.settings[motor]["pulses_revolution"][2])
-                * rpm)))
+        rpms = {}
+        for index in indices:
+            rpm = self.rpm[index]
+            rpms[index] = rpm + (value if motor != "all"
+                else rpm * value / 100.0)
+        return self.setRpms(rpms)
 
-            if _delay <= 0.0:
-                rpm_0[index] = True
-                continue
-            else:
-                rpm_0[index] = False
+    # Sets the RPM of each motor (by index) in rpms together; if the motors
+    # cannot be sent pulses that fast, tells the user and returns False,
+    # leaving every RPM as it was
+    def setRpms(self, rpms):
+        global motor_names
 
-            delay[index] = _delay
+        try:
+            rpms = planSpeeds(self.planner, rpms)
+        except ValueError:
+            self.createWindow(name="errors", error="Cap")
+            return False
+
+        for index in rpms:
+            self.rpm[index] = rpms[index]
+            self.rpm_vars[index].set("{0:g}".format(rpms[index]))
+            if self.recorder is not None:
+                self.recorder.recordRpm(motor_names[index], rpms[index])
+        return True
+
+    # Sets a motor's (by name or index) RPM, as ProfilePlayer does
+    def setRpm(self, motor, rpm):
+        global motor_names
+
+        index = motor if isinstance(motor, int) else motor_names.index(motor)
+        if not self.setIncrement(index, max(0.0, float(rpm))
+            - self.rpm[index]):
+            raise ValueError("{0} RPM is too fast for {1}".format(rpm,
+                motor_names[index]))
+
+    # Stops every motor's continuous rotation and queues a coordinated move;
+    # see GPIOHandler.queueMove()
+    def move(self, deltas, rate, acceleration=0.0):
+        global gpio_handler
+
+        self.planner.checkMove(deltas, rate)
+        self.setRpms({i : 0.0 for i in range(len(self.rpm))})
+        if self.recorder is not None:
+            self.recorder.recordMove(deltas, rate, acceleration)
+        if not gpio_handler.queueMove(deltas, rate, acceleration):
+            raise ValueError("The move could not be queued")
 
     # Called whenever the start button OR the stop button has been pressed
     # (they are the same button, but with different text)
@@ -629,6 +1351,7 @@ class MainWindow(tk.Tk):
         global gpio_handler
         global rpm_0
         global EMER
+        global motor_names
 
         # present = True is equivalent to all entry widgets being filled in
         present = True
@@ -636,22 +1359,22 @@ class MainWindow(tk.Tk):
         if not self.started:
             for key_main in self.entries:
                 for key in self.entries[key_main]:
-                    present = present and self.widgets[key_main][key].get() != ""
+                    present = present and self.entryText(key_main, key) != ""
 
-        keys = list(self.settings.keys())
+        keys = motor_names
 
         if present:
             if self.started:
+                if self.player is not None:
+                    self.player.stop()
+                stopStepRateMonitor()
                 gpio_handler.pauseThreads()
                 self.started = False
+                self.pending_rpm = {}
+                self.pending_percentage = 1.0
 
                 for i in range(len(PUL)):
-                    widget_name = "{0}{1}_rpm_ent".format(keys[i][0:1],
-                        keys[i][2:3])
-                    self.widgets["main"][widget_name].configure(state="normal")
-                    self.widgets["main"][widget_name].delete(0, tk.END)
-                    self.widgets["main"][widget_name].insert(0,
-                        self.settings[keys[i]]["rpm"][2])
+                    self.rpm_vars[i].set(self.settings[keys[i]]["rpm"][2])
                 for value in self.disable_widgets:
                     self.widgets["main"][value].configure(state="normal")
                 self.widgets["main"]["strt_btn"].configure(text=("START ALL "
@@ -661,31 +1384,57 @@ class MainWindow(tk.Tk):
                 self.writeFile()
 
                 # Sets all settings read by the GPIO handler
+                try:
+                    self.planner = StepPlanner(self.settings, self.bcm_pins)
+                except ValueError:
+                    self.createWindow(name="errors", error="Mst")
+                    return
+                if not self.setRpms({i : float(self.settings[keys[i]]["rpm"][2])
+                    for i in range(len(PUL))}):
+                    return
                 for i in range(len(PUL)):
                     _pul = int(self.settings[keys[i]]["pul_pin"][2])
                     _dir = int(self.settings[keys[i]]["dir_pin"][2])
                     PUL[i] = self.board_bcm(_pul)
                     DIR[i] = self.board_bcm(_dir)
-                    self.setIncrement(keys[i], 0.0)
 
-                    switch_dir = (keys[i] == "bottom"
-                        and self.settings["bottom"]["wrong_direction"][2])
+                    switch_dir = ("wrong_direction" in self.settings[keys[i]]
+                        and self.settings[keys[i]]["wrong_direction"][2])
                     _dir = self.settings[keys[i]]["direction"][2]
                     dirs[i] = not _dir if switch_dir else _dir
 
                 _emer = int(self.settings["emergency"]["stop_pin"][2])
                 EMER = self.board_bcm(_emer)
+                gpio_handler.setEncoders([encoderConfig(self.settings[key],
+                    self.bcm_pins) for key in keys])
+                gpio_handler.setMicrostepPins(self.planner.pins)
 
                 for value in self.disable_widgets:
                     # Prevents inadvertent modification of values whilst running
                     self.widgets["main"][value].configure(state="disabled")
                 self.widgets["main"]["strt_btn"].configure(text=("STOP ALL "
                     "(SHIFT + S)"))
+                self.compileKeymap()
                 gpio_handler.resumeThreads()
+                startStepRateMonitor()
                 self.started = True
+                if self.player is not None:
+                    self.player.start()
+                    self.player.watch(self)
         else:
             self.createWindow(name="errors", error="Unc")
 
+    # Returns the text in an entry, or, if its view has not been built yet,
+    # the setting it will be filled in with
+    def entryText(self, view, key):
+        if self.widgets[view] is not None:
+            return self.widgets[view][key].get()
+        for sub_settings in self.settings.values():
+            for setting in sub_settings.values():
+                if setting[0] == key and setting[1] == view:
+                    return str(setting[2])
+        return ""
+
     # Called when save button on settings window is pressed
     def savePressed(self):
         global entries
@@ -713,143 +1462,24 @@ class MainWindow(tk.Tk):
 
         name = (name if name != "unknown" else "main" if self.main_window
             else "settings")
+        self.buildView(name)
 
-        # Hides all widgets currently being shown
-        for key in self.widgets[self.window_name]:
-            self.widgets[self.window_name][key].grid_forget()
+        # Swaps the frame of the current view for that of the new one
+        self.frames[self.window_name].pack_forget()
 
         self.window_name = name
         self.title("Stepper Handler" if name == "main"
             else "Stepper Handler Settings")
-        self.widgets[name][list(self.widgets[name].keys())[0]].focus_set()
 
-        # Positions all the widgets for the main window
         if name == "main":
             self.main_window = True
-
-            self.widgets["main"]["vers_lbl"].grid(row=0, column=0, padx=5, sticky="w")
-            self.widgets["main"]["sett_btn"].grid(row=1, column=0, columnspan=4, sticky="we",
-                padx=5, pady=5)
-            self.widgets["main"]["file_btn"].grid(row=1, column=4, columnspan=3, sticky="we",
-                padx=5, pady=5)
-            self.widgets["main"]["file_lbl"].grid(row=1, column=7, columnspan=4, sticky="we",
-                padx=5, pady=5)
-
-            self.widgets["main"]["tp_mtr_lbl"].grid(row=2, column=0, padx=5, pady=5)
-            self.widgets["main"]["tp_rpm_lbl"].grid(row=2, column=1, padx=5, pady=5)
-            self.widgets["main"]["tp_inc_lbl"].grid(row=2, column=3, padx=5, pady=5)
-            self.widgets["main"]["tp_dec_lbl"].grid(row=2, column=5, padx=5, pady=5)
-            self.widgets["main"]["tp_run_lbl"].grid(row=2, column=9, padx=5, pady=5)
-            self.widgets["main"]["tp_run_chk"].grid(row=2, column=10, pady=5)
-            self.widgets["main"]["tp_rpm_ent"].grid(row=2, column=2, padx=5, pady=5)
-            self.widgets["main"]["tp_inc_ent"].grid(row=2, column=4, padx=5, pady=5)
-            self.widgets["main"]["tp_dec_ent"].grid(row=2, column=6, padx=5, pady=5)
-            self.widgets["main"]["tp_inc_val_lbl"].grid(row=2, column=7, padx=5,
-                pady=5)
-            self.widgets["main"]["tp_inc_val_ent"].grid(row=2, column=8, padx=5,
-                pady=5)
-
-            self.widgets["main"]["md_mtr_lbl"].grid(row=3, column=0, padx=5, pady=5)
-            self.widgets["main"]["md_rpm_lbl"].grid(row=3, column=1, padx=5, pady=5)
-            self.widgets["main"]["md_inc_lbl"].grid(row=3, column=3, padx=5, pady=5)
-            self.widgets["main"]["md_dec_lbl"].grid(row=3, column=5, padx=5, pady=5)
-            self.widgets["main"]["md_run_lbl"].grid(row=3, column=9, padx=5, pady=5)
-            self.widgets["main"]["md_run_chk"].grid(row=3, column=10, pady=5)
-            self.widgets["main"]["md_rpm_ent"].grid(row=3, column=2, padx=5, pady=5)
-            self.widgets["main"]["md_inc_ent"].grid(row=3, column=4, padx=5, pady=5)
-            self.widgets["main"]["md_dec_ent"].grid(row=3, column=6, padx=5, pady=5)
-            self.widgets["main"]["md_inc_val_lbl"].grid(row=3, column=7, padx=5,
-                pady=5)
-            self.widgets["main"]["md_inc_val_ent"].grid(row=3, column=8, padx=5,
-                pady=5)
-
-            self.widgets["main"]["bt_mtr_lbl"].grid(row=4, column=0, padx=5, pady=5)
-            self.widgets["main"]["bt_rpm_lbl"].grid(row=4, column=1, padx=5, pady=5)
-            self.widgets["main"]["bt_inc_lbl"].grid(row=4, column=3, padx=5, pady=5)
-            self.widgets["main"]["bt_dec_lbl"].grid(row=4, column=5, padx=5, pady=5)
-            self.widgets["main"]["bt_run_lbl"].grid(row=4, column=9, padx=5, pady=5)
-            self.widgets["main"]["bt_run_chk"].grid(row=4, column=10, pady=5)
-            self.widgets["main"]["bt_rpm_ent"].grid(row=4, column=2, padx=5, pady=5)
-            self.widgets["main"]["bt_inc_ent"].grid(row=4, column=4, padx=5, pady=5)
-            self.widgets["main"]["bt_dec_ent"].grid(row=4, column=6, padx=5, pady=5)
-            self.widgets["main"]["bt_inc_val_lbl"].grid(row=4, column=7, padx=5,
-                pady=5)
-            self.widgets["main"]["bt_inc_val_ent"].grid(row=4, column=8, padx=5,
-                pady=5)
-
-            self.widgets["main"]["bt_cw_lbl"].grid(row=5, column=5, padx=5)
-            self.widgets["main"]["bt_acw_lbl"].grid(row=5, column=7, padx=5)
-            self.widgets["main"]["bt_cw_rdo"].grid(row=5, column=6, padx=5)
-            self.widgets["main"]["bt_acw_rdo"].grid(row=5, column=8, padx=5)
-
-            self.widgets["main"]["al_mtr_lbl"].grid(row=6, column=0, padx=5, pady=5)
-            self.widgets["main"]["al_inc_lbl"].grid(row=6, column=3, padx=5, pady=5)
-            self.widgets["main"]["al_dec_lbl"].grid(row=6, column=5, padx=5, pady=5)
-            self.widgets["main"]["al_inc_val_lbl"].grid(row=6, column=7, padx=5,
-                pady=5)
-            self.widgets["main"]["al_inc_ent"].grid(row=6, column=4, padx=5, pady=5)
-            self.widgets["main"]["al_dec_ent"].grid(row=6, column=6, padx=5, pady=5)
-            self.widgets["main"]["al_inc_val_ent"].grid(row=6, column=8, padx=5,
-                pady=5)
-
-            self.widgets["main"]["strt_btn"].grid(row=7, column=1, columnspan=7,
-                sticky="we", pady=5)
-
-        # Positions all the widgets for the settings window
         elif name == "settings":
             self.main_window = False
-
-            self.widgets["settings"]["tp_mtr_lbl"].grid(row=0, column=0, padx=5)
-            self.widgets["settings"]["tp_spr_lbl"].grid(row=0, column=1, padx=5)
-            self.widgets["settings"]["tp_pul_lbl"].grid(row=0, column=3, padx=5,
-                pady=5)
-            self.widgets["settings"]["tp_dir_lbl"].grid(row=0, column=5, padx=5,
-                pady=5)
-            self.widgets["settings"]["tp_spr_ent"].grid(row=0, column=2, padx=5)
-            self.widgets["settings"]["tp_pul_ent"].grid(row=0, column=4, padx=5,
-                pady=5)
-            self.widgets["settings"]["tp_dir_ent"].grid(row=0, column=6, padx=5,
-                pady=5)
-
-            self.widgets["settings"]["md_mtr_lbl"].grid(row=1, column=0, padx=5)
-            self.widgets["settings"]["md_spr_lbl"].grid(row=1, column=1, padx=5)
-            self.widgets["settings"]["md_pul_lbl"].grid(row=1, column=3, padx=5,
-                pady=5)
-            self.widgets["settings"]["md_dir_lbl"].grid(row=1, column=5, padx=5,
-                pady=5)
-            self.widgets["settings"]["md_spr_ent"].grid(row=1, column=2, padx=5)
-            self.widgets["settings"]["md_pul_ent"].grid(row=1, column=4, padx=5,
-                pady=5)
-            self.widgets["settings"]["md_dir_ent"].grid(row=1, column=6, padx=5,
-                pady=5)
-
-            self.widgets["settings"]["bt_mtr_lbl"].grid(row=2, column=0, padx=5)
-            self.widgets["settings"]["bt_spr_lbl"].grid(row=2, column=1, padx=5)
-            self.widgets["settings"]["bt_pul_lbl"].grid(row=2, column=3, padx=5,
-                pady=5)
-            self.widgets["settings"]["bt_dir_lbl"].grid(row=2, column=5, padx=5,
-                pady=5)
-            self.widgets["settings"]["bt_spr_ent"].grid(row=2, column=2, padx=5)
-            self.widgets["settings"]["bt_pul_ent"].grid(row=2, column=4, padx=5,
-                pady=5)
-            self.widgets["settings"]["bt_dir_ent"].grid(row=2, column=6, padx=5,
-                pady=5)
-
-            self.widgets["settings"]["emer_stp_lbl"].grid(row=3, column=3, padx=5,
-                pady=5)
-            self.widgets["settings"]["emer_stp_ent"].grid(row=3, column=4, padx=5,
-                pady=5)
-
-            self.widgets["settings"]["sv_btn"].grid(row=4, column=0, columnspan=3,
-                padx=5, pady=5, sticky="we")
-            self.widgets["settings"]["cncl_btn"].grid(row=4, column=3,
-                columnspan=4, padx=5, pady=5, sticky="we")
-
         elif name == "errors":
             self.widgets["errors"]["err_lbl"].configure(text=self.errors[error])
-            self.widgets["errors"]["err_lbl"].grid(row=0, column=0, columnspan=3,
-                padx=5, pady=5)
-            self.widgets["errors"]["ok_btn"].grid(row=1, column=1, padx=5, pady=5)
+
+        self.frames[name].pack()
+        self.widgets[name][list(self.widgets[name].keys())[0]].focus_set()
 
     # Check if data is not a number (can be a float)
     def validateNan(self, inStr):
@@ -981,66 +1611,15 @@ class MainWindow(tk.Tk):
         global error
         global cw_var
         global settings_filepath
+        global settings_file
 
-        old_settings = self.settings
         # The settings file must be in the same directory as this script
         cfg_path = path.join(sys.path[0], self.settings_filepath)
+        self.settings_file = SettingsFile(cfg_path, self.bcm_pins)
 
         try:
             if path.exists(cfg_path):
-                cfg = open(cfg_path, "r")
-                # Splits file data into top, middle, bottom and emergency
-                contents = re.split("\[|\]", cfg.read())
-                cfg.close()
-                keys = contents[1::2] # top, middle, bottom and emergency
-                values = contents[::2]
-                values = list(filter(lambda l: l != "", values)) # Removes empty
-                                                                 # string from list
-
-                for i in range(len(keys)):
-                    split_values = list(filter(lambda l: l != "",
-                        values[i].split("\n")))
-                    for j in range(len(split_values)):
-                        comment_split = split_values[j].split("//")
-                        key_value = comment_split[0].split("=") # [0] = key,
-                                                                # [1] = value
-                        cur_key = key_value[0].strip()
-                        settings_keys_list = list(self.settings[keys[i]].keys())
-                        if key_value[0].strip() in settings_keys_list:
-                            # Set comment in settings
-                            self.settings[keys[i]][cur_key][4] = (comment_split[1]
-                                if len(comment_split) == 2 else "")
-                            value = key_value[1].strip()
-                            err_code = self.settings[keys[i]][cur_key][3]
-
-                            if err_code == "NaN":
-                                valid = self.validateNan(value)
-                            elif err_code == "NaL":
-                                valid = self.validateAlu(value, "False")
-                            elif err_code == "NaB":
-                                valid = value == "0" or value == "1"
-                            elif err_code == "NaI":
-                                valid = self.validateNai(value)
-                            elif err_code == "NaP":
-                                valid = self.validateAlu(value, "True")
-                            else:
-                                raise ValueError("Unknown Error Code")
-
-                            # This prevents any possible issues if invalid()
-                            # is called without error being changed
-                            self.error = ""
-
-                            if not valid:
-                                raise ValueError("{0}: Invalid Data {1}"
-                                    .format(err_code, value))
-
-                            if err_code == "NaB":
-                                bool_value = self.settings[keys[i]][cur_key][2]
-                                self.settings[keys[i]][cur_key][2] = (value == "1"
-                                    or value == "" and bool_value)
-                            else:
-                                self.settings[keys[i]][cur_key][2] = ("" if
-                                    value == None else value)
+                self.settings = self.settings_file.read(self.settings)
 
                 for key in self.settings:
                     for sub_key in self.settings[key]:
@@ -1048,84 +1627,930 @@ class MainWindow(tk.Tk):
                         window = self.settings[key][sub_key][1]
                         value = self.settings[key][sub_key][2]
 
-                        if entry != "nul" and entry != "cw_var":
+                        if (entry != "nul" and entry != "cw_var"
+                        and self.widgets[window] is not None):
                             self.widgets[window][entry].insert(0, value)
                         if entry == "cw_var":
-                            self.cw_var.set(value)
+                            self.cw_var[motor_names.index(key)].set(value)
 
-        except:
-            self.settings = old_settings
+        except (OSError, ValueError):
             self.createWindow(name="errors", error="Set")
             return False
 
         return True
 
-    # Writes to the settings file from the settings variable and
-    # updates the settings variable
+    # Updates the settings variable from the widgets and writes it to the
+    # settings file, if anything has changed since it was last read or written
     def writeFile(self):
         global settings
         global widgets
         global cw_var
         global settings_filepath
-
-        lines = []
+        global settings_file
 
         for key in self.settings:
-            lines.append("[{0}]".format(key))
-
             for sub_key in self.settings[key]:
                 setting = self.settings[key][sub_key]
-                if setting[0] == "nul":
-                    value = setting[2]
-                elif setting[0] == "cw_var":
-                    value = self.cw_var.get()
-                    self.settings[key][sub_key][2] = value
-                else:
-                    value = self.widgets[setting[1]][setting[0]].get()
-                    self.settings[key][sub_key][2] = value
+                if setting[0] == "cw_var":
+                    setting[2] = self.cw_var[motor_names.index(key)].get()
+                elif (setting[0] != "nul"
+                and self.widgets[setting[1]] is not None):
+                    setting[2] = self.widgets[setting[1]][setting[0]].get()
 
-                if (self.settings[key][sub_key][2] == True or
-                self.settings[key][sub_key][2] == False):
-                    value = "1" if value else "0"
-
-                # Ensures that comment is in the correct format; no new lines and no unnecessary
-                # whitespace before or after the actual comment
-                comment = self.settings[key][sub_key][4].strip()
-                comment = " // {0}".format(comment) if comment != "" else ""
-                comment = re.sub("[\r|\n]", "", comment)
-                lines.append("{0} = {1}{2}".format(sub_key, value, comment))
-
-            lines.append("")
-        # Removes the last element from the list
-        lines.pop()
-        text = "\n".join(lines)
         cfg_path = path.join(sys.path[0], self.settings_filepath)
-        cfg = open(cfg_path, "w")
-        cfg.write(text)
-        cfg.close()
+        if self.settings_file is None or self.settings_file.filepath != cfg_path:
+            # A newly selected settings file is written in full
+            self.settings_file = SettingsFile(cfg_path, self.bcm_pins)
+        self.settings_file.write(self.settings)
 
     # Converts the physical board pin numbers to the BCM pin numbers
     def board_bcm(self, pin, returnPin = True):
         global bcm_pins
 
-        index = 0
-        displacement = 0
         try:
-            pin = int(pin)
-            displacement = (-4 if pin % 2 == 1 else 2 + (1 if pin < 10 else 0)
-                + len(str(pin)))
-            index = self.bcm_pins.index("({0})".format(pin)) + displacement
-            displacement = 3 if pin % 2 == 1 else 7
-            bcm = self.bcm_pins[index:index + displacement].strip(" GPIO\r\n")
-            if bcm.isdigit():
-                if returnPin:
-                    return int(bcm)
+            bcm = self.bcm_pins.get(int(pin))
+        except ValueError:
+            return False
+
+        if bcm is None:
+            return False
+        return bcm if returnPin else True
+
+# Physical pin: BCM GPIO number for the 40-pin header shared by every Pi since
+# the B+; pins not listed are power or ground
+header_40 = {
+    3 : 2, 5 : 3, 7 : 4, 8 : 14, 10 : 15, 11 : 17, 12 : 18, 13 : 27, 15 : 22,
+    16 : 23, 18 : 24, 19 : 10, 21 : 9, 22 : 25, 23 : 11, 24 : 8, 26 : 7, 27 : 0,
+    28 : 1, 29 : 5, 31 : 6, 32 : 12, 33 : 13, 35 : 19, 36 : 16, 37 : 26, 38 : 20,
+    40 : 21
+}
+
+# The 26-pin headers of the original Model A and B
+header_26_rev2 = {pin : header_40[pin] for pin in header_40 if pin <= 26}
+header_26_rev1 = dict(header_26_rev2)
+header_26_rev1.update({3 : 0, 5 : 1, 13 : 21})
+
+# Returns the board revision code from /proc/cpuinfo, or "" if it is not a Pi
+def boardRevision():
+    try:
+        cpuinfo = open("/proc/cpuinfo", "r")
+        revision = re.search(r"^Revision\s*:\s*(\w+)", cpuinfo.read(),
+            re.MULTILINE)
+        cpuinfo.close()
+    except OSError:
+        return ""
+    return revision.group(1).lower() if revision else ""
+
+# Returns the built-in header table for a revision code, or None if unknown
+def knownHeader(revision):
+    try:
+        code = int(revision, 16)
+    except ValueError:
+        return None
+
+    if code & (1 << 23): # New-style revision codes; all have the 40-pin header
+        return header_40
+    code &= 0xffff # Removes the overvoltage (warranty) bit
+    if code in (0x2, 0x3):
+        return header_26_rev1
+    if 0x4 <= code <= 0xf:
+        return header_26_rev2
+    if 0x10 <= code <= 0x15:
+        return header_40
+    return None
+
+# Parses the output of the pinout command into a physical pin: BCM dictionary
+def parsePinout(text):
+    pins = {}
+    for left, odd, even, right in re.findall(
+    r"(\S+)\s+\((\d+)\)\s+\((\d+)\)\s+(\S+)", text):
+        for name, pin in ((left, odd), (right, even)):
+            if name.startswith("GPIO") and name[4:].isdigit():
+                pins[int(pin)] = int(name[4:])
+    return pins
+
+# Returns an immutable physical pin: BCM mapping for this board. Known boards
+# use a built-in table; others use a table cached in pinoutCache.cfg for the
+# board revision, and only if there is none is the pinout command run
+def boardPins(cache_filepath=None):
+    import subprocess
+
+    revision = boardRevision()
+    header = knownHeader(revision)
+    if header is not None:
+        return MappingProxyType(header)
+
+    cache_filepath = cache_filepath or path.join(sys.path[0], "pinoutCache.cfg")
+    try:
+        cache = open(cache_filepath, "r")
+        lines = cache.read().split("\n")
+        cache.close()
+        if lines[0] == "revision = {0}".format(revision):
+            pins = {}
+            for line in lines[1:]:
+                if "=" in line:
+                    pin, bcm = line.split("=")
+                    pins[int(pin)] = int(bcm)
+            return MappingProxyType(pins)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        pins = parsePinout(subprocess.run("pinout", stdout=subprocess.PIPE,
+            universal_newlines=True).stdout)
+    except OSError:
+        pins = {}
+
+    if not pins:
+        # Not a recognisable Pi; the 40-pin layout is the best guess
+        return MappingProxyType(header_40)
+
+    try:
+        cache = open(cache_filepath, "w")
+        cache.write("\n".join(["revision = {0}".format(revision)]
+            + ["{0} = {1}".format(pin, pins[pin]) for pin in sorted(pins)]))
+        cache.close()
+    except OSError:
+        pass
+    return MappingProxyType(pins)
+
+# Generates the step periods which take a motor from one speed to another
+# within its acceleration (and optionally jerk) limits. The periods are
+# generated one at a time, as the motor loop needs them (see Ramp), so a ramp
+# of any length costs nothing up front and is always followed to its end
+class MotionProfile:
+    # acceleration is in RPM per second and jerk in RPM per second squared;
+    # both are converted to steps (pulses) per second
+    def __init__(self, pulses_revolution, acceleration, jerk):
+        self.acceleration = acceleration * pulses_revolution / 60.0
+        self.jerk = jerk * pulses_revolution / 60.0
+
+    # Returns an iterator over the step periods (s) taking the motor from
+    # from_speed to to_speed (steps per second, 0 meaning stationary), which
+    # is empty if the change should be made instantly
+    def periods(self, from_speed, to_speed):
+        if self.acceleration <= 0.0 or from_speed == to_speed:
+            return iter(())
+        if from_speed < to_speed:
+            if self.jerk > 0.0:
+                return self.sCurve(from_speed, to_speed)
+            return self.trapezoid(from_speed, to_speed)
+        if self.jerk > 0.0:
+            return self.sCurveDown(from_speed, to_speed)
+        return self.trapezoidDown(from_speed, to_speed)
+
+    # Step periods (s) accelerating from low_speed to high_speed (steps per
+    # second) at constant acceleration, using David Austin's approximation
+    # c[n] = c[n - 1] - 2 * c[n - 1] / (4 * n + 1) (Atmel application note
+    # AVR446) so that only the first period needs a square root
+    def trapezoid(self, low_speed, high_speed):
+        if low_speed <= 0.0:
+            n = 0
+            # The 0.676 factor corrects the error in the approximation's
+            # first step
+            period = 0.676 * sqrt(2.0 / self.acceleration)
+        else:
+            n = max(1, int(low_speed * low_speed / (2.0 * self.acceleration)))
+            period = 1.0 / low_speed
+
+        target = 1.0 / high_speed
+        while period > target:
+            yield period
+            n += 1
+            period -= 2.0 * period / (4 * n + 1)
+
+    # Step periods (s) decelerating from high_speed to low_speed; the same
+    # approximation run backwards, c[n - 1] = c[n] * (4 * n + 1) / (4 * n - 1),
+    # finishing with trapezoid()'s first step if the motor is to stop
+    def trapezoidDown(self, high_speed, low_speed):
+        n = int(high_speed * high_speed / (2.0 * self.acceleration))
+        period = 1.0 / high_speed
+
+        target = 1.0 / low_speed if low_speed > 0.0 else float("inf")
+        while n > 0 and period < target:
+            yield period
+            period *= (4 * n + 1) / (4 * n - 1)
+            n -= 1
+        if low_speed <= 0.0:
+            yield 0.676 * sqrt(2.0 / self.acceleration)
+
+    # Step periods (s) accelerating from low_speed to high_speed (steps per
+    # second) with the acceleration itself ramped up and back down at the jerk
+    # limit, integrated one step at a time
+    def sCurve(self, low_speed, high_speed):
+        jerk = self.jerk
+        acceleration = 0.0
+        speed = low_speed
+
+        if speed <= 0.0:
+            # Under constant jerk from rest the first step takes (6 / j) ^ (1/3)
+            period = (6.0 / jerk) ** (1.0 / 3.0)
+            acceleration = min(self.acceleration, jerk * period)
+            speed = 0.5 * jerk * period * period
+            yield period
+
+        while speed < high_speed:
+            period = 1.0 / speed
+            # The acceleration must be back at 0 when the target speed is
+            # reached, which limits it to sqrt(2 * j * remaining speed)
+            acceleration = min(self.acceleration, acceleration + jerk * period,
+                sqrt(2.0 * jerk * (high_speed - speed)))
+            if acceleration <= 0.0:
+                break
+            speed += acceleration * period
+            yield period
+
+    # Step periods (s) decelerating from high_speed to low_speed as sCurve()
+    # accelerates, finishing with sCurve()'s first step if the motor is to stop
+    def sCurveDown(self, high_speed, low_speed):
+        jerk = self.jerk
+        deceleration = 0.0
+        speed = high_speed
+        first = (6.0 / jerk) ** (1.0 / 3.0)
+        # Below the speed of sCurve()'s first step, only that step is left
+        floor = max(low_speed, 0.5 * jerk * first * first)
+
+        while speed > floor:
+            period = 1.0 / speed
+            deceleration = min(self.acceleration, deceleration + jerk * period,
+                sqrt(2.0 * jerk * (speed - low_speed)))
+            if deceleration <= 0.0:
+                break
+            speed -= deceleration * period
+            yield period
+        if low_speed <= 0.0:
+            yield first
+
+# A motor's way from whatever speed it is at to to_interval (ns per edge, 0
+# meaning stationary) within profile's limits. The motor loop calls start()
+# with the motor's edge interval when it takes the ramp up, then next() for
+# each edge until it returns 0, after which the motor runs at to_interval.
+# A ramp may also switch the motor's microstep pins to set_mask and
+# clear_mask, scale being the ratio of the old pulses per revolution to the
+# new, so that the new resolution and the intervals worked out for it start
+# on the same edge. It is only worked out once started, so it is small enough
+# to be sent to the engine process
+class Ramp:
+    def __init__(self, profile, to_interval, scale=1.0, set_mask=0,
+    clear_mask=0):
+        self.profile = profile
+        self.to_interval = to_interval
+        self.scale = scale
+        self.set_mask = set_mask
+        self.clear_mask = clear_mask
+        self.steps = None # Iterator over the remaining step periods (s)
+        self.half = 0 # Interval (ns) of the second edge of the current step,
+                      # or 0 if the next edge starts a new step
+
+    def start(self, from_interval):
+        # An edge interval is half of a step period
+        from_interval *= self.scale
+        from_speed = 5e8 / from_interval if from_interval > 0 else 0.0
+        to_speed = 5e8 / self.to_interval if self.to_interval > 0 else 0.0
+        self.steps = self.profile.periods(from_speed, to_speed)
+        self.half = 0
+
+    # Returns the interval (ns) until the motor's next edge, or 0 once the
+    # ramp is finished
+    def next(self):
+        half = self.half
+        if half:
+            self.half = 0
+            return half
+        period = next(self.steps, 0.0)
+        if not period:
+            return 0
+        self.half = int(period * 5e8)
+        return self.half
+
+# Coordinated moves, in which every motor starts and finishes together. A
+# move is a number of steps for each motor (negative for anticlockwise), the
+# rate in steps per second of the motor with the most steps, and that motor's
+# acceleration in steps per second squared (0 for none); the other motors step
+# in proportion, spread evenly as by Bresenham's line algorithm. edges() merges
+# the queued moves into one time-ordered stream of edges, looking ahead
+# through the queue so that consecutive moves chain without stopping wherever
+# their rates and directions allow
+class MoveQueue:
+    lookahead = 16 # Moves looked ahead through when planning speeds
+    dir_setup = 5000 # Nanoseconds between writing DIR and the next step
+
+    def __init__(self):
+        self.moves = deque() # (steps, longest, rate, acceleration, length) per
+                             # move, length being the Euclidean length in steps
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, deltas, rate, acceleration=0.0):
+        global PUL
+
+        if len(deltas) != len(PUL):
+            raise ValueError("A move needs steps for all {0} motors".format(
+                len(PUL)))
+        deltas = tuple(int(delta) for delta in deltas)
+        longest = max(abs(delta) for delta in deltas)
+        if longest and rate > 0:
+            self.moves.append((deltas, longest, float(rate),
+                max(0.0, float(acceleration)),
+                sqrt(sum(delta * delta for delta in deltas))))
+
+    def clear(self):
+        self.moves.clear()
+
+    # Returns the fastest speed (steps per second of the longest axis) at which
+    # the move at index can finish and still leave the moves after it, within
+    # the lookahead, room to stop; a motor changing direction means stopping.
+    # As the longest axis can differ from move to move, the moves are compared
+    # by feed rate, in steps per second along the path: a move's rate,
+    # acceleration and longest axis scaled by its length over its longest
+    def exitSpeed(self, index):
+        moves = self.moves
+        feed = 0.0
+        for k in range(min(len(moves), index + self.lookahead) - 1, index, -1):
+            deltas, longest, rate, acceleration, length = moves[k]
+            previous = moves[k - 1]
+            scale = length / longest
+            if acceleration:
+                feed = min(rate * scale, sqrt(feed * feed
+                    + 2.0 * acceleration * scale * length))
+            else:
+                feed = rate * scale
+            for j in range(len(deltas)):
+                if deltas[j] * previous[0][j] < 0:
+                    feed = 0.0
+            feed = min(feed, previous[2] * previous[4] / previous[1])
+        return feed * moves[index][1] / moves[index][4]
+
+    # Yields (set_mask, clear_mask, interval) for each edge of the queued
+    # moves, interval being the nanoseconds until the next edge, and removes
+    # each move from the queue once all its edges have been yielded. A step is
+    # only counted once the next edge is asked for, as its edge has then been
+    # output
+    def edges(self):
+        global PUL
+        global DIR
+        global steps
+        global position
+        global direction_changes
+
+        speed = 0.0
+        dir_levels = [None] * len(PUL)
+
+        while self.moves:
+            deltas, longest, rate, acceleration, length = self.moves[0]
+
+            set_mask = 0
+            clear_mask = 0
+            for j in range(len(deltas)):
+                # DIR is low for clockwise, as in the motor loop
+                if deltas[j] and dir_levels[j] != (deltas[j] < 0):
+                    if dir_levels[j] is not None:
+                        direction_changes[j] += 1
+                    dir_levels[j] = deltas[j] < 0
+                    if dir_levels[j]:
+                        set_mask |= 1 << DIR[j]
+                    else:
+                        clear_mask |= 1 << DIR[j]
+            if set_mask or clear_mask:
+                yield set_mask, clear_mask, self.dir_setup
+
+            magnitudes = [abs(delta) for delta in deltas]
+            errors = [longest // 2] * len(deltas)
+            queued = len(self.moves)
+            exit_speed = self.exitSpeed(0)
+
+            for k in range(longest):
+                if len(self.moves) != queued:
+                    # More moves have been queued, which may let this one
+                    # finish faster
+                    queued = len(self.moves)
+                    exit_speed = self.exitSpeed(0)
+                if acceleration:
+                    speed = min(rate, sqrt(speed * speed + 2.0 * acceleration),
+                        sqrt(exit_speed * exit_speed
+                        + 2.0 * acceleration * (longest - k)))
                 else:
-                    return True
+                    speed = rate
+
+                step_mask = 0
+                stepped = []
+                for j in range(len(deltas)):
+                    errors[j] += magnitudes[j]
+                    if errors[j] >= longest:
+                        errors[j] -= longest
+                        step_mask |= 1 << PUL[j]
+                        stepped.append(j)
+
+                interval = int(1e9 / speed)
+                yield step_mask, 0, interval // 2
+                for j in stepped:
+                    steps[j] += 1
+                    position[j] += 1 if deltas[j] > 0 else -1
+                yield 0, step_mask, interval - interval // 2
+
+            self.moves.popleft()
+
+# Returns the pins whose bits are set in mask, lowest first
+def maskPins(mask):
+    pins = []
+    while mask:
+        bit = mask & -mask
+        pins.append(bit.bit_length() - 1)
+        mask ^= bit
+    return pins
+
+# Interface through which the GPIO handler drives the pins, so that the motor
+# loop is not tied to RPi.GPIO. Pins are always BCM numbers and levels are
+# booleans (True for high)
+class GPIOBackend:
+    name = ""
+
+    def setupOutput(self, pin):
+        raise NotImplementedError
+
+    def setupInput(self, pin, pull_up=True):
+        raise NotImplementedError
+
+    def output(self, pin, value):
+        raise NotImplementedError
+
+    # Returns the level of an input pin as True or False
+    def input(self, pin):
+        raise NotImplementedError
+
+    # Drives the pins whose bits are set in set_mask high and those whose bits
+    # are set in clear_mask low; backends which can do so in one operation
+    # override this
+    def outputMasks(self, set_mask, clear_mask):
+        for pin in maskPins(set_mask):
+            self.output(pin, True)
+        for pin in maskPins(clear_mask):
+            self.output(pin, False)
+
+    # callback is called with the pin number whenever the input changes level
+    def addEdgeDetect(self, pin, callback):
+        raise NotImplementedError
+
+    def cleanup(self):
+        raise NotImplementedError
+
+# Uses the RPi.GPIO library, which is only installed on a Raspberry Pi
+class RPiGPIOBackend(GPIOBackend):
+    name = "rpi"
+
+    def __init__(self):
+        self.lib = None # RPi.GPIO, imported when the pins are first set up
+        self.moded = False
+
+    def setMode(self):
+        if not self.moded:
+            if self.lib is None:
+                import RPi.GPIO
+                self.lib = RPi.GPIO
+            self.lib.setmode(self.lib.BCM)
+            self.moded = True
+
+    def setupOutput(self, pin):
+        self.setMode()
+        self.lib.setup(pin, self.lib.OUT)
+
+    def setupInput(self, pin, pull_up=True):
+        self.setMode()
+        self.lib.setup(pin, self.lib.IN, pull_up_down=(self.lib.PUD_UP
+            if pull_up else self.lib.PUD_DOWN))
+
+    def output(self, pin, value):
+        self.lib.output(pin, self.lib.HIGH if value else self.lib.LOW)
+
+    def input(self, pin):
+        return self.lib.input(pin) == self.lib.HIGH
+
+    # RPi.GPIO takes a list of pins and levels in a single call
+    def outputMasks(self, set_mask, clear_mask):
+        set_pins = maskPins(set_mask)
+        clear_pins = maskPins(clear_mask)
+        self.lib.output(set_pins + clear_pins, [self.lib.HIGH] * len(set_pins)
+            + [self.lib.LOW] * len(clear_pins))
+
+    def addEdgeDetect(self, pin, callback):
+        self.lib.add_event_detect(pin, self.lib.BOTH, callback=callback)
+
+    def cleanup(self):
+        if self.lib is not None:
+            self.lib.cleanup()
+        self.moded = False
+
+# Writes straight to the BCM GPIO registers through /dev/gpiomem, avoiding the
+# per-call overhead of RPi.GPIO. The kernel does not deliver interrupts through
+# this device, so edge detection polls the level register from a thread
+class GPIOMemBackend(GPIOBackend):
+    name = "gpiomem"
+
+    GPFSEL0 = 0x00 # Function select; 3 bits per pin, 10 pins per register
+    GPSET0 = 0x1c
+    GPCLR0 = 0x28
+    GPLEV0 = 0x34
+    GPPUD = 0x94 # Pull-up/down control on the BCM2835/6/7
+    GPPUDCLK0 = 0x98
+    GPPUPPDN0 = 0xe4 # Pull-up/down control on the BCM2711; 2 bits per pin
+
+    poll_interval = 0.0005 # Seconds between reads of the level register
+
+    def __init__(self, device="/dev/gpiomem"):
+        self.fd = open(device, "r+b", buffering=0)
+        self.mem = mmap.mmap(self.fd.fileno(), 4096)
+        self.bcm2711 = False
+        try:
+            compatible = open("/proc/device-tree/compatible", "rb")
+            self.bcm2711 = b"bcm2711" in compatible.read()
+            compatible.close()
+        except OSError:
+            pass
+        self.callbacks = {}
+        self.poller = None
+        self.polling = False
+        self.outputs = []
+
+    def readRegister(self, offset):
+        return struct.unpack_from("<I", self.mem, offset)[0]
+
+    def writeRegister(self, offset, value):
+        struct.pack_into("<I", self.mem, offset, value)
+
+    def setFunction(self, pin, function):
+        offset = self.GPFSEL0 + 4 * (pin // 10)
+        shift = 3 * (pin % 10)
+        value = self.readRegister(offset) & ~(7 << shift)
+        self.writeRegister(offset, value | (function << shift))
+
+    def setPull(self, pin, pull_up):
+        if self.bcm2711:
+            offset = self.GPPUPPDN0 + 4 * (pin // 16)
+            shift = 2 * (pin % 16)
+            value = self.readRegister(offset) & ~(3 << shift)
+            self.writeRegister(offset, value | ((1 if pull_up else 2) << shift))
+        else:
+            # The BCM2835 datasheet requires 150 cycles between each write
+            self.writeRegister(self.GPPUD, 2 if pull_up else 1)
+            sleep(0.00001)
+            self.writeRegister(self.GPPUDCLK0 + 4 * (pin // 32), 1 << (pin % 32))
+            sleep(0.00001)
+            self.writeRegister(self.GPPUD, 0)
+            self.writeRegister(self.GPPUDCLK0 + 4 * (pin // 32), 0)
+
+    def setupOutput(self, pin):
+        self.setFunction(pin, 1)
+        self.outputs.append(pin)
+
+    def setupInput(self, pin, pull_up=True):
+        self.setFunction(pin, 0)
+        self.setPull(pin, pull_up)
+
+    def output(self, pin, value):
+        self.writeRegister((self.GPSET0 if value else self.GPCLR0)
+            + 4 * (pin // 32), 1 << (pin % 32))
+
+    def input(self, pin):
+        return (self.readRegister(self.GPLEV0 + 4 * (pin // 32))
+            >> (pin % 32)) & 1 == 1
+
+    # Each register covers 32 pins; pins 32 to 53 use the second of each pair
+    def outputMasks(self, set_mask, clear_mask):
+        if set_mask & 0xffffffff:
+            self.writeRegister(self.GPSET0, set_mask & 0xffffffff)
+        if set_mask >> 32:
+            self.writeRegister(self.GPSET0 + 4, set_mask >> 32)
+        if clear_mask & 0xffffffff:
+            self.writeRegister(self.GPCLR0, clear_mask & 0xffffffff)
+        if clear_mask >> 32:
+            self.writeRegister(self.GPCLR0 + 4, clear_mask >> 32)
+
+    def addEdgeDetect(self, pin, callback):
+        self.callbacks[pin] = callback
+        if self.poller is None:
+            self.polling = True
+            self.poller = threading.Thread(target=self.pollInputs)
+            self.poller.daemon = True
+            self.poller.start()
+
+    def pollInputs(self):
+        last = self.readRegister(self.GPLEV0)
+        while self.polling:
+            level = self.readRegister(self.GPLEV0)
+            changed = level ^ last
+            last = level
+            if changed:
+                for pin, callback in list(self.callbacks.items()):
+                    if changed & (1 << pin):
+                        callback(pin)
+            sleep(self.poll_interval)
+
+    def cleanup(self):
+        self.polling = False
+        if self.poller is not None:
+            self.poller.join()
+            self.poller = None
+        self.callbacks = {}
+        # Returns used pins to inputs, as RPi.GPIO.cleanup() does
+        for pin in self.outputs:
+            self.setFunction(pin, 0)
+        self.outputs = []
+
+# Keeps pin levels in memory and timestamps every output edge into
+# preallocated arrays, so that pulse throughput and jitter can be measured
+# without hardware. Recording stops silently once capacity edges are stored
+class RecordingBackend(GPIOBackend):
+    name = "recorder"
+
+    def __init__(self, capacity=1000000):
+        self.capacity = capacity
+        self.times = array("q", bytes(8 * capacity)) # perf_counter_ns()
+        self.pins = array("H", bytes(2 * capacity))
+        self.values = array("B", bytes(capacity))
+        self.count = 0
+        self.calls = 0 # Calls of output() and outputMasks()
+        self.levels = {}
+        self.callbacks = {}
+
+    def setupOutput(self, pin):
+        self.levels[pin] = False
+
+    def setupInput(self, pin, pull_up=True):
+        self.levels[pin] = pull_up
+
+    def output(self, pin, value):
+        self.calls += 1
+        if self.levels.get(pin) != value:
+            self.levels[pin] = value
+            count = self.count
+            if count < self.capacity:
+                self.times[count] = perf_counter_ns()
+                self.pins[count] = pin
+                self.values[count] = value
+                self.count = count + 1
+
+    def input(self, pin):
+        return bool(self.levels.get(pin, False))
+
+    def outputMasks(self, set_mask, clear_mask):
+        self.calls += 1
+        now = perf_counter_ns()
+        mask = set_mask | clear_mask
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            pin = bit.bit_length() - 1
+            value = set_mask & bit != 0
+            if self.levels.get(pin) != value:
+                self.levels[pin] = value
+                count = self.count
+                if count < self.capacity:
+                    self.times[count] = now
+                    self.pins[count] = pin
+                    self.values[count] = value
+                    self.count = count + 1
+
+    def addEdgeDetect(self, pin, callback):
+        self.callbacks[pin] = callback
+
+    # Simulates an external signal changing the level of an input pin
+    def trigger(self, pin, value):
+        if self.levels.get(pin) != value:
+            self.levels[pin] = value
+            if pin in self.callbacks:
+                self.callbacks[pin](pin)
+
+    # Timestamps of the recorded edges on a pin, optionally only rising
+    # (value=True) or falling (value=False) ones
+    def edgeTimes(self, pin, value=None):
+        times = self.times
+        pins = self.pins
+        values = self.values
+        return [times[k] for k in range(self.count) if pins[k] == pin
+            and (value is None or values[k] == value)]
+
+    def reset(self):
+        self.count = 0
+        self.calls = 0
+
+    def cleanup(self):
+        self.levels = {}
+        self.callbacks = {}
+
+gpio_backends = {
+    "rpi" : RPiGPIOBackend,
+    "gpiomem" : GPIOMemBackend,
+    "recorder" : RecordingBackend
+}
+
+# Counts a quadrature encoder's A and B edges into encoder_counts[index], four
+# counts per line, through edge-detect callbacks. Each callback reads both
+# pins and looks the count up in transitions, so that an edge the GPIO
+# library drops or merges into the next costs the counts of those two edges
+# rather than leaving the state out of phase; the reads cost little next to
+# the library's own overhead for each callback
+class QuadratureEncoder:
+    # Indexed by previous state * 4 + new state, where the state is A * 2 + B;
+    # forwards is 0, 1, 3, 2, 0. Impossible transitions (both pins changing)
+    # count nothing
+    transitions = array("b", [0, 1, -1, 0, -1, 0, 0, 1, 1, 0, 0, -1, 0, -1, 1,
+        0])
+
+    def __init__(self, index, pin_a, pin_b):
+        self.index = index
+        self.pin_a = pin_a
+        self.pin_b = pin_b
+        self.state = 0
+
+    def attach(self):
+        gpio.setupInput(self.pin_a, pull_up=True)
+        gpio.setupInput(self.pin_b, pull_up=True)
+        self.resync()
+        gpio.addEdgeDetect(self.pin_a, self.edge)
+        gpio.addEdgeDetect(self.pin_b, self.edge)
+
+    def resync(self):
+        self.state = (gpio.input(self.pin_a) << 1) | gpio.input(self.pin_b)
+
+    # Called for edges of either pin
+    def edge(self, pin):
+        state = (gpio.input(self.pin_a) << 1) | gpio.input(self.pin_b)
+        encoder_counts[self.index] += self.transitions[self.state << 2 | state]
+        self.state = state
+
+# Returns (A pin, B pin, encoder counts per pulse, stall threshold in pulses),
+# with BCM pin numbers looked up in pins, for a motor's settings as laid out by
+# settingsSchema(), or None if the motor has no encoder
+def encoderConfig(setting, pins):
+    if (setting["encoder_a_pin"][2] == "" or setting["encoder_b_pin"][2] == ""
+    or not int(setting["encoder_counts"][2] or 0)):
+        return None
+    return (pins[int(setting["encoder_a_pin"][2])],
+        pins[int(setting["encoder_b_pin"][2])],
+        float(setting["encoder_counts"][2])
+            / float(setting["pulses_revolution"][2]),
+        float(setting["stall_steps"][2] or 0))
+
+# Returns the BCM microstep pins of a motor and the (pulses per revolution,
+# set mask, clear mask) of each resolution they select, coarsest first, or
+# None if it has no microstep pins
+def microstepConfig(setting, pins):
+    if setting["microstep_pins"][2] == "" or setting["microsteps"][2] == "":
+        return None
+    bcm_pins = [pins[int(pin)] for pin in setting["microstep_pins"][2].split(
+        ",")]
+    modes = []
+    for mode in setting["microsteps"][2].split(","):
+        pulses_revolution, _, levels = mode.strip().partition(":")
+        if len(levels) != len(bcm_pins):
+            raise ValueError("{0} needs a level for each of {1} pins".format(
+                mode, len(bcm_pins)))
+        set_mask = 0
+        clear_mask = 0
+        for pin, level in zip(bcm_pins, levels):
+            if level == "1":
+                set_mask |= 1 << pin
             else:
-                return False
-        except:
-            return False
+                clear_mask |= 1 << pin
+        modes.append((float(pulses_revolution), set_mask, clear_mask))
+    return bcm_pins, sorted(modes)
+
+# Destination for precomputed pulse buffers when the GPIO handler runs in
+# waveform mode. A buffer is a list of (set_mask, clear_mask, delay_us)
+# pulses, as in pigpio's gpioPulse_t: the bits in set_mask are driven high,
+# those in clear_mask low, and the next pulse follows delay_us later
+class WaveformSink:
+    name = ""
+    max_pulses = 10000 # Largest buffer send() accepts
+
+    def setupOutput(self, pin):
+        pass
+
+    # Queues a buffer to be output immediately after those already queued
+    def send(self, pulses):
+        raise NotImplementedError
+
+    # Number of sent buffers which have not finished being output
+    def queued(self):
+        raise NotImplementedError
+
+    # Abandons all queued buffers and stops output
+    def stop(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# Hands buffers to the pigpio daemon, which outputs them with DMA-timed
+# accuracy; each buffer becomes a wave chained onto the previous one
+class PigpioSink(WaveformSink):
+    name = "pigpio"
+    max_pulses = 5000
+
+    def __init__(self, host="localhost", port=8888):
+        import pigpio
+        self.lib = pigpio
+        self.pi = pigpio.pi(host, port)
+        if not self.pi.connected:
+            raise OSError("Could not connect to the pigpio daemon")
+        self.pi.wave_clear()
+        self.waves = [] # Wave IDs in the order they were sent
+
+    def setupOutput(self, pin):
+        self.pi.set_mode(pin, self.lib.OUTPUT)
+
+    def send(self, pulses):
+        self.pi.wave_add_generic([self.lib.pulse(on, off, delay_us)
+            for on, off, delay_us in pulses])
+        wave_id = self.pi.wave_create()
+        self.pi.wave_send_using_mode(wave_id, self.lib.WAVE_MODE_ONE_SHOT_SYNC)
+        self.waves.append(wave_id)
+
+    def queued(self):
+        current = self.pi.wave_tx_at()
+        # Waves sent before the one currently being output have finished, and
+        # if none of ours is being output they all have
+        if current in self.waves:
+            finished = self.waves[:self.waves.index(current)]
+        else:
+            finished = self.waves
+        for wave_id in finished:
+            self.pi.wave_delete(wave_id)
+        self.waves = self.waves[len(finished):]
+        return len(self.waves)
+
+    def stop(self):
+        self.pi.wave_tx_stop()
+        self.pi.wave_clear()
+        self.waves = []
+
+    def close(self):
+        self.stop()
+        self.pi.stop()
+
+# Writes buffers to a file instead of to the pins, so that generated timing
+# can be checked offline with checkWaveform(). Buffers are treated as finished
+# once the time they would take to output has passed, so the handler refills
+# at the same rate as it would with real hardware
+class FileSink(WaveformSink):
+    name = "file"
+    record = struct.Struct("<IIi") # set_mask, clear_mask, delay_us
+
+    def __init__(self, filepath):
+        self.file = open(filepath, "wb")
+        self.ends = [] # perf_counter_ns() at which each queued buffer finishes
+
+    def send(self, pulses):
+        for pulse in pulses:
+            self.file.write(self.record.pack(*pulse))
+        now = perf_counter_ns()
+        start = self.ends[-1] if self.ends and self.ends[-1] > now else now
+        self.ends.append(start + 1000 * sum(pulse[2] for pulse in pulses))
+
+    def queued(self):
+        now = perf_counter_ns()
+        while self.ends and self.ends[0] <= now:
+            self.ends.pop(0)
+        return len(self.ends)
+
+    def stop(self):
+        self.file.flush()
+        self.ends = []
+
+    def close(self):
+        self.file.close()
+
+# Reads a file written by FileSink and returns, for each pin which changed,
+# the number of rising edges and the mean, minimum and maximum period between
+# them in microseconds
+def checkWaveform(filepath):
+    rising = {}
+    time_us = 0
+
+    wave_file = open(filepath, "rb")
+    data = wave_file.read()
+    wave_file.close()
+
+    for set_mask, clear_mask, delay_us in FileSink.record.iter_unpack(data):
+        pin = 0
+        while set_mask:
+            if set_mask & 1:
+                rising.setdefault(pin, []).append(time_us)
+            set_mask >>= 1
+            pin += 1
+        time_us += delay_us
+
+    report = {}
+    for pin in sorted(rising):
+        times = rising[pin]
+        periods = [times[k + 1] - times[k] for k in range(len(times) - 1)]
+        if periods:
+            report[pin] = (len(times), sum(periods) / len(periods),
+                min(periods), max(periods))
+        else:
+            report[pin] = (len(times), 0.0, 0, 0)
+    return report
 
 # Class to interact with the motors
 class GPIOHandler:
@@ -1133,23 +2558,62 @@ class GPIOHandler:
     run = True # Only set to false when the program is exiting
     all_operating = False # Equivalent to the threads being paused
     clean = True # All GPIO settings have either been cleared or not instantiated
+    stopping = False # Set by an emergency stop; no further edges are output
+                     # until the motors are resumed
+    events = None # Queue of emergency stops for the user interface; see watch()
+    wake = None # threading.Event set whenever the motors are resumed, stopped
+                # or emergency stopped; see waitResume()
+    paused = None # threading.Event set by the motor thread once it has stopped
+                  # outputting edges and is waiting to be resumed
     current_time = 0.0
+    spin_margin = 100000 # Nanoseconds before a deadline at which the thread
+                         # stops sleeping and spins
+    idle_poll = 1000000 # Nanoseconds between checks of a stopped motor
+    resync_limit = 5000000 # Nanoseconds behind schedule after which a motor's
+                           # deadlines are restarted from the current time
+    late_fraction = 0.5 # Fraction of its interval an edge may be behind
+                        # schedule before it is counted in missed_deadlines; a
+                        # fixed limit would count nearly every edge of a fast
+                        # motor and almost none of a slow one
+    sink = None # WaveformSink used in waveform mode; None to bit-bang the pins
+    moves = None # MoveQueue of coordinated moves; see queueMove()
+    encoders = [] # QuadratureEncoder for each motor, or None; see setEncoders()
+    stall_limits = [] # (Encoder counts per pulse, stall threshold in pulses)
+                      # for each motor with an encoder
+    microstep_pins = [] # BCM microstep pins of every motor; see StepPlanner
+    checker = None # Thread running checkStalls()
+    stall_check = 0.02 # Seconds between checks for stalled motors
+    profiler = None # EdgeProfiler recording every edge, or None
+    switch_interval = None # Seconds the interpreter lets a thread run before
+                           # switching; None for a hundredth of the default
+    waveform_chunk = 20000 # Microseconds of output in each waveform buffer
+    waveform_buffers = 3 # Buffers kept queued ahead of the output
+    active_ramps = [] # Ramp each motor is following; see nextInterval()
 
     # Called when the class is created
-    def __init__(self):
+    def __init__(self, sink=None):
         global PUL
         global DIR
         global stepper
 
-        switch_interval = sys.getswitchinterval() / 100.0
-        sys.setswitchinterval(switch_interval)
+        sys.setswitchinterval(self.switch_interval
+            or sys.getswitchinterval() / 100.0)
 
-        self.thread = threading.Thread(target=self.runMotors)
+        self.sink = sink
+        self.events = queue.Queue()
+        self.wake = threading.Event()
+        self.paused = threading.Event()
+        self.moves = MoveQueue()
+        self.thread = threading.Thread(target=(self.runMotors if sink is None
+            else self.runWaveforms))
         self.thread.daemon = True # If the program is closed forcefully,
                                   # the thread will also close
         self.thread.start()
 
-    # The procedure which actually controls the motors
+    # The procedure which actually controls the motors. Each motor has its next
+    # edge deadline (in perf_counter_ns() nanoseconds) held in a min-heap; the
+    # thread sleeps until shortly before the earliest deadline, spins for the
+    # remainder and then toggles that motor's PUL pin
     def runMotors(self):
         global run
         global delay
@@ -1160,47 +2624,447 @@ class GPIOHandler:
         global all_operating
         global rpm_0
         global clean
+        global microstep_set
+        global microstep_clear
+        global microstep_pending
+
+        deadlines = []
+        gpio_high = array("B")
+        dir_high = []
 
-        resolution = 0.00001 # Seconds between step increment
-        steps = [0, 0, 0]
-        gpio_high = [False, False, False]
-        
         while self.run:
-            if not self.clean and self.all_operating:
-                for i in range(len(PUL)):
-                    GPIO.output(PUL[i], GPIO.HIGH if gpio_high[i] and operating[i]
-                        and not rpm_0[i] else GPIO.LOW)
-                    GPIO.output(DIR[i], GPIO.LOW if dirs[i] else GPIO.HIGH)
-                    
+            if self.clean or not self.all_operating or self.stopping:
+                deadlines = []
+                if self.moves:
+                    self.moves.clear() # Stopping the motors abandons moves
+                self.waitResume()
+                continue
+
+            if self.moves:
+                # Coordinated moves take over from the motors' own speeds until
+                # they are finished; see queueMove()
+                high_mask = 0
+                for i in range(len(gpio_high)):
+                    if gpio_high[i]:
+                        high_mask |= 1 << PUL[i]
+                # Microstep switches still waiting are made before the move
+                set_mask = 0
+                clear_mask = high_mask
+                for i in range(len(microstep_pending)):
+                    if microstep_pending[i]:
+                        microstep_pending[i] = 0
+                        set_mask |= microstep_set[i]
+                        clear_mask |= microstep_clear[i]
+                if set_mask or clear_mask:
+                    gpio.outputMasks(set_mask, clear_mask)
+                self.runMoves()
+                deadlines = []
+                continue
+
+            if not deadlines:
+                # Motors have just been (re)started; every motor is due now
+                start = perf_counter_ns()
+                gpio_high = array("B", [0]) * len(PUL)
+                dir_high = [None] * len(PUL)
+                deadlines = [(start, i) for i in range(len(PUL))]
+                heapq.heapify(deadlines)
+                self.resetRamps()
+
+            deadline, i = deadlines[0]
+            wait = deadline - perf_counter_ns()
+
+            if wait > self.spin_margin:
+                # sleep() overshoots by tens of microseconds, so wake early and
+                # spin for the final stretch; re-check the heap on waking in
+                # case the motors were paused in the meantime
+                sleep((wait - self.spin_margin) / 1e9)
+                continue
+
+            now = perf_counter_ns()
+            while now < deadline:
+                now = perf_counter_ns()
+
+            # Every motor due by now is handled together, so that coinciding
+            # edges go out in one write, and only pins which change are written
+            due = []
+            while deadlines and deadlines[0][0] <= now:
+                due.append(heapq.heappop(deadlines))
+            set_mask = 0
+            clear_mask = 0
+            dir_set_mask = 0
+            dir_clear_mask = 0
+            profiler = self.profiler
+            stepped = [] if profiler is not None else None
+            rising = [] # Motors whose steps are counted once their edges are
+                        # output
+            front = telemetry_front[0] * len(PUL)
+
+            for deadline, i in due:
+                interval = self.nextInterval(i) if operating[i] else 0
+                if microstep_pending[i]:
+                    # Written with the DIR pins, ahead of this edge; see
+                    # switchMicrosteps()
+                    microstep_pending[i] = 0
+                    dir_set_mask |= microstep_set[i]
+                    dir_clear_mask |= microstep_clear[i]
+
+                if interval:
+                    gpio_high[i] = not gpio_high[i]
+                    if gpio_high[i]:
+                        set_mask |= 1 << PUL[i]
+                        rising.append(i)
+                    else:
+                        clear_mask |= 1 << PUL[i]
+                    late = now - deadline
+                    if late > interval * self.late_fraction:
+                        missed_deadlines[i] += 1
+                    if late > late_peak[front + i]:
+                        late_peak[front + i] = late
+                    if stepped is not None:
+                        stepped.append((i, deadline))
+                    # Scheduled from the previous deadline rather than from now,
+                    # so lateness on one edge does not accumulate into the
+                    # pulse rate
+                    next_deadline = deadline + interval
+                    if next_deadline < now - self.resync_limit:
+                        next_deadline = now
+                else:
+                    if gpio_high[i]:
+                        gpio_high[i] = False
+                        clear_mask |= 1 << PUL[i]
+                    current_interval[i] = 0
+                    next_deadline = now + self.idle_poll
+
+                dir_level = not dirs[i]
+                if dir_level != dir_high[i]:
+                    if dir_high[i] is not None:
+                        direction_changes[i] += 1
+                    dir_high[i] = dir_level
+                    if dir_level:
+                        dir_set_mask |= 1 << DIR[i]
+                    else:
+                        dir_clear_mask |= 1 << DIR[i]
+
+                heapq.heappush(deadlines, (next_deadline, i))
+
+            if self.stopping:
+                continue # emergency() has already driven the PUL pins low
+            if dir_set_mask or dir_clear_mask:
+                # Written ahead of the pulses, so that the controllers see the
+                # new direction before the next step
+                gpio.outputMasks(dir_set_mask, dir_clear_mask)
+            if set_mask or clear_mask:
+                gpio.outputMasks(set_mask, clear_mask)
+                if self.stopping:
+                    # The emergency stop came in whilst these edges were output
+                    gpio.outputMasks(0, set_mask)
+                for i in rising:
                     steps[i] += 1
-                    if round(delay[i] / resolution) <= steps[i]:
-                        gpio_high[i] = not gpio_high[i]
-                        steps[i] = 0
+                    position[i] += 1 if dirs[i] else -1
+                if stepped:
+                    actual = perf_counter_ns()
+                    for i, deadline in stepped:
+                        profiler.record(i, deadline, actual)
+
+    # Outputs the edges of the queued coordinated moves until the queue is
+    # empty or the motors are paused, spinning up to each edge as runMotors()
+    # does
+    def runMoves(self):
+        global PUL
+
+        deadline = perf_counter_ns()
+        for set_mask, clear_mask, interval in self.moves.edges():
+            if self.clean or not self.all_operating or self.stopping:
+                break
+            wait = deadline - perf_counter_ns()
+            if wait > self.spin_margin:
+                sleep((wait - self.spin_margin) / 1e9)
+            now = perf_counter_ns()
+            while now < deadline:
+                now = perf_counter_ns()
+            if self.stopping:
+                break # emergency() has already driven the PUL pins low
+            gpio.outputMasks(set_mask, clear_mask)
+            deadline += interval
+            if deadline < now - self.resync_limit:
+                deadline = now
+
+        pul_mask = 0
+        for i in range(len(PUL)):
+            pul_mask |= 1 << PUL[i]
+        if not self.clean:
+            gpio.outputMasks(0, pul_mask)
+
+    # Queues a coordinated move of deltas steps (one per motor, negative for
+    # anticlockwise) at rate steps per second for the motor with the most
+    # steps, which accelerates at acceleration steps per second squared; see
+    # MoveQueue. Whilst moves are queued, they take the place of the speeds
+    # set for each motor, so those are best set to 0 first. Moves can only be
+    # queued whilst the motors are running, and are not supported in waveform
+    # mode; returns whether the move was queued
+    def queueMove(self, deltas, rate, acceleration=0.0):
+        if (self.sink is not None or self.clean or not self.all_operating
+            or self.stopping):
+            return False
+        self.moves.add(deltas, rate, acceleration)
+        return True
+
+    # Blocks the motor thread whilst the motors are paused, rather than polling,
+    # until resumeThreads(), stopThreads() or emergency() sets wake. wake is
+    # cleared before the state is checked again, so that one set between the
+    # check and the wait is not lost
+    def waitResume(self):
+        self.wake.clear()
+        if self.run and (self.clean or not self.all_operating or self.stopping):
+            self.paused.set()
+            self.wake.wait()
+
+    # Returns the number of nanoseconds until motor i's next edge, following
+    # its ramp, or 0 if the motor should be stationary
+    def nextInterval(self, i):
+        global ramps
+        global current_interval
+        global delay
+        global rpm_0
+        global ramp_pending
+        global microstep_set
+        global microstep_clear
+        global microstep_pending
+
+        if ramp_pending[i]:
+            # Holds the current speed until the ramp to the new one arrives
+            return current_interval[i]
+
+        ramp = ramps[i]
+        if ramp is None:
+            # Only set directly, with no ramp, when simulated
+            interval = 0 if rpm_0[i] else int(delay[i] * 1e9)
+        else:
+            if ramp is not self.active_ramps[i]:
+                # A new ramp has been set since the last edge; it starts from
+                # the speed the motor is actually at
+                self.active_ramps[i] = ramp
+                ramp.start(current_interval[i])
+                if ramp.set_mask or ramp.clear_mask:
+                    microstep_set[i] = ramp.set_mask
+                    microstep_clear[i] = ramp.clear_mask
+                    microstep_pending[i] = 1
+            interval = ramp.next() or ramp.to_interval
+        current_interval[i] = interval
+        return interval
+
+    def resetRamps(self):
+        global PUL
+
+        self.active_ramps = [None] * len(PUL)
+
+    # The waveform mode equivalent of runMotors(); rather than toggling pins
+    # itself, the thread keeps the sink supplied with precomputed buffers
+    def runWaveforms(self):
+        global PUL
+        global all_operating
+        global clean
+
+        sending = False
+        levels = []
+        dir_levels = []
+        next_edges = []
+
+        while self.run:
+            if self.clean or not self.all_operating:
+                if sending:
+                    self.sink.stop()
+                    sending = False
+                self.waitResume()
+                continue
+
+            if not sending:
+                levels = [False] * len(PUL)
+                dir_levels = [None] * len(PUL)
+                next_edges = [0.0] * len(PUL)
+                self.resetRamps()
+                sending = True
+
+            if self.sink.queued() >= self.waveform_buffers:
+                sleep(self.waveform_chunk / 4e6)
+                continue
+
+            pulses = self.buildWaveform(levels, dir_levels, next_edges)
+            if self.stopping:
+                continue
+            for k in range(0, len(pulses), self.sink.max_pulses):
+                self.sink.send(pulses[k:k + self.sink.max_pulses])
+
+    # Generates the next waveform_chunk microseconds of output for all motors.
+    # levels, dir_levels and next_edges hold each motor's PUL level, DIR level
+    # and next edge time (relative to the start of this chunk) and are updated
+    # so that the following chunk carries on seamlessly from this one
+    def buildWaveform(self, levels, dir_levels, next_edges):
+        global delay
+        global PUL
+        global DIR
+        global operating
+        global dirs
+        global rpm_0
 
-                sleep(resolution)
+        chunk = self.waveform_chunk
+        edges = {} # Microsecond offset: [set_mask, clear_mask]
 
+        for i in range(len(PUL)):
+            dir_level = not dirs[i]
+            if dir_level != dir_levels[i]:
+                edges.setdefault(0, [0, 0])[0 if dir_level else 1] |= 1 << DIR[i]
+                if dir_levels[i] is not None:
+                    direction_changes[i] += 1
+                dir_levels[i] = dir_level
+
+            if operating[i]:
+                t = next_edges[i]
+                while t < chunk:
+                    interval = self.nextInterval(i)
+                    if not interval:
+                        # Stopped; checked again at the start of the next chunk
+                        if levels[i]:
+                            edges.setdefault(int(t), [0, 0])[1] |= 1 << PUL[i]
+                            levels[i] = False
+                        t = chunk
+                        break
+                    levels[i] = not levels[i]
+                    edges.setdefault(int(t), [0, 0])[0 if levels[i]
+                        else 1] |= 1 << PUL[i]
+                    if levels[i]:
+                        steps[i] += 1
+                        position[i] += 1 if dirs[i] else -1
+                    t += interval * 0.001
+                next_edges[i] = t - chunk
             else:
-                steps = [0, 0, 0]
-                sleep(0.0001)
+                if levels[i]:
+                    edges.setdefault(0, [0, 0])[1] |= 1 << PUL[i]
+                    levels[i] = False
+                current_interval[i] = 0
+                next_edges[i] = 0.0
+
+        times = sorted(edges)
+        pulses = []
+        if not times or times[0] > 0:
+            pulses.append((0, 0, times[0] if times else chunk))
+        for k in range(len(times)):
+            end = times[k + 1] if k + 1 < len(times) else chunk
+            pulses.append((edges[times[k]][0], edges[times[k]][1],
+                end - times[k]))
+        return pulses
 
     # Called whenever the state of the emergency stop pin changes; this allows
-    # the use of either a PTM or a PTB switch
+    # the use of either a PTM or a PTB switch. It runs on the GPIO library's
+    # callback thread, so rather than pausing (and waiting for) the motor
+    # thread, it drives the PUL pins low itself and leaves the user interface
+    # to stop the motors properly once it has been told
     def emergency(self, e):
         global clean
-        global app
+        global stopping
+        global PUL
+        global current_interval
+
+        if not self.clean and not self.stopping:
+            self.stopping = True
+            self.all_operating = False
+            pul_mask = 0
+            for i in range(len(PUL)):
+                pul_mask |= 1 << PUL[i]
+                current_interval[i] = 0
+            gpio.outputMasks(0, pul_mask)
+            if self.sink is not None:
+                self.sink.stop()
+            self.wake.set()
+            self.notifyEmergency()
+
+    # Tells the user interface that the emergency stop has been pressed; see
+    # watch()
+    def notifyEmergency(self):
+        self.events.put("emergency")
+
+    # Returns True, once, if the emergency stop has been pressed since the
+    # last call
+    def emergencyPending(self):
+        pending = False
+        try:
+            while True:
+                self.events.get_nowait()
+                pending = True
+        except queue.Empty:
+            pass
+        return pending
+
+    # Passes emergency stops and stalls on to the Tk main loop, so that Tk is
+    # only ever called from the thread running it
+    def watch(self, window, interval=50):
+        if self.emergencyPending() and window.started:
+            window.startPressed()
+        if window.started:
+            window.showStalls()
+        window.after(interval, self.watch, window, interval)
+
+    # Sets each motor's encoder from a list of encoderConfig() results, None
+    # for a motor without one; they are attached when the motors are resumed
+    def setEncoders(self, configs):
+        self.encoders = [None if configs[i] is None else QuadratureEncoder(i,
+            configs[i][0], configs[i][1]) for i in range(len(configs))]
+        self.stall_limits = [None if config is None else config[2:]
+            for config in configs]
+
+    # Sets the BCM pins driving the motors' microstep pins, which are set up
+    # as outputs when the motors are resumed
+    def setMicrostepPins(self, pins):
+        self.microstep_pins = list(pins)
+
+    # Runs in its own thread once any motor has an encoder. Whilst a motor is
+    # enabled, the pulses it has been sent since it was enabled are compared
+    # with the counts from its encoder over the same time; if they differ by
+    # more than its stall threshold, the motor is stopped and flagged in
+    # stalled for the user interface
+    def checkStalls(self):
+        global all_operating
+        global operating
+        global current_interval
+        global position
+        global encoder_counts
+        global stalled
 
-        if not self.clean:
-            self.pauseThreads()
-            app.startPressed()
+        base_position = array("q", [0]) * len(position)
+        base_count = array("q", [0]) * len(position)
+        while self.run:
+            sleep(self.stall_check)
+            for i in range(len(self.encoders)):
+                encoder = self.encoders[i]
+                if encoder is None:
+                    continue
+                if not (self.all_operating and operating[i]) or stalled[i]:
+                    if stalled[i] == 2 and operating[i]:
+                        stalled[i] = 0 # Enabled again since it was shown
+                    base_position[i] = position[i]
+                    base_count[i] = encoder_counts[i]
+                    continue
+                counts_pulse, limit = self.stall_limits[i]
+                error = (position[i] - base_position[i]
+                    - (encoder_counts[i] - base_count[i]) / counts_pulse)
+                if abs(error) > limit:
+                    operating[i] = 0
+                    stalled[i] = 1
 
     # Called whenever the motors need to be stopped, but the program does not
     # need to exit
     def pauseThreads(self):
         global all_operating
         global clean
+        global current_interval
 
         self.all_operating = False
-        sleep(0.25)
+        # Returns as soon as the motor thread has stopped, rather than holding
+        # up the user interface; it can only be longer if the thread is asleep
+        # until the edge of a very slow motor
+        self.paused.wait(0.25)
+        for i in range(len(current_interval)):
+            current_interval[i] = 0
         # self.cleanPins() called to prevent errors if the program is exited
         # after this procedure is called
         self.cleanPins()
@@ -1212,18 +3076,36 @@ class GPIOHandler:
         global DIR
         global EMER
         global clean
-
-        GPIO.setmode(GPIO.BCM)
+        global stopping
+        global stalled
 
         for i in range(len(PUL)):
-            GPIO.setup(PUL[i], GPIO.OUT)
-            GPIO.setup(DIR[i], GPIO.OUT)
-
-        GPIO.setup(EMER, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        GPIO.add_event_detect(EMER, GPIO.BOTH, callback=self.emergency)
-
+            gpio.setupOutput(PUL[i])
+            gpio.setupOutput(DIR[i])
+            if self.sink is not None:
+                self.sink.setupOutput(PUL[i])
+                self.sink.setupOutput(DIR[i])
+
+        for pin in self.microstep_pins:
+            gpio.setupOutput(pin)
+
+        gpio.setupInput(EMER, pull_up=True)
+        gpio.addEdgeDetect(EMER, self.emergency)
+
+        for i in range(len(self.encoders)):
+            if self.encoders[i] is not None:
+                self.encoders[i].attach()
+                stalled[i] = 0
+        if self.checker is None and any(self.encoders):
+            self.checker = threading.Thread(target=self.checkStalls)
+            self.checker.daemon = True
+            self.checker.start()
+
+        self.stopping = False
+        self.paused.clear()
         self.all_operating = True
         self.clean = False
+        self.wake.set()
 
     # Called whenever the program is exiting; it stops the loops in the threads
     # and cleans up the GPIO settings
@@ -1232,51 +3114,1719 @@ class GPIOHandler:
         global clean
 
         self.run = False # Allows threads to exit themselves before GPIO cleanup
+        self.wake.set()
         sleep(0.25)
+        if self.sink is not None:
+            self.sink.close()
         self.cleanPins()
 
     def cleanPins(self):
         global clean
 
         if not self.clean:
-            GPIO.cleanup()
+            gpio.cleanup()
             self.clean = True
 
-def updateVersion():
-    global version
-    global url_main
+# Returns a copy of the per-motor counters, each as a list indexed by motor.
+# The counters are only written by the motor thread (or engine process), and
+# each is copied whole, so no lock is taken; rate is the pulses per second the
+# user interface has asked each motor for, and ramp_rate the pulses per second
+# it is currently ramping through. With history, rate_history holds each
+# motor's (time, pulses per second) samples from step_rate_monitor, oldest
+# first, with times in the same nanoseconds as time
+def telemetrySnapshot(history=False):
+    global delay
+    global operating
+    global rpm_0
+    global current_interval
+    global step_rate_monitor
+
+    rate = []
+    ramp_rate = []
+    for i in range(len(delay)):
+        running = operating[i] and not rpm_0[i] and delay[i] > 0
+        rate.append(0.5 / delay[i] if running else 0.0)
+        ramp_rate.append(5e8 / current_interval[i] if current_interval[i]
+            else 0.0)
+
+    snapshot = {
+        "time" : perf_counter_ns(),
+        "steps" : list(steps),
+        "position" : list(position),
+        "direction_changes" : list(direction_changes),
+        "missed_deadlines" : list(missed_deadlines),
+        "encoder_counts" : list(encoder_counts),
+        "stalled" : [flag != 0 for flag in stalled],
+        "rate" : rate,
+        "ramp_rate" : ramp_rate
+    }
+    if history:
+        monitor = step_rate_monitor
+        snapshot["rate_history"] = ([monitor.series(i)
+            for i in range(monitor.motor_count)] if monitor is not None
+            else [[] for i in range(len(delay))])
+    return snapshot
+
+# Returns the latest (ns) each motor's edges have been output since the last
+# call. The motor loop records into one half of late_peak whilst this reads
+# and clears the other, so neither takes a lock; an edge output just as the
+# halves are swapped may be counted a window late
+def swapLatePeaks():
+    global late_peak
+    global telemetry_front
+
+    motor_count = len(late_peak) // 2
+    back = telemetry_front[0] * motor_count
+    telemetry_front[0] = 1 - telemetry_front[0]
+    peaks = [late_peak[back + i] for i in range(motor_count)]
+    for i in range(motor_count):
+        late_peak[back + i] = 0
+    return peaks
+
+# Works out the text of each motor's label in MainWindow's status strip: the
+# RPM achieved since the last update, the pulses sent, and the latest any
+# edge was output since the last update. update() returns only the labels
+# whose text has changed, so that the rest are not redrawn
+class StatusStrip:
+    def __init__(self, motor_count):
+        self.texts = [""] * motor_count
+        self.last_time = 0
+        self.last_steps = None
+
+    # pulses_revolution is a list of each motor's pulses per revolution;
+    # returns a list of (motor index, text)
+    def update(self, pulses_revolution):
+        counts = list(steps)
+        now = perf_counter_ns()
+        peaks = swapLatePeaks()
+
+        changed = []
+        for i in range(len(self.texts)):
+            rpm = 0.0
+            if (self.last_steps is not None and now > self.last_time
+            and pulses_revolution[i]):
+                rpm = ((counts[i] - self.last_steps[i]) * 60e9 / ((now
+                    - self.last_time) * pulses_revolution[i]))
+            text = "{0:6.1f} RPM {1:>9} STEPS {2:>7.0f} us LATE".format(rpm,
+                counts[i], peaks[i] / 1000.0)
+            if text != self.texts[i]:
+                self.texts[i] = text
+                changed.append((i, text))
+
+        self.last_time = now
+        self.last_steps = counts
+        return changed
+
+# Keeps the achieved step rate of every motor, in pulses per second, for the
+# last capacity calls of sample() in a ring buffer
+class StepRateMonitor:
+    interval = 0.1 # Seconds between the samples taken by start()
+    sampling = False
+    thread = None
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.motor_count = len(steps)
+        self.times = array("q", bytes(8 * capacity)) # perf_counter_ns()
+        self.rates = array("d", bytes(8 * capacity * self.motor_count)) # Row
+                                                    # of motor_count per sample
+        self.count = 0 # Number of samples taken, including any overwritten
+        self.last_time = 0
+        self.last_steps = None
+
+    # Records the rate of each motor since the previous call
+    def sample(self):
+        now = perf_counter_ns()
+        counts = list(steps)
+
+        if self.last_steps is not None and now > self.last_time:
+            elapsed = (now - self.last_time) / 1e9
+            slot = self.count % self.capacity
+            row = slot * self.motor_count
+            self.times[slot] = now
+            for i in range(self.motor_count):
+                self.rates[row + i] = (counts[i] - self.last_steps[i]) / elapsed
+            self.count += 1
+
+        self.last_time = now
+        self.last_steps = counts
+
+    # Returns motor i's (time, pulses per second) samples, oldest first
+    def series(self, i):
+        first = max(0, self.count - self.capacity)
+        return [(self.times[k % self.capacity],
+            self.rates[(k % self.capacity) * self.motor_count + i])
+            for k in range(first, self.count)]
+
+    # Takes a sample every interval seconds in a thread of its own until
+    # stop(); the counters are read without a lock, as telemetrySnapshot()
+    # reads them
+    def start(self):
+        self.sampling = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while self.sampling:
+            self.sample()
+            sleep(self.interval)
+
+    def stop(self):
+        self.sampling = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+# Starts a new StepRateMonitor as step_rate_monitor, stopping any still running;
+# called whenever the motors are started
+def startStepRateMonitor():
+    global step_rate_monitor
+
+    stopStepRateMonitor()
+    step_rate_monitor = StepRateMonitor()
+    step_rate_monitor.start()
+
+# Stops step_rate_monitor sampling, keeping its samples for telemetrySnapshot()
+def stopStepRateMonitor():
+    global step_rate_monitor
+
+    if step_rate_monitor is not None:
+        step_rate_monitor.stop()
+
+# Shared memory command/status block through which the user interface and
+# an EngineProcess exchange the motor state. attach() points the module-level
+# motor lists at the shared arrays, so both processes read and write them as
+# they would in a single process. context is the multiprocessing context the
+# arrays are made in; None for the default
+class SharedBlock:
+    def __init__(self, motor_count, context=None):
+        if context is None:
+            import multiprocessing as context
+
+        self.PUL = context.RawArray("i", motor_count)
+        self.DIR = context.RawArray("i", motor_count)
+        self.delay = context.RawArray("d", motor_count)
+        self.dirs = context.RawArray("B", motor_count)
+        self.operating = context.RawArray("B", motor_count)
+        self.rpm_0 = context.RawArray("B", motor_count)
+        self.current_interval = context.RawArray("q", motor_count)
+        self.ramp_pending = context.RawArray("B", motor_count)
+        self.steps = context.RawArray("Q", motor_count)
+        self.position = context.RawArray("q", motor_count)
+        self.direction_changes = context.RawArray("Q", motor_count)
+        self.missed_deadlines = context.RawArray("Q", motor_count)
+        self.encoder_counts = context.RawArray("q", motor_count)
+        self.stalled = context.RawArray("B", motor_count)
+        self.late_peak = context.RawArray("q", 2 * motor_count)
+        self.telemetry_front = context.RawArray("B", 1)
+        self.microstep_set = context.RawArray("Q", motor_count)
+        self.microstep_clear = context.RawArray("Q", motor_count)
+        self.microstep_pending = context.RawArray("B", motor_count)
+        self.emergency = context.RawValue("B", 0) # Set by the engine process
+                                                  # on an emergency stop
+        self.realtime = context.RawValue("B", 0) # Set if SCHED_FIFO was granted
+
+    def attach(self):
+        global PUL
+        global DIR
+        global delay
+        global dirs
+        global operating
+        global rpm_0
+        global current_interval
+        global ramp_pending
+        global steps
+        global position
+        global direction_changes
+        global missed_deadlines
+        global encoder_counts
+        global stalled
+        global late_peak
+        global telemetry_front
+        global microstep_set
+        global microstep_clear
+        global microstep_pending
+
+        PUL = self.PUL
+        DIR = self.DIR
+        delay = self.delay
+        dirs = self.dirs
+        operating = self.operating
+        rpm_0 = self.rpm_0
+        current_interval = self.current_interval
+        ramp_pending = self.ramp_pending
+        steps = self.steps
+        position = self.position
+        direction_changes = self.direction_changes
+        missed_deadlines = self.missed_deadlines
+        encoder_counts = self.encoder_counts
+        stalled = self.stalled
+        late_peak = self.late_peak
+        telemetry_front = self.telemetry_front
+        microstep_set = self.microstep_set
+        microstep_clear = self.microstep_clear
+        microstep_pending = self.microstep_pending
+
+# Stands in for the ramps list in the user interface process; the shared
+# block cannot hold ramps, so they are sent to the engine process through its
+# command pipe and the motor holds its speed until they arrive
+class RampForwarder:
+    def __init__(self, connection, motor_count):
+        self.connection = connection
+        self.motor_count = motor_count
+
+    def __len__(self):
+        return self.motor_count
+
+    def __getitem__(self, i):
+        return None
+
+    def __setitem__(self, i, ramp):
+        ramp_pending[i] = 1
+        self.connection.send(("ramp", i, ramp))
+
+# Runs in the engine process. It takes the same commands as GPIOHandler, so
+# that EngineProcess can be used in its place by the user interface
+def runEngineProcess(block, connection, backend_name, sink_name, waveform_file,
+cpu, priority):
+    global gpio
+    global ramps
+    global EMER
+
+    if cpu is not None:
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except (AttributeError, OSError):
+            pass
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            block.realtime.value = 1
+        except (AttributeError, OSError):
+            pass # Needs CAP_SYS_NICE; the process still runs, just unprioritised
+
+    block.attach()
+    ramps = [None] * len(block.PUL)
+    gpio = gpio_backends[backend_name]()
+    handler = GPIOHandler(makeSink(sink_name, waveform_file))
+
+    def notifyEmergency():
+        block.emergency.value = 1
+    handler.notifyEmergency = notifyEmergency
+
+    while True:
+        command = connection.recv()
+        if command[0] == "ramp":
+            ramps[command[1]] = command[2]
+            ramp_pending[command[1]] = 0
+        elif command[0] == "move":
+            handler.queueMove(*command[1:])
+        elif command[0] == "encoders":
+            handler.setEncoders(command[1])
+        elif command[0] == "microsteps":
+            handler.setMicrostepPins(command[1])
+        elif command[0] == "resume":
+            EMER = command[1]
+            handler.resumeThreads()
+        elif command[0] == "pause":
+            handler.pauseThreads()
+            connection.send("paused")
+        elif command[0] == "edges":
+            # Only for RecordingBackend, so that the edges recorded in this
+            # process can be checked
+            connection.send({pin : gpio.edgeTimes(pin) for pin in command[1]})
+        elif command[0] == "stop":
+            handler.stopThreads()
+            connection.send("stopped")
+            break
+
+# Runs the GPIO handler in a separate process, optionally pinned to one CPU
+# and scheduled SCHED_FIFO, so that pulse output never waits on the Tk main
+# loop for the GIL. Target speeds, directions, enable flags and step counts
+# are exchanged through a SharedBlock; start/stop commands and ramps go
+# through a pipe.
+# Experimental, and only used with --engine-process: on the hardware measured
+# so far (one CPU), it has shown no better p99 jitter than the thread, so
+# GPIOHandler stays the default until a gain is shown with the
+# process on a CPU of its own
+class EngineProcess:
+    def __init__(self, motor_count, backend_name, sink_name=None,
+    waveform_file=None, cpu=None, priority=0):
+        global ramps
+
+        import multiprocessing
+
+        # A fresh interpreter, rather than a fork of one which may hold Tk
+        context = multiprocessing.get_context("spawn")
+        self.block = SharedBlock(motor_count, context)
+        self.block.attach()
+        self.connection, child_connection = context.Pipe()
+        ramps = RampForwarder(self.connection, motor_count)
+
+        self.process = context.Process(target=runEngineProcess,
+            args=(self.block, child_connection, backend_name, sink_name,
+            waveform_file, cpu, priority))
+        self.process.daemon = True
+        self.process.start()
+
+    def resumeThreads(self):
+        global EMER
+
+        self.connection.send(("resume", EMER))
+
+    def setEncoders(self, configs):
+        self.connection.send(("encoders", list(configs)))
+
+    def setMicrostepPins(self, pins):
+        self.connection.send(("microsteps", list(pins)))
+
+    # The engine process queues the move if it can; unlike
+    # GPIOHandler.queueMove(), this does not wait to find out whether it did
+    def queueMove(self, deltas, rate, acceleration=0.0):
+        self.connection.send(("move", list(deltas), rate, acceleration))
+        return True
+
+    def pauseThreads(self):
+        self.connection.send(("pause",))
+        while self.connection.recv() != "paused":
+            pass
+
+    def stopThreads(self):
+        if self.process.is_alive():
+            self.connection.send(("stop",))
+            while self.connection.recv() != "stopped":
+                pass
+        self.process.join(1.0)
+
+    # Returns True, once, if the engine process has had an emergency stop
+    # since the last call
+    def emergencyPending(self):
+        if self.block.emergency.value:
+            self.block.emergency.value = 0
+            return True
+        return False
+
+    # Polls for emergency stops and stalls from the engine process on the Tk
+    # main loop
+    def watch(self, window, interval=50):
+        if self.emergencyPending() and window.started:
+            window.startPressed()
+        if window.started:
+            window.showStalls()
+        window.after(interval, self.watch, window, interval)
+
+def makeSink(sink_name, waveform_file):
+    if sink_name == "pigpio":
+        return PigpioSink()
+    elif sink_name == "file":
+        return FileSink(waveform_file)
+    return None
+
+# Returns the module's motor state and GPIO backend, so that a harness can
+# replace them and put them back afterwards with restoreMotors()
+def saveMotors():
+    return (gpio, motor_names, PUL, DIR, delay, dirs, operating, rpm_0, EMER,
+        ramps, current_interval, ramp_pending, steps, position,
+        direction_changes, missed_deadlines, encoder_counts, stalled, late_peak,
+        telemetry_front, microstep_set, microstep_clear, microstep_pending,
+        sys.getswitchinterval())
+
+def restoreMotors(saved):
+    global gpio
+    global motor_names
+    global PUL
+    global DIR
+    global delay
+    global dirs
+    global operating
+    global rpm_0
+    global EMER
+    global ramps
+    global current_interval
+    global ramp_pending
+    global steps
+    global position
+    global direction_changes
+    global missed_deadlines
+    global encoder_counts
+    global stalled
+    global late_peak
+    global telemetry_front
+    global microstep_set
+    global microstep_clear
+    global microstep_pending
+
+    (gpio, motor_names, PUL, DIR, delay, dirs, operating, rpm_0, EMER, ramps,
+        current_interval, ramp_pending, steps, position, direction_changes,
+        missed_deadlines, encoder_counts, stalled, late_peak, telemetry_front,
+        microstep_set, microstep_clear, microstep_pending,
+        switch_interval) = saved
+    # Each GPIOHandler shortens the switch interval when it is created
+    sys.setswitchinterval(switch_interval)
+
+# Sets up motor_count running motors on a RecordingBackend, motor i with PUL on
+# BCM pin 2 * i + 2, DIR on 2 * i + 3 and edges every half_periods[i] seconds
+def simulateMotors(motor_count, half_periods):
+    global gpio
+    global EMER
+
+    gpio = RecordingBackend()
+    allocateMotors(defaultMotorNames(motor_count))
+    for i in range(motor_count):
+        PUL[i] = 2 * i + 2
+        DIR[i] = 2 * i + 3
+        delay[i] = half_periods[i]
+        operating[i] = 1
+    EMER = 2 * motor_count + 2
+    return gpio
+
+# Yields (seconds, action) for each line of a profile file, one line at a
+# time, so that a profile of any length can be played. Each line is the
+# seconds from the start of playback followed by either "rpm", the motor's
+# name and its RPM, or "move", the steps for every motor separated by commas,
+# the rate and optionally the acceleration (see GPIOHandler.queueMove());
+# actions are ("rpm", motor, rpm) and ("move", steps, rate, acceleration).
+# Anything after a # is ignored. Raises ValueError for a line it cannot read
+def readProfile(filepath):
+    with open(filepath, "r") as profile:
+        number = 0
+        for line in profile:
+            number += 1
+            fields = line.split("#")[0].split()
+            if not fields:
+                continue
+            try:
+                if len(fields) == 4 and fields[1] == "rpm":
+                    action = ("rpm", fields[2], float(fields[3]))
+                elif len(fields) in (4, 5) and fields[1] == "move":
+                    action = ("move", [int(step) for step in
+                        fields[2].split(",")], float(fields[3]),
+                        float(fields[4]) if len(fields) == 5 else 0.0)
+                else:
+                    raise ValueError
+                seconds = float(fields[0])
+            except ValueError:
+                raise ValueError("{0}: line {1} cannot be read".format(
+                    filepath, number))
+            yield seconds, action
+
+# Writes the RPMs and moves the motors are given, as they are given, to a
+# profile file which ProfilePlayer can play back, timed from the first one.
+# An RPM which has not changed since it was last written is left out
+class ProfileRecorder:
+    def __init__(self, filepath):
+        self.file = open(filepath, "w")
+        self.file.write("# seconds rpm motor RPM, or seconds move steps,... "
+            "rate acceleration\n")
+        self.start = None # perf_counter_ns() of the first action
+        self.last_rpm = {} # Motor name: RPM last written
+
+    def seconds(self):
+        now = perf_counter_ns()
+        if self.start is None:
+            self.start = now
+        return (now - self.start) / 1e9
+
+    def recordRpm(self, motor, rpm):
+        if self.last_rpm.get(motor) != rpm:
+            self.last_rpm[motor] = rpm
+            self.file.write("{0:.6f} rpm {1} {2:g}\n".format(self.seconds(),
+                motor, rpm))
+
+    def recordMove(self, deltas, rate, acceleration=0.0):
+        self.file.write("{0:.6f} move {1} {2:g} {3:g}\n".format(self.seconds(),
+            ",".join(str(int(delta)) for delta in deltas), rate, acceleration))
+
+    def close(self):
+        self.file.close()
+
+# Plays a profile file back through a controller with setRpm() and move()
+# methods, i.e. a MainWindow or HeadlessController. A thread reads the file
+# with readProfile() into a queue of at most depth actions, so memory use is
+# the same however long the file is. step() carries out the actions which are
+# due; it is called by run() in a thread of its own, or by watch() on the Tk
+# main loop
+class ProfilePlayer:
+    playing = False
+    poll = 0.05 # Longest wait, in seconds, between calls of step()
+    error = "" # Why playback stopped early, if it did
+
+    def __init__(self, filepath, controller, depth=1024):
+        self.filepath = filepath
+        self.controller = controller
+        self.depth = depth
+        self.actions = None # Queue of (seconds, action) from the reader,
+                            # ending with None
+        self.reader = None
+        self.pending = None # (seconds, action) taken from actions but not due
+        self.start_time = 0 # perf_counter_ns() when playback started
+        self.applied = 0 # Actions carried out
+        self.late_total = 0 # Nanoseconds after they were due, over them all
+        self.late_max = 0
+
+    def start(self):
+        self.stop()
+        self.actions = queue.Queue(maxsize=self.depth)
+        self.pending = None
+        self.applied = 0
+        self.late_total = 0
+        self.late_max = 0
+        self.error = ""
+        self.playing = True
+        self.start_time = perf_counter_ns()
+        self.reader = threading.Thread(target=self.read)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def stop(self):
+        self.playing = False
+        if self.reader is not None:
+            self.reader.join()
+            self.reader = None
+
+    # Runs in the reader thread; waits whilst the queue is full
+    def read(self):
+        try:
+            for item in readProfile(self.filepath):
+                if not self.offer(item):
+                    return
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+        self.offer(None)
+
+    # Puts item on the queue once there is room; returns False if playback
+    # was stopped first
+    def offer(self, item):
+        while self.playing:
+            try:
+                self.actions.put(item, timeout=self.poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # Carries out every action which is due; returns the seconds until the
+    # next one, or None once playback has finished
+    def step(self):
+        while self.playing:
+            if self.pending is None:
+                try:
+                    self.pending = self.actions.get_nowait()
+                except queue.Empty:
+                    return 0.001 # The reader is behind
+                if self.pending is None:
+                    self.playing = False
+                    break
+            seconds, action = self.pending
+            late = perf_counter_ns() - self.start_time - int(seconds * 1e9)
+            if late < 0:
+                return -late / 1e9
+            try:
+                if action[0] == "rpm":
+                    self.controller.setRpm(action[1], action[2])
+                else:
+                    self.controller.move(*action[1:])
+            except ValueError as e:
+                self.error = str(e)
+                self.playing = False
+                break
+            self.pending = None
+            self.applied += 1
+            self.late_total += late
+            self.late_max = max(self.late_max, late)
+        return None
+
+    def run(self):
+        while True:
+            wait = self.step()
+            if wait is None:
+                return
+            sleep(min(wait, self.poll))
+
+    # Plays on the Tk main loop, so that the window is only changed from the
+    # thread running it
+    def watch(self, window):
+        wait = self.step()
+        if wait is not None:
+            window.after(max(1, int(min(wait, self.poll) * 1000)), self.watch,
+                window)
+        elif self.error:
+            window.createWindow(name="errors", error="Prf")
+
+# Drives the motors from a settings dictionary, as laid out by
+# settingsSchema(), without a user interface; the methods mirror the buttons
+# and keys of MainWindow. Motors are addressed by name or by index
+class HeadlessController:
+    started = False
+    prepared = False # True once prepare() has run, until the motors start
+    started_at = 0 # perf_counter_ns() when the motors were last started
+    player = None # ProfilePlayer started by play()
+    recorder = None # ProfileRecorder writing every RPM change and move, if any
+    planner = None # StepPlanner choosing the motors' intervals, built by
+                   # prepare()
+
+    def __init__(self, settings, handler, pins=None):
+        global motor_names
+
+        self.settings = settings
+        self.handler = handler
+        self.pins = pins if pins is not None else boardPins()
+        self.rpm = [float(settings[name]["rpm"][2] or 0)
+            for name in motor_names]
+        # Held whilst the RPMs, the planner or the recorder are changed, as
+        # play()'s thread and the control server's threads change them at once;
+        # reentrant, as move() and nudge() go through setRpms()
+        self.lock = threading.RLock()
+
+    def motorIndex(self, motor):
+        global motor_names
+
+        if isinstance(motor, int) and 0 <= motor < len(motor_names):
+            return motor
+        if motor in motor_names:
+            return motor_names.index(motor)
+        raise ValueError("Unknown motor {0}".format(motor))
+
+    # Sets up the pins and speeds ready for start(), so that starting itself
+    # takes no time; see NodeCoordinator.start()
+    def prepare(self):
+        global PUL
+        global DIR
+        global EMER
+        global dirs
+        global operating
+        global motor_names
+
+        with self.lock:
+            if self.started or self.prepared:
+                return
+
+            for i in range(len(motor_names)):
+                setting = self.settings[motor_names[i]]
+                for key in ("pulses_revolution", "pul_pin", "dir_pin"):
+                    if setting[key][2] == "":
+                        raise ValueError("{0} has no {1}".format(motor_names[i],
+                            key))
+            if self.settings["emergency"]["stop_pin"][2] == "":
+                raise ValueError("emergency has no stop_pin")
+            self.planner = StepPlanner(self.settings, self.pins)
+            rpms = planSpeeds(self.planner, dict(enumerate(self.rpm)))
+
+            for i in range(len(motor_names)):
+                setting = self.settings[motor_names[i]]
+                PUL[i] = self.pins[int(setting["pul_pin"][2])]
+                DIR[i] = self.pins[int(setting["dir_pin"][2])]
+                switch_dir = ("wrong_direction" in setting
+                    and setting["wrong_direction"][2])
+                dirs[i] = (not setting["direction"][2] if switch_dir
+                    else setting["direction"][2])
+                operating[i] = 1
+                self.rpm[i] = rpms[i]
+
+            EMER = self.pins[int(self.settings["emergency"]["stop_pin"][2])]
+            self.handler.setEncoders([encoderConfig(self.settings[name],
+                self.pins) for name in motor_names])
+            self.handler.setMicrostepPins(self.planner.pins)
+            self.prepared = True
+
+    # Starts the motors, or, if at is given, waits until perf_counter_ns()
+    # reaches at, so that several controllers can be started together
+    def start(self, at=None):
+        if self.started:
+            return
+        self.prepare()
+
+        if at is not None:
+            # sleep() overshoots, so wake early and spin, as runMotors() does
+            wait = at - perf_counter_ns() - GPIOHandler.spin_margin
+            if wait > 0:
+                sleep(wait / 1e9)
+            while perf_counter_ns() < at:
+                pass
+        self.handler.resumeThreads()
+        self.started_at = perf_counter_ns()
+        startStepRateMonitor()
+        self.prepared = False
+        self.started = True
+
+    def stop(self):
+        if self.player is not None:
+            self.player.stop()
+        if self.started:
+            stopStepRateMonitor()
+            self.handler.pauseThreads()
+            self.started = False
+
+    def setRpm(self, motor, rpm):
+        self.setRpms({self.motorIndex(motor) : rpm})
+
+    # Sets the RPM of each motor (by index) in rpms together; raises ValueError,
+    # leaving every RPM as it was, if the motors cannot be sent pulses that
+    # fast
+    def setRpms(self, rpms):
+        global motor_names
+
+        rpms = {index : max(0.0, float(rpms[index])) for index in rpms}
+        with self.lock:
+            if self.started or self.prepared:
+                rpms = planSpeeds(self.planner, rpms)
+            for index in rpms:
+                self.rpm[index] = rpms[index]
+                if self.started and self.recorder is not None:
+                    self.recorder.recordRpm(motor_names[index], rpms[index])
+
+    # Plays a profile file from the start in a thread of its own, replacing
+    # any profile already playing
+    def play(self, filepath):
+        if not self.started:
+            raise ValueError("The motors must be started before playing")
+        if self.player is not None:
+            self.player.stop()
+        self.player = ProfilePlayer(filepath, self)
+        self.player.start()
+        player = threading.Thread(target=self.player.run)
+        player.daemon = True
+        player.start()
+
+    # Changes a motor's RPM by value, or every motor's RPM by value percent
+    # for the motor "all"
+    def nudge(self, motor, value):
+        with self.lock:
+            if motor == "all":
+                self.setRpms({i : self.rpm[i] * (1.0 + float(value) / 100.0)
+                    for i in range(len(self.rpm))})
+            else:
+                index = self.motorIndex(motor)
+                self.setRpm(index, self.rpm[index] + float(value))
+
+    # Queues a coordinated move; see GPIOHandler.queueMove()
+    def move(self, deltas, rate, acceleration=0.0):
+        with self.lock:
+            if not self.started:
+                raise ValueError("The motors must be started before moving")
+            self.planner.checkMove(deltas, float(rate))
+            self.setRpms({i : 0.0 for i in range(len(self.rpm))})
+            if self.recorder is not None:
+                self.recorder.recordMove(deltas, float(rate),
+                    float(acceleration))
+            if not self.handler.queueMove(deltas, float(rate),
+                float(acceleration)):
+                raise ValueError("The move could not be queued")
+
+    def setDirection(self, motor, clockwise):
+        global dirs
+
+        index = self.motorIndex(motor)
+        setting = self.settings[motor_names[index]]
+        setting["direction"][2] = bool(clockwise)
+        switch_dir = ("wrong_direction" in setting
+            and setting["wrong_direction"][2])
+        dirs[index] = not clockwise if switch_dir else bool(clockwise)
+
+    # Returns True, once, if the motors have had an emergency stop since the
+    # last call
+    def emergencyPending(self):
+        return self.handler.emergencyPending()
+
+    # See telemetrySnapshot() for history
+    def status(self, history=False):
+        status = telemetrySnapshot(history)
+        status["started"] = self.started
+        status["rpm"] = list(self.rpm)
+        status["pulses_revolution"] = (self.planner.pulsesRevolution()
+            if self.planner is not None else [])
+        status["playing"] = self.player is not None and self.player.playing
+        status["profile_error"] = self.player.error if self.player else ""
+        return status
+
+# Serves a HeadlessController on a Unix domain socket. Each line sent is a JSON
+# command, e.g. {"id": 1, "cmd": "rpm", "motor": "top", "value": 60}, and is
+# answered by a line {"id": 1, "ok": true} (plus "status" for status), or
+# "ok": false and an "error". The commands are rpm, nudge, direction (value 1
+# for clockwise), move ("steps" for each motor, "rate" and optionally
+# "acceleration"; see GPIOHandler.queueMove()), play ("file", a profile; see
+# readProfile()), start, stop and status ("history" true for the achieved
+# step rates since the motors started; see telemetrySnapshot()). Every
+# complete line received in one read is carried out before the replies are
+# written back together
+class ControlServer:
+    read_size = 65536
+    poll_interval = 0.05 # Seconds between checks for emergency stops
+    server = None
+
+    def __init__(self, controller, socket_path):
+        self.controller = controller
+        self.socket_path = socket_path
+
+    async def serve(self):
+        import asyncio
+
+        if path.exists(self.socket_path):
+            os.remove(self.socket_path) # Left behind by a previous run
+        self.server = await asyncio.start_unix_server(self.handleClient,
+            self.socket_path)
+        try:
+            await self.watchEmergency()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            if path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    async def watchEmergency(self):
+        import asyncio
+
+        while True:
+            if self.controller.emergencyPending():
+                await self.runBlocking(self.controller.stop)
+            await asyncio.sleep(self.poll_interval)
+
+    # Runs function, which may sleep, without holding up other clients
+    async def runBlocking(self, function):
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None,
+            function)
+
+    async def handleClient(self, reader, writer):
+        buffered = b""
+        try:
+            while True:
+                data = await reader.read(self.read_size)
+                if not data:
+                    break
+                lines = (buffered + data).split(b"\n")
+                buffered = lines.pop()
+                replies = []
+                for line in lines:
+                    if line.strip():
+                        replies.append(await self.execute(line))
+                writer.write(b"".join(replies))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def execute(self, line):
+        import json
+
+        controller = self.controller
+        reply = {"id" : None, "ok" : True}
+        try:
+            command = json.loads(line)
+            reply["id"] = command.get("id")
+            cmd = command.get("cmd")
+            if cmd == "rpm":
+                controller.setRpm(command["motor"], command["value"])
+            elif cmd == "nudge":
+                controller.nudge(command["motor"], command["value"])
+            elif cmd == "direction":
+                controller.setDirection(command["motor"], command["value"])
+            elif cmd == "move":
+                controller.move(command["steps"], command["rate"],
+                    command.get("acceleration", 0.0))
+            elif cmd == "play":
+                await self.runBlocking(lambda: controller.play(command["file"]))
+            elif cmd == "start":
+                await self.runBlocking(controller.start)
+            elif cmd == "stop":
+                await self.runBlocking(controller.stop)
+            elif cmd == "status":
+                reply["status"] = controller.status(command.get("history",
+                    False))
+            else:
+                raise ValueError("Unknown command {0}".format(cmd))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            reply["ok"] = False
+            reply["error"] = str(e)
+        return (json.dumps(reply) + "\n").encode()
+
+# Frames of the binary protocol with which a NodeCoordinator drives
+# NodeServers over TCP. A request is a command, a motor (all_motors for every
+# motor on the node), a sequence number, a time in the node's perf_counter_ns()
+# clock and a value. Each is answered, in order, by its sequence number, 0 for
+# success or 1 for failure, the node's clock when it was carried out (or when
+# the motors started, for start) and the length of a payload which follows:
+# the error on failure, or for status, whether the motors are started and then
+# each motor's RPM and position
+node_request = struct.Struct("<BHIqd")
+node_reply = struct.Struct("<IBqH")
+node_motor = struct.Struct("<dq")
+node_commands = {
+    "rpm" : 1,
+    "nudge" : 2, # A percentage for all_motors
+    "direction" : 3, # Value 1 for clockwise
+    "prepare" : 4,
+    "start" : 5, # At the time given, or at once for 0
+    "stop" : 6,
+    "status" : 7,
+    "clock" : 8 # Only answered; see NodeCoordinator.syncClocks()
+}
+all_motors = 0xFFFF
+
+# Returns (host, port) for an address written host:port
+def nodeAddress(text):
+    host, separator, port = text.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError("{0} is not host:port".format(text))
+    return host or "127.0.0.1", int(port)
+
+# Serves a HeadlessController over TCP to a NodeCoordinator, using the binary
+# protocol of node_request and node_reply rather than a ControlServer's JSON
+# lines. Emergency stops are handled on the node, as they are by a
+# ControlServer
+class NodeServer(ControlServer):
+    def __init__(self, controller, address):
+        self.controller = controller
+        self.address = address
+
+    async def serve(self):
+        import asyncio
+
+        self.server = await asyncio.start_server(self.handleClient,
+            *self.address)
+        try:
+            await self.watchEmergency()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # The port listened on, chosen by the system if the address gave port 0
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handleClient(self, reader, writer):
+        import asyncio
+
+        try:
+            while True:
+                request = await reader.readexactly(node_request.size)
+                writer.write(await self.execute(request))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def execute(self, request):
+        controller = self.controller
+        command, motor, sequence, at, value = node_request.unpack(request)
+        failed = 0
+        payload = b""
+        try:
+            if command == node_commands["rpm"]:
+                controller.setRpm(motor, value)
+            elif command == node_commands["nudge"]:
+                controller.nudge("all" if motor == all_motors else motor, value)
+            elif command == node_commands["direction"]:
+                controller.setDirection(motor, value != 0)
+            elif command == node_commands["prepare"]:
+                await self.runBlocking(controller.prepare)
+            elif command == node_commands["start"]:
+                await self.runBlocking(lambda: controller.start(at or None))
+            elif command == node_commands["stop"]:
+                await self.runBlocking(controller.stop)
+            elif command == node_commands["status"]:
+                status = controller.status()
+                payload = bytes([controller.started]) + b"".join(
+                    node_motor.pack(rpm, position) for rpm, position
+                    in zip(status["rpm"], status["position"]))
+            elif command != node_commands["clock"]:
+                raise ValueError("Unknown command {0}".format(command))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            failed = 1
+            payload = str(e).encode()[:0xFFFF]
+        time = (controller.started_at if command == node_commands["start"]
+            and not failed else perf_counter_ns())
+        return node_reply.pack(sequence, failed, time, len(payload)) + payload
+
+# Drives the motors of several NodeServers, usually on other machines, as one
+# HeadlessController would, so that a ControlServer or a profile can drive
+# them all. Motors are numbered across the nodes, in the order the nodes are
+# given. A command for every node is sent to them all before any reply is
+# read, so the last node has it about as soon as the first. To start, every
+# node is first prepared, then each node's clock offset is measured from timed
+# round trips and every node is asked to start at the same moment in its own
+# clock
+class NodeCoordinator:
+    timeout = 5.0 # Seconds allowed for connecting and for each reply
+    clock_samples = 16 # Round trips timed to find each node's clock offset
+    start_lead = 0.02 # Seconds from a synchronised start being sent to the
+                      # motors starting; must cover sending it to every node
+    started = False
+    player = None # ProfilePlayer started by play()
+
+    def __init__(self, addresses):
+        import socket
+
+        self.nodes = [] # Socket connected to each node
+        self.sequences = [] # Sequence number of each node's next request
+        self.offsets = [] # Each node's clock less this one's, in nanoseconds
+        self.motors = [] # (Node, motor on that node) for each motor
+        self.start_late = [] # Nanoseconds after the time asked for that each
+                             # node's motors started, at the last start
+        self.lock = threading.Lock() # Held whilst waiting for replies, as
+                                     # start and stop are run from threads
+        for address in addresses:
+            node = socket.create_connection(address, self.timeout)
+            node.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.nodes.append(node)
+            self.sequences.append(0)
+        for k, (started, motors) in enumerate(self.nodeStatus()):
+            self.motors += [(k, i) for i in range(len(motors))]
+        self.syncClocks()
+
+    def readExact(self, k, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.nodes[k].recv(size - len(data))
+            if not chunk:
+                raise ValueError("Node {0} closed the connection".format(k))
+            data += chunk
+        return data
+
+    # Sends each (node, command, motor, value, time) request, then reads the
+    # replies in the same order; returns each reply's (time, payload), or
+    # raises ValueError for the first which failed once all have been read
+    def exchange(self, requests):
+        replies = []
+        error = None
+        with self.lock:
+            try:
+                for k, command, motor, value, at in requests:
+                    self.nodes[k].sendall(node_request.pack(
+                        node_commands[command], motor, self.sequences[k], at,
+                        value))
+                    self.sequences[k] = (self.sequences[k] + 1) & 0xFFFFFFFF
+                for k, command, motor, value, at in requests:
+                    # Replies to requests which timed out are skipped
+                    expected = (self.sequences[k] - 1) & 0xFFFFFFFF
+                    sequence = None
+                    while sequence != expected:
+                        sequence, failed, time, length = node_reply.unpack(
+                            self.readExact(k, node_reply.size))
+                        payload = self.readExact(k, length)
+                    if failed and error is None:
+                        error = ValueError("Node {0}: {1}".format(k,
+                            payload.decode(errors="replace")))
+                    replies.append((time, payload))
+            except OSError as e:
+                raise ValueError("Node {0}: {1}".format(k, e))
+        if error is not None:
+            raise error
+        return replies
+
+    def broadcast(self, command, motor=all_motors, value=0.0, times=None):
+        return self.exchange([(k, command, motor, value, times[k] if times
+            else 0) for k in range(len(self.nodes))])
+
+    # Returns whether each node's motors are started and each motor's
+    # (RPM, position)
+    def nodeStatus(self):
+        status = []
+        for time, payload in self.broadcast("status"):
+            status.append((payload[0] != 0, [node_motor.unpack_from(payload,
+                offset) for offset in range(1, len(payload),
+                node_motor.size)]))
+        return status
+
+    # Measures each node's clock offset from the round trip which took the
+    # least time, taking the node's clock to have been read half way through
+    def syncClocks(self):
+        self.offsets = []
+        for k in range(len(self.nodes)):
+            best = None
+            for sample in range(self.clock_samples):
+                sent = perf_counter_ns()
+                time, payload = self.exchange([(k, "clock", 0, 0.0, 0)])[0]
+                received = perf_counter_ns()
+                if best is None or received - sent < best[0]:
+                    best = (received - sent, time - (sent + received) // 2)
+            self.offsets.append(best[1])
+
+    def motorIndex(self, motor):
+        if isinstance(motor, str) and motor.isdigit():
+            motor = int(motor)
+        if isinstance(motor, int) and 0 <= motor < len(self.motors):
+            return motor
+        raise ValueError("Unknown motor {0}".format(motor))
+
+    def start(self):
+        if self.started:
+            return
+        self.broadcast("prepare")
+        self.syncClocks()
+        at = perf_counter_ns() + int(self.start_lead * 1e9)
+        replies = self.broadcast("start", times=[at + offset for offset
+            in self.offsets])
+        self.start_late = [time - offset - at for (time, payload), offset
+            in zip(replies, self.offsets)]
+        self.started = True
+
+    def stop(self):
+        if self.player is not None:
+            self.player.stop()
+        self.broadcast("stop")
+        self.started = False
+
+    def setRpm(self, motor, rpm):
+        k, i = self.motors[self.motorIndex(motor)]
+        self.exchange([(k, "rpm", i, max(0.0, float(rpm)), 0)])
+
+    def nudge(self, motor, value):
+        if motor == "all":
+            self.broadcast("nudge", all_motors, float(value))
+        else:
+            k, i = self.motors[self.motorIndex(motor)]
+            self.exchange([(k, "nudge", i, float(value), 0)])
+
+    def setDirection(self, motor, clockwise):
+        k, i = self.motors[self.motorIndex(motor)]
+        self.exchange([(k, "direction", i, 1.0 if clockwise else 0.0, 0)])
+
+    # Each node's motors only know their own steps, so moves cannot be kept
+    # together across nodes
+    def move(self, deltas, rate, acceleration=0.0):
+        raise ValueError("Moves cannot be coordinated across nodes")
+
+    # Profiles are played just as they are by a HeadlessController
+    play = HeadlessController.play
+
+    # Each node stops its own motors on an emergency stop
+    def emergencyPending(self):
+        return False
+
+    def status(self, history=False):
+        if history:
+            raise ValueError("The nodes do not keep a step rate history")
+        nodes = self.nodeStatus()
+        return {
+            "time" : perf_counter_ns(),
+            "started" : self.started,
+            "nodes_started" : [started for started, motors in nodes],
+            "rpm" : [rpm for started, motors in nodes for rpm, position
+                in motors],
+            "position" : [position for started, motors in nodes
+                for rpm, position in motors],
+            "offset_us" : [offset / 1000.0 for offset in self.offsets],
+            "start_late_us" : [late / 1000.0 for late in self.start_late],
+            "playing" : self.player is not None and self.player.playing,
+            "profile_error" : self.player.error if self.player else ""
+        }
+
+    def close(self):
+        for node in self.nodes:
+            node.close()
+
+# Records when every edge output by the motor loop was due and when it was
+# actually written, into preallocated arrays, whilst it is set as the
+# GPIOHandler's profiler. Recording stops silently once capacity edges are
+# stored
+class EdgeProfiler:
+    def __init__(self, capacity=2000000):
+        self.capacity = capacity
+        self.scheduled = array("q", bytes(8 * capacity)) # perf_counter_ns()
+        self.actual = array("q", bytes(8 * capacity))
+        self.motors = array("H", bytes(2 * capacity))
+        self.count = 0
+
+    def record(self, i, scheduled, actual):
+        count = self.count
+        if count < self.capacity:
+            self.scheduled[count] = scheduled
+            self.actual[count] = actual
+            self.motors[count] = i
+            self.count = count + 1
+
+    # Returns, for each motor, its edge count, lateness percentiles and
+    # maximum in microseconds, edges later than late_fraction of the interval
+    # since the motor's previous edge was due, and a histogram of lateness:
+    # {bucket: edges}, where bucket b holds edges between 2 ** (b - 1) and
+    # 2 ** b microseconds late (b = 0 under 1 us)
+    def report(self, motor_count, late_fraction=GPIOHandler.late_fraction):
+        lateness = [[] for i in range(motor_count)]
+        missed = [0] * motor_count
+        previous = [None] * motor_count
+        for k in range(self.count):
+            i = self.motors[k]
+            late = self.actual[k] - self.scheduled[k]
+            lateness[i].append(late)
+            if (previous[i] is not None
+            and late > (self.scheduled[k] - previous[i]) * late_fraction):
+                missed[i] += 1
+            previous[i] = self.scheduled[k]
+
+        report = []
+        for i in range(motor_count):
+            late = sorted(lateness[i])
+            histogram = {}
+            for ns in late:
+                bucket = int(max(ns, 0) // 1000).bit_length()
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            count = len(late)
+            report.append({
+                "edges" : count,
+                "p50_us" : late[count // 2] / 1000.0 if late else 0.0,
+                "p99_us" : late[int(0.99 * (count - 1))] / 1000.0 if late
+                    else 0.0,
+                "p999_us" : late[int(0.999 * (count - 1))] / 1000.0 if late
+                    else 0.0,
+                "max_us" : late[-1] / 1000.0 if late else 0.0,
+                "missed" : missed[i],
+                "histogram" : histogram
+            })
+        return report
+
+# Returns what the motor loop's timing depends on besides the code: the switch
+# interval, the CPU frequency governors, the load average and the CPU count
+def schedulingEnvironment():
+    governors = set()
+    for cpu in range(os.cpu_count() or 1):
+        try:
+            governor = open(("/sys/devices/system/cpu/cpu{0}/cpufreq/"
+                "scaling_governor").format(cpu), "r")
+            governors.add(governor.read().strip())
+            governor.close()
+        except OSError:
+            pass
+    try:
+        load = os.getloadavg()
+    except (AttributeError, OSError):
+        load = (0.0, 0.0, 0.0)
+    return {
+        "switch_interval_us" : sys.getswitchinterval() * 1e6,
+        "governor" : ", ".join(sorted(governors)) or "unknown",
+        "load" : load,
+        "cpus" : os.cpu_count() or 1
+    }
 
+# Returns the BCM (PUL, DIR) pins of each motor in the settings file, and the
+# BCM emergency stop pin, so that the harnesses can drive the motors as they
+# are wired rather than on simulateMotors()' pins
+def configuredPins():
+    settings_filepath = path.join(sys.path[0], "stepperSettings.cfg")
+    board = boardPins()
+    settings = SettingsFile(settings_filepath, board).read(settingsSchema(
+        readMotorNames(settings_filepath) or motor_names))
+    pins = [(board[int(settings[name]["pul_pin"][2])],
+        board[int(settings[name]["dir_pin"][2])]) for name in settings
+        if name not in ("all", "emergency")]
+    return pins, board[int(settings["emergency"]["stop_pin"][2])]
+
+# Runs the motor loop for duration seconds with every edge profiled. Without
+# pins, motor_count simulated motors run on RecordingBackend; otherwise pins is
+# a list of (PUL, DIR) BCM pins for the motors, driven through the current GPIO
+# backend, with emer as the emergency stop pin. Returns the scheduling
+# environment, as measured whilst the motors ran, and the EdgeProfiler report
+def loopProfile(duration=5.0, motor_count=3, rpm=300.0, pulses_revolution=400,
+pins=None, emer=None):
+    global gpio
+    global EMER
+
+    # Slightly different speeds so that the motors' edges do not all coincide
+    half_periods = [30.0 / (pulses_revolution * rpm * (1.0 + 0.01 * i))
+        for i in range(len(pins) if pins else motor_count)]
+
+    saved = saveMotors()
     try:
-        test_vers = get("{0}version.cfg".format(url_main))
-        int_test_vers = int(str.replace(test_vers.text, ".", ""))
-        int_version = int(str.replace(version, ".", ""))
+        if pins:
+            backend = gpio
+            simulateMotors(len(pins), half_periods)
+            gpio = backend
+            for i in range(len(pins)):
+                PUL[i], DIR[i] = pins[i]
+            EMER = emer
+        else:
+            simulateMotors(motor_count, half_periods)
+        handler = GPIOHandler()
+        handler.profiler = EdgeProfiler()
+        handler.resumeThreads()
+        sleep(duration)
+        environment = schedulingEnvironment()
+        handler.stopThreads()
+        report = handler.profiler.report(len(half_periods))
+    finally:
+        restoreMotors(saved)
+
+    return environment, report
+
+# Finds the most edges a second the motor loop can output for motor_count
+# simulated motors together whilst missing no more than miss_limit more of
+# their deadlines (see GPIOHandler.late_fraction) than they do when lightly
+# loaded, for max_edge_rate in the settings; the light load's misses are the
+# operating system's wake-up latency rather than the loop falling behind.
+# The motors are first run flat out, giving the most the loop can output at
+# all; then the rate half way between the fastest which kept up and the
+# slowest which did not is tried, trials times. The motors' rates are spread a
+# little, so that their edges drift past each other rather than coinciding.
+# Without pins, the motors are simulated on RecordingBackend; otherwise pins
+# and emer are as for loopProfile()
+def capacityTest(motor_count=3, duration=0.5, trials=8, miss_limit=0.01,
+pins=None, emer=None):
+    global gpio
+    global EMER
+
+    if pins:
+        motor_count = len(pins)
+    saved = saveMotors()
+    try:
+        if pins:
+            backend = gpio
+            simulateMotors(motor_count, [0.0] * motor_count)
+            gpio = backend
+            for i in range(motor_count):
+                PUL[i], DIR[i] = pins[i]
+            EMER = emer
+        else:
+            simulateMotors(motor_count, [0.0] * motor_count)
+        handler = GPIOHandler()
+
+        def run(rate):
+            for i in range(motor_count):
+                delay[i] = motor_count * (1.0 + 0.01 * i) / rate
+                steps[i] = 0
+                missed_deadlines[i] = 0
+            handler.resumeThreads()
+            start = perf_counter_ns()
+            sleep(duration)
+            edges = 2 * sum(steps)
+            missed = sum(missed_deadlines)
+            elapsed = perf_counter_ns() - start
+            handler.pauseThreads()
+            return edges * 1e9 / elapsed, missed / max(1, edges)
+
+        saturated, missed = run(1e9)
+        baseline = run(saturated / 64.0)[1]
+        low = 0.0
+        high = saturated
+        for trial in range(trials):
+            rate = (low + high) / 2.0
+            achieved, missed = run(rate)
+            if achieved >= 0.98 * rate and missed <= baseline + miss_limit:
+                low = rate
+            else:
+                high = rate
+        handler.stopThreads()
+    finally:
+        restoreMotors(saved)
+
+    return {
+        "motors" : motor_count,
+        "saturated" : saturated,
+        "max_edge_rate" : low
+    }
 
-        if int_test_vers > int_version and "200" in str(test_vers):
-            vers_file = open(path.join(sys.path[0], "version.cfg"), "w")
-            vers_file.write(test_vers.text)
-            vers_file.close()
+# Writes text to filepath so that, even after a crash or power cut part way
+# through, the file holds either its old contents or all of the new ones.
+# The line endings in text are written as they are
+def atomicWrite(filepath, text):
+    temp_filepath = "{0}.{1}.tmp".format(filepath, os.getpid())
+    temp_file = open(temp_filepath, "w", newline="")
+    try:
+        temp_file.write(text)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    finally:
+        temp_file.close()
+    os.replace(temp_filepath, filepath)
+
+# Checks for and downloads a newer version of this script on a background
+# thread, so that neither starting nor closing the program waits on the
+# network. The ETag and Last-Modified of version.cfg are remembered in
+# updateCache.cfg, so an unchanged version file costs a 304 response
+class UpdateChecker:
+    timeout = 5.0 # Seconds allowed for connecting and for each read
+    thread = None
 
-            version = test_vers.text
+    def __init__(self, url=None, directory=None):
+        global url_main
 
-            script_text = get("{0}stepperHandler.py".format(url_main))
-            if "200" in str(script_text):
-                script = open(path.join(sys.path[0], "stepperHandler.py"), "w")
-                script.write(script_text.text)
-                script.close()
-    except:
-        pass
+        self.url = url or url_main
+        self.directory = directory or sys.path[0]
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True # Never holds up the program exiting
+        self.thread.start()
 
+    def run(self):
+        try:
+            self.update()
+        except Exception:
+            pass # Failing to update must never stop the program
 
+    def readCache(self):
+        headers = {}
+        try:
+            cache = open(path.join(self.directory, "updateCache.cfg"), "r")
+            for line in cache.read().split("\n"):
+                if " = " in line:
+                    key, value = line.split(" = ", 1)
+                    headers[key] = value
+            cache.close()
+        except OSError:
+            pass
+        return headers
+
+    def update(self):
+        global version
+
+        # Only imported here, as it takes longer than the rest of the program
+        # to load and the update check runs in the background
+        from requests import get
+
+        cache = self.readCache()
+        headers = {}
+        if "etag" in cache:
+            headers["If-None-Match"] = cache["etag"]
+        if "last_modified" in cache:
+            headers["If-Modified-Since"] = cache["last_modified"]
+
+        test_vers = get("{0}version.cfg".format(self.url), headers=headers,
+            timeout=self.timeout)
+        if test_vers.status_code != 200:
+            return # Includes 304 Not Modified
+
+        vers_path = path.join(self.directory, "version.cfg")
+        local_version = version
+        if path.exists(vers_path):
+            vers = open(vers_path, "r")
+            local_version = vers.read()
+            vers.close()
+
+        int_test_vers = int(str.replace(test_vers.text.strip(), ".", ""))
+        int_version = int(str.replace(local_version.strip(), ".", ""))
+
+        if int_test_vers > int_version:
+            script_text = get("{0}stepperHandler.py".format(self.url),
+                timeout=self.timeout)
+            if script_text.status_code != 200:
+                return
+            # The script is replaced before the version file, so that if the
+            # download fails the update is tried again next time
+            atomicWrite(path.join(self.directory, "stepperHandler.py"),
+                script_text.text)
+            atomicWrite(vers_path, test_vers.text)
+            version = test_vers.text
+
+        lines = []
+        if "ETag" in test_vers.headers:
+            lines.append("etag = {0}".format(test_vers.headers["ETag"]))
+        if "Last-Modified" in test_vers.headers:
+            lines.append("last_modified = {0}".format(
+                test_vers.headers["Last-Modified"]))
+        atomicWrite(path.join(self.directory, "updateCache.cfg"),
+            "\n".join(lines))
 
 # Called to start the program proper
 def main():
     global gpio_handler
     global app
+    global gpio
+
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Stepper Handler")
+    parser.add_argument("--gpio-backend", choices=sorted(gpio_backends),
+        default="rpi", help=("how the GPIO pins are driven: RPi.GPIO, direct "
+        "/dev/gpiomem register access, or an in-memory recorder for running "
+        "without hardware (default: rpi)"))
+    parser.add_argument("--waveform-sink", choices=["pigpio", "file"],
+        help=("generate the pulses as precomputed waveforms output by the "
+        "pigpio daemon, or written to --waveform-file, instead of toggling the "
+        "pins from Python"))
+    parser.add_argument("--waveform-file",
+        default=path.join(sys.path[0], "waveform.bin"),
+        help="file written by the file waveform sink")
+    parser.add_argument("--check-waveform", metavar="FILE",
+        help="report the pulse timing in a file written by the file sink")
+    parser.add_argument("--engine-process", action="store_true",
+        help=("experimental: run the GPIO handler in its own process, isolated "
+        "from the user interface; it has not yet been shown to time the pulses "
+        "any better than the default thread"))
+    parser.add_argument("--engine-cpu", type=int,
+        help="CPU to pin the engine process to; only with --engine-process")
+    parser.add_argument("--engine-priority", type=int, default=0,
+        help=("SCHED_FIFO priority (1-99) for the engine process, where "
+        "permitted; 0 leaves it unchanged. Only with --engine-process"))
+    parser.add_argument("--headless", action="store_true",
+        help=("run without a user interface, taking commands on the control "
+        "socket instead"))
+    parser.add_argument("--control-socket",
+        default=path.join(sys.path[0], "stepperHandler.sock"),
+        help="Unix domain socket on which --headless takes commands")
+    parser.add_argument("--node", metavar="HOST:PORT",
+        help=("run without a user interface, taking commands from a "
+        "coordinator on this TCP address instead of the control socket"))
+    parser.add_argument("--coordinator", metavar="HOST:PORT,...",
+        help=("drive the motors of the nodes at these addresses, started with "
+        "--node, as one, taking commands on the control socket; motors are "
+        "numbered across the nodes in order"))
+    parser.add_argument("--measure-capacity", action="store_true",
+        help=("find the most edges a second the motor loop can output without "
+        "falling behind on the motors' pins in the settings file, and store it "
+        "there as max_edge_rate; with --gpio-backend recorder, the motors are "
+        "simulated and the rate is only printed"))
+    parser.add_argument("--play", metavar="FILE",
+        help=("play a profile of timed RPMs and moves once the motors are "
+        "started; see readProfile()"))
+    parser.add_argument("--record", metavar="FILE",
+        help="record every RPM change and move into a profile")
+    parser.add_argument("--profile-loop", type=float, metavar="SECONDS",
+        help=("profile the timing of every edge of the motor loop for SECONDS; "
+        "with --gpio-backend recorder the motors are simulated, otherwise the "
+        "pins in the settings file are driven"))
+    parser.add_argument("--switch-interval", type=float, metavar="SECONDS",
+        help=("how long the interpreter lets a thread run before switching "
+        "whilst the motors are running (default: a hundredth of Python's)"))
+    parser.add_argument("--motors", type=int,
+        help=("number of motors to control; by default, one for each motor "
+        "section in the settings file"))
+    parser.add_argument("--update-url",
+        help=("location to check for updates instead of the GitHub repository; "
+        "must end in /"))
+    args = parser.parse_args()
+    if not args.engine_process and (args.engine_cpu is not None
+    or args.engine_priority):
+        # The engine process is experimental, so is never started implicitly
+        parser.error("--engine-cpu and --engine-priority need --engine-process")
+    startupPhase("arguments")
+
+    GPIOHandler.switch_interval = args.switch_interval
+
+    if args.profile_loop:
+        pins = None
+        emer = None
+        if args.gpio_backend != "recorder":
+            gpio = gpio_backends[args.gpio_backend]()
+            pins, emer = configuredPins()
+        environment, report = loopProfile(args.profile_loop, pins=pins,
+            emer=emer)
+        print(("switch interval {switch_interval_us:.1f} us, governor "
+            "{governor}, load {load[0]:.2f} {load[1]:.2f} {load[2]:.2f} on "
+            "{cpus} CPUs").format(**environment))
+        for i in range(len(report)):
+            print(("motor {0}: {edges:>7} edges, late p50 {p50_us:8.1f} us, "
+                "p99 {p99_us:8.1f} us, p99.9 {p999_us:8.1f} us, max "
+                "{max_us:8.1f} us, {missed} missed").format(i + 1, **report[i]))
+            histogram = report[i]["histogram"]
+            for bucket in sorted(histogram):
+                print("  {0:>9} {1:>7} {2}".format("< {0} us".format(
+                    2 ** bucket), histogram[bucket], "#" * max(1, int(50.0
+                    * histogram[bucket] / report[i]["edges"]))))
+        return
+
+    if args.coordinator:
+        coordinator = NodeCoordinator([nodeAddress(address)
+            for address in args.coordinator.split(",")])
+        if args.play:
+            coordinator.start()
+            coordinator.play(args.play)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(ControlServer(coordinator,
+                args.control_socket).serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.close()
+            coordinator.stop()
+            coordinator.close()
+        return
+
+    if args.measure_capacity:
+        if args.gpio_backend == "recorder":
+            result = capacityTest()
+        else:
+            gpio = gpio_backends[args.gpio_backend]()
+            pins, emer = configuredPins()
+            result = capacityTest(pins=pins, emer=emer)
+        print(("{motors} motors: {saturated:8.0f} edges/s flat out, "
+            "{max_edge_rate:8.0f} edges/s without falling behind").format(
+            **result))
+        if args.gpio_backend == "recorder":
+            # A simulated rate says nothing about the real pins, so is never
+            # given to the planner
+            print("not stored, as the motors were simulated")
+            return
+        settings_filepath = path.join(sys.path[0], "stepperSettings.cfg")
+        try:
+            settings_file = SettingsFile(settings_filepath, boardPins())
+            settings = settings_file.read(settingsSchema(readMotorNames(
+                settings_filepath) or motor_names))
+            settings["all"]["max_edge_rate"][2] = "{0:.0f}".format(
+                result["max_edge_rate"])
+            settings_file.write(settings)
+            print("stored as max_edge_rate in {0}".format(settings_filepath))
+        except (OSError, ValueError) as e:
+            print("could not store max_edge_rate: {0}".format(e))
+        return
+
+    if args.check_waveform:
+        report = checkWaveform(args.check_waveform)
+        for pin in report:
+            print(("BCM {0:>2}: {1:>7} pulses, period mean {2:10.1f} us, min "
+                "{3:>8} us, max {4:>8} us").format(pin, *report[pin]))
+        return
+
+    if args.motors:
+        allocateMotors(defaultMotorNames(args.motors))
+    else:
+        allocateMotors(readMotorNames(path.join(sys.path[0],
+            "stepperSettings.cfg")) or motor_names)
+
+    if args.engine_process:
+        gpio_handler = EngineProcess(len(PUL), args.gpio_backend,
+            args.waveform_sink, args.waveform_file, args.engine_cpu,
+            args.engine_priority)
+    else:
+        gpio = gpio_backends[args.gpio_backend]()
+        gpio_handler = GPIOHandler(makeSink(args.waveform_sink,
+            args.waveform_file))
+    startupPhase("motor handler")
+
+    if args.headless or args.node:
+        settings_filepath = path.join(sys.path[0], "stepperSettings.cfg")
+        try:
+            settings = SettingsFile(settings_filepath, boardPins()).read(
+                settingsSchema(motor_names))
+        except (OSError, ValueError) as e:
+            # Reported as the user interface reports it, but with no window to
+            # show it in
+            gpio_handler.stopThreads()
+            sys.exit("Error in settings file {0}: {1}".format(settings_filepath,
+                e))
+        controller = HeadlessController(settings, gpio_handler)
+        if args.record:
+            controller.recorder = ProfileRecorder(args.record)
+        if args.play:
+            controller.start()
+            controller.play(args.play)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(NodeServer(controller,
+                nodeAddress(args.node)).serve() if args.node
+                else ControlServer(controller, args.control_socket).serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.close()
+            controller.stop()
+            gpio_handler.stopThreads()
+            if controller.recorder is not None:
+                controller.recorder.close()
+        return
 
-    gpio_handler = GPIOHandler()
     app = MainWindow()
+
+    # Checked once the window is up, so the check never slows it appearing
+    app.after_idle(UpdateChecker, args.update_url)
+    if args.play:
+        app.player = ProfilePlayer(args.play, app)
+    if args.record:
+        app.recorder = ProfileRecorder(args.record)
+    gpio_handler.watch(app)
     app.mainloop() # Makes TKinter start to listen for user inputs
-    updateVersion()
 
 # Ensures the rest of the program only runs if this has not been imported as
 # a module by another program
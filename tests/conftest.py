@@ -0,0 +1,57 @@
+import sys
+from os import path
+
+import pytest
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))),
+    "stepperHandler"))
+
+import stepperHandler
+
+
+# Returns a HeadlessController driving len(rpms) motors simulated by
+# simulateMotors(), motor i at rpms[i] with 400 pulses a revolution. The
+# settings use the pins simulateMotors() gave the motors, and pin numbers are
+# used as they are, so that the controller drives the same pins. Also used by
+# nodes started in processes of their own, where there are no fixtures
+def simulatedController(rpms):
+    stepperHandler.simulateMotors(len(rpms), [0.0] * len(rpms))
+    names = stepperHandler.motor_names
+    settings = stepperHandler.settingsSchema(names)
+    for i in range(len(rpms)):
+        for key, value in (("rpm", str(rpms[i])), ("pulses_revolution", "400"),
+            ("pul_pin", str(stepperHandler.PUL[i])),
+            ("dir_pin", str(stepperHandler.DIR[i]))):
+            settings[names[i]][key][2] = value
+    settings["emergency"]["stop_pin"][2] = str(stepperHandler.EMER)
+    return stepperHandler.HeadlessController(settings,
+        stepperHandler.GPIOHandler(), {pin : pin for pin in range(28)})
+
+
+# Returns simulateMotors(), to run simulated motors on RecordingBackend, and
+# puts the motor state back as it was once the test is finished
+@pytest.fixture
+def simulate():
+    saved = stepperHandler.saveMotors()
+    try:
+        yield stepperHandler.simulateMotors
+    finally:
+        stepperHandler.restoreMotors(saved)
+
+
+# Returns simulatedController(); every controller it builds is stopped, with
+# its GPIO handler, once the test is finished
+@pytest.fixture
+def headless(simulate):
+    controllers = []
+
+    def build(rpms):
+        controllers.append(simulatedController(rpms))
+        return controllers[-1]
+
+    try:
+        yield build
+    finally:
+        for controller in controllers:
+            controller.stop()
+            controller.handler.stopThreads()
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import multiprocessing
+import tracemalloc
+from time import sleep
+
+import pytest
+
+import stepperHandler
+from conftest import simulatedController
+
+
+# Sends commands nudge commands for motor down a connection to the control
+# socket at socket_path, keeping up to window of them in flight; returns the
+# replies
+async def nudgeClient(socket_path, motor, commands, window):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    replies = []
+    sent = 0
+    while len(replies) < commands:
+        while sent < commands and sent - len(replies) < window:
+            writer.write((json.dumps({"id" : sent, "cmd" : "nudge",
+                "motor" : motor, "value" : 0.1}) + "\n").encode())
+            sent += 1
+        await writer.drain()
+        replies.append(json.loads(await reader.readline()))
+    writer.close()
+    return replies
+
+
+# Several clients at once send the control socket commands, many of them in
+# flight at a time; every one is answered, in order, and carried out
+def test_every_command_is_answered(headless, tmp_path):
+    controller = headless([60.0] * 3)
+    server = stepperHandler.ControlServer(controller,
+        str(tmp_path / "control.sock"))
+    controller.start()
+
+    async def run():
+        serving = asyncio.ensure_future(server.serve())
+        while server.server is None:
+            await asyncio.sleep(0.01)
+        replies = await asyncio.gather(*[nudgeClient(server.socket_path,
+            client % 3, 200, 16) for client in range(8)])
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+        return replies
+
+    loop = asyncio.new_event_loop()
+    try:
+        replies = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    for client in replies:
+        assert [reply["id"] for reply in client] == list(range(200))
+        assert all(reply["ok"] for reply in client)
+    # Three clients nudged each of the first two motors and two the third
+    assert controller.rpm == pytest.approx([120.0, 120.0, 100.0])
+
+
+# Runs a NodeServer for one simulated motor at 6 RPM, in a process of its own;
+# sends the port it listens on down connection
+def runNode(connection):
+    server = stepperHandler.NodeServer(simulatedController([6.0]),
+        ("127.0.0.1", 0))
+
+    async def run():
+        serving = asyncio.ensure_future(server.serve())
+        while server.server is None:
+            await asyncio.sleep(0.01)
+        connection.send(server.port())
+        await serving
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+# Nodes started as local processes are driven as one by a NodeCoordinator:
+# their motors start together, at the moment asked for, and commands reach
+# the right node
+def test_nodes_are_driven_as_one():
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    connections = []
+    coordinator = None
+    try:
+        for k in range(3):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=runNode, args=(child_connection,))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+            connections.append(connection)
+        coordinator = stepperHandler.NodeCoordinator([("127.0.0.1",
+            connection.recv()) for connection in connections])
+        coordinator.start()
+        late = coordinator.start_late
+        coordinator.setRpm(2, 30.0)
+        coordinator.nudge("all", 100.0)
+        sleep(0.2)
+        status = coordinator.status()
+        coordinator.stop()
+        stopped = coordinator.status()
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    assert max(late) < stepperHandler.NodeCoordinator.start_lead * 1e9
+    assert status["nodes_started"] == [True] * 3
+    assert status["rpm"] == pytest.approx([12.0, 12.0, 60.0])
+    assert all(position > 0 for position in status["position"])
+    assert stopped["nodes_started"] == [False] * 3
+
+
+# Writes a profile of count actions spread over seconds, mostly RPM changes
+# for the motors in names with a move every 5000 lines
+def writeProfile(filepath, names, count, seconds):
+    with open(filepath, "w") as profile:
+        for k in range(count):
+            if k % 5000 == 4999:
+                profile.write("{0:.6f} move 40,-20,10 4000\n".format(
+                    seconds * k / count))
+            else:
+                profile.write("{0:.6f} rpm {1} {2}\n".format(seconds * k
+                    / count, names[k % 3], 30 + (k * 7) % 200))
+
+
+# Plays a profile through controller, recording what is played to recorded;
+# returns the player once it has finished
+def play(controller, played, recorded):
+    controller.start()
+    controller.recorder = stepperHandler.ProfileRecorder(recorded)
+    controller.play(played)
+    while controller.player.playing:
+        sleep(0.01)
+    controller.recorder.close()
+    return controller.player
+
+
+# A profile played at 5000 actions a second is played on time, and the
+# recording of it reads back with the RPMs the motors were left at
+def test_recording_plays_back(headless, tmp_path):
+    controller = headless([60.0] * 3)
+    played = str(tmp_path / "played.txt")
+    recorded = str(tmp_path / "recorded.txt")
+    writeProfile(played, stepperHandler.motor_names, 5000, 1.0)
+    player = play(controller, played, recorded)
+
+    assert player.error == ""
+    assert player.applied == 5000
+    assert player.late_total / player.applied < 5e6
+    replayed = {}
+    for seconds, action in stepperHandler.readProfile(recorded):
+        if action[0] == "rpm":
+            replayed[action[1]] = action[2]
+    assert [replayed[name] for name in stepperHandler.motor_names] == (
+        controller.rpm)
+
+
+# A profile is read a little at a time as it is played, so playing one ten
+# times as long takes little more memory
+def test_playing_holds_only_part_of_a_profile(headless, tmp_path):
+    played = str(tmp_path / "played.txt")
+    recorded = str(tmp_path / "recorded.txt")
+    peaks = []
+    for count in (2000, 20000):
+        controller = headless([60.0] * 3)
+        writeProfile(played, stepperHandler.motor_names, count, 0.0)
+        tracemalloc.start()
+        try:
+            player = play(controller, played, recorded)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        controller.stop()
+        assert player.applied == count
+
+    assert peaks[1] < 2 * peaks[0]
@@ -0,0 +1,104 @@
+import threading
+from time import perf_counter_ns, sleep
+
+import stepperHandler
+
+sequence = (0, 1, 3, 2) # Encoder states, forwards
+
+
+# Turns a RecordingBackend's encoder pins on forwards by edges quadrature
+# edges from phase, calling the encoder back for every edge but those for
+# which drop(k) is true, as when the GPIO library drops one; returns the phase
+# reached
+def turn(recorder, encoder, phase, edges, drop=lambda k: False):
+    for k in range(edges):
+        old = sequence[phase]
+        phase = (phase + 1) % 4
+        new = sequence[phase]
+        pin = encoder.pin_a if (old ^ new) & 2 else encoder.pin_b
+        recorder.levels[pin] = (new & (2 if pin == encoder.pin_a else 1)) != 0
+        if not drop(k):
+            encoder.edge(pin)
+    return phase
+
+
+def test_encoder_counts_every_edge(simulate):
+    recorder = simulate(1, [0.0])
+    recorder.setupInput(20)
+    recorder.setupInput(21)
+    encoder = stepperHandler.QuadratureEncoder(0, 20, 21)
+    encoder.resync()
+    phase = turn(recorder, encoder, sequence.index(encoder.state), 10000)
+    assert stepperHandler.encoder_counts[0] == 10000
+    # Backwards is counted down
+    for k in range(100):
+        phase = (phase - 1) % 4
+        new = sequence[phase]
+        recorder.levels[20] = new & 2 != 0
+        recorder.levels[21] = new & 1 != 0
+        encoder.edge(20)
+    assert stepperHandler.encoder_counts[0] == 9900
+
+
+# A dropped callback leaves the next edge looking like both pins changed at
+# once, which counts nothing, so each drop costs two counts and no more
+def test_dropped_callback_loses_two_counts(simulate):
+    recorder = simulate(1, [0.0])
+    recorder.setupInput(20)
+    recorder.setupInput(21)
+    encoder = stepperHandler.QuadratureEncoder(0, 20, 21)
+    encoder.resync()
+    turn(recorder, encoder, sequence.index(encoder.state), 10000,
+        lambda k: k % 100 == 0)
+    assert stepperHandler.encoder_counts[0] == 10000 - 2 * 100
+
+
+# Two motors run whilst a thread feeds each one's encoder (A on BCM pin
+# 2 * i + 20, B on 2 * i + 21) eight counts for every pulse it has been sent,
+# the way a GPIO library's callback thread would, until the second motor's
+# encoder stops following it half way through. The first motor keeps
+# running, with its encoder in step, and the second is stopped as stalled
+# soon after its pulses get 100 ahead of its encoder
+def test_stall_is_caught(simulate):
+    half_periods = [30.0 / (400 * 300.0 * (1.0 + 0.01 * i)) for i in range(2)]
+    recorder = simulate(2, half_periods)
+    handler = stepperHandler.GPIOHandler()
+    handler.setEncoders([(2 * i + 20, 2 * i + 21, 8, 100.0) for i in range(2)])
+    handler.resumeThreads()
+
+    feeding = [True]
+    stalled_at = [0]
+    def feed():
+        phases = [2] * 2 # Both inputs start pulled up
+        emitted = [0] * 2
+        end = perf_counter_ns() + int(0.5e9)
+        while feeding[0]:
+            if not stalled_at[0] and perf_counter_ns() >= end:
+                stalled_at[0] = perf_counter_ns()
+            for i in range(2):
+                if i == 1 and stalled_at[0]:
+                    continue
+                target = stepperHandler.position[i] * 8
+                while emitted[i] < target:
+                    old = sequence[phases[i]]
+                    phases[i] = (phases[i] + 1) % 4
+                    new = sequence[phases[i]]
+                    if (old ^ new) & 2:
+                        recorder.trigger(2 * i + 20, new & 2 != 0)
+                    else:
+                        recorder.trigger(2 * i + 21, new & 1 != 0)
+                    emitted[i] += 1
+            sleep(0.0002)
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    sleep(1.0)
+    feeding[0] = False
+    feeder.join()
+    handler.stopThreads()
+
+    assert [flag != 0 for flag in stepperHandler.stalled] == [False, True]
+    assert abs(stepperHandler.position[0]
+        - stepperHandler.encoder_counts[0] / 8) <= 1
+    # The last edge the stalled motor was sent
+    stopped_at = recorder.edgeTimes(stepperHandler.PUL[1])[-1]
+    assert stopped_at - stalled_at[0] < 100 * 2e9 * half_periods[1] + 0.1e9
@@ -0,0 +1,44 @@
+from time import perf_counter_ns, sleep
+
+import pytest
+
+import stepperHandler
+
+
+# The first of two motors is raised through RPMs against an edge rate limit
+# of 20000 edges a second, whilst the second runs at 60 RPM. The finest
+# microstep resolution within the limit is chosen at each RPM, its pins are
+# set, and an RPM no resolution can reach is refused, leaving it as it was
+def test_microsteps_switch_to_stay_within_the_edge_rate(headless):
+    controller = headless([0.0, 60.0])
+    recorder = stepperHandler.gpio
+    setting = controller.settings[stepperHandler.motor_names[0]]
+    setting["microstep_pins"][2] = "10,11,12"
+    setting["microsteps"][2] = "200:000,400:100,800:010,1600:110,3200:001"
+    controller.settings["all"]["max_edge_rate"][2] = "20000"
+    controller.start()
+    planner = controller.planner
+
+    for rpm, refused, pulses_revolution, pins in ((30.0, False, 3200, "001"),
+        (150.0, False, 3200, "001"), (300.0, False, 1600, "110"),
+        (600.0, False, 800, "010"), (1000.0, False, 400, "100"),
+        (4000.0, True, 400, "100"), (60.0, False, 3200, "001")):
+        if refused:
+            with pytest.raises(ValueError):
+                controller.setRpm(0, rpm)
+        else:
+            controller.setRpm(0, rpm)
+        sleep(0.05) # Lets the motor loop make the switch
+        before = sum(stepperHandler.steps)
+        start = perf_counter_ns()
+        sleep(0.3)
+        achieved = 2e9 * (sum(stepperHandler.steps) - before) / (
+            perf_counter_ns() - start)
+        asked = sum(planner.edgeRate(i, planner.mode[i], controller.rpm[i])
+            for i in range(2))
+
+        assert planner.pulsesRevolution()[0] == pulses_revolution
+        assert "".join("1" if recorder.levels.get(pin) else "0"
+            for pin in (10, 11, 12)) == pins
+        assert asked <= 20000
+        assert achieved == pytest.approx(asked, rel=0.05)
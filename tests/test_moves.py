@@ -0,0 +1,87 @@
+from math import sqrt
+from time import sleep
+
+import pytest
+
+import stepperHandler
+
+
+# A diagonal move at 100 steps per second on each axis follows one along a
+# single axis; the two are joined at the same feed rate, not at the diagonal's
+# longest-axis rate
+def test_exit_speed_compares_feed_rates(simulate):
+    simulate(2, [0.0, 0.0])
+    moves = stepperHandler.MoveQueue()
+    moves.add((100, 0), 1000.0)
+    moves.add((100, 100), 100.0)
+    assert moves.exitSpeed(0) == pytest.approx(100.0 * sqrt(2.0))
+
+
+def test_exit_speed_stops_for_a_reversal(simulate):
+    simulate(2, [0.0, 0.0])
+    moves = stepperHandler.MoveQueue()
+    moves.add((100, 50), 1000.0)
+    moves.add((-100, 50), 1000.0)
+    assert moves.exitSpeed(0) == 0.0
+
+
+def test_step_counted_once_its_edge_is_output(simulate):
+    simulate(2, [0.0, 0.0])
+    pul_mask = 1 << stepperHandler.PUL[0]
+    moves = stepperHandler.MoveQueue()
+    moves.add((3, 0), 1000.0)
+    edges = moves.edges()
+    set_mask = 0
+    while not set_mask & pul_mask:
+        set_mask = next(edges)[0]
+    # The rising edge has been handed out but not yet output
+    assert stepperHandler.steps[0] == 0
+    next(edges)
+    assert stepperHandler.steps[0] == 1
+    for edge in edges:
+        pass
+    assert list(stepperHandler.steps) == [3, 0]
+    assert list(stepperHandler.position) == [3, 0]
+
+
+# A chain of coordinated moves on three motors: each motor makes the steps
+# asked of it, and the motors start and finish each move within a step of
+# each other, as a fraction of the slowest motor's first or last step period
+def test_chained_moves_start_and_finish_together(simulate):
+    moves = (((800, 400, -200), 4000.0), ((800, 800, 0), 4000.0),
+        ((400, 0, -400), 2000.0), ((-400, -200, 100), 4000.0))
+    recorder = simulate(3, [0.0] * 3)
+    for i in range(3):
+        stepperHandler.operating[i] = 0 # Only the moves drive the motors
+    handler = stepperHandler.GPIOHandler()
+    handler.resumeThreads()
+    sleep(0.01)
+    for deltas, rate in moves:
+        assert handler.queueMove(deltas, rate, 20000.0)
+    while handler.moves:
+        sleep(0.01)
+    handler.stopThreads()
+    rising = [recorder.edgeTimes(2 * i + 2, True) for i in range(3)]
+
+    assert [len(times) for times in rising] == [sum(abs(deltas[i])
+        for deltas, rate in moves) for i in range(3)]
+    assert list(stepperHandler.position) == [sum(deltas[i]
+        for deltas, rate in moves) for i in range(3)]
+
+    # Each move's edges, motor by motor, in the order they were made
+    counts = [0, 0, 0]
+    for deltas, rate in moves:
+        firsts = []
+        lasts = []
+        first_period = 0
+        last_period = 0
+        for i in range(3):
+            if deltas[i]:
+                times = rising[i][counts[i]:counts[i] + abs(deltas[i])]
+                counts[i] += abs(deltas[i])
+                firsts.append(times[0])
+                lasts.append(times[-1])
+                first_period = max(first_period, times[1] - times[0])
+                last_period = max(last_period, times[-1] - times[-2])
+        assert max(firsts) - min(firsts) < first_period
+        assert max(lasts) - min(lasts) < last_period
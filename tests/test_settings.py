@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import stepperHandler
+
+
+# Settings for motor_count motors with every motor's values filled in
+def filledSettings(motor_count):
+    names = stepperHandler.defaultMotorNames(motor_count)
+    settings = stepperHandler.settingsSchema(names)
+    for name in names:
+        for key, value in (("rpm", "60"), ("increment", "a"),
+            ("decrement", "z"), ("in_decrement_value", "0.5"),
+            ("pulses_revolution", "400"), ("pul_pin", "11"), ("dir_pin", "12")):
+            settings[name][key][2] = value
+    settings["emergency"]["stop_pin"][2] = "40"
+    return names, settings
+
+
+@pytest.mark.parametrize("motor_count", [3, 64, 1024])
+def test_settings_read_back_as_written(tmp_path, motor_count):
+    names, settings = filledSettings(motor_count)
+    settings[names[-1]]["rpm"][4] = "Last motor"
+    filepath = str(tmp_path / "settings.cfg")
+    assert stepperHandler.SettingsFile(filepath).write(settings)
+
+    read = stepperHandler.SettingsFile(filepath).read(
+        stepperHandler.settingsSchema(names))
+    for section in settings:
+        for key in settings[section]:
+            assert read[section][key][2] == settings[section][key][2]
+            assert read[section][key][4] == settings[section][key][4]
+
+
+# Only a changed setting's line is rewritten, and with nothing changed the
+# file is not written at all
+def test_settings_written_only_when_changed(tmp_path):
+    names, settings = filledSettings(3)
+    filepath = str(tmp_path / "settings.cfg")
+    stepperHandler.SettingsFile(filepath).write(settings)
+    with open(filepath, "r", newline="") as written:
+        before = written.read().split("\n")
+
+    settings_file = stepperHandler.SettingsFile(filepath)
+    settings = settings_file.read(settings)
+    stamp = os.stat(filepath).st_ino
+    assert not settings_file.write(settings)
+    assert os.stat(filepath).st_ino == stamp
+
+    settings[names[1]]["rpm"][2] = "75"
+    assert settings_file.write(settings)
+    with open(filepath, "r", newline="") as written:
+        after = written.read().split("\n")
+    assert [k for k in range(len(before)) if before[k] != after[k]] == [
+        settings_file.line_index[(names[1], "rpm")]]
+
+
+# A file with Windows line endings keeps them when it is written
+def test_settings_keep_line_endings(tmp_path):
+    names, settings = filledSettings(3)
+    filepath = str(tmp_path / "settings.cfg")
+    stepperHandler.SettingsFile(filepath).write(settings)
+    with open(filepath, "r", newline="") as written:
+        text = written.read()
+    with open(filepath, "w", newline="") as rewritten:
+        rewritten.write(text.replace("\n", "\r\n"))
+
+    settings_file = stepperHandler.SettingsFile(filepath)
+    settings = settings_file.read(settings)
+    settings[names[0]]["rpm"][2] = "30"
+    settings_file.write(settings)
+    with open(filepath, "r", newline="") as written:
+        text = written.read()
+    assert text.count("\r\n") == text.count("\n")
@@ -0,0 +1,223 @@
+import re
+from time import clock_gettime_ns, perf_counter_ns, pthread_getcpuclockid, sleep
+
+import pytest
+
+import stepperHandler
+
+
+def runFor(duration):
+    handler = stepperHandler.GPIOHandler()
+    handler.resumeThreads()
+    sleep(duration)
+    handler.stopThreads()
+    return handler
+
+
+# Half period (seconds) of a motor at rpm with 400 pulses a revolution
+def halfPeriod(rpm):
+    return 30.0 / (400 * rpm)
+
+
+# Keeps the main thread busy for duration seconds parsing settings text in pure
+# Python, as the user interface keeps it busy, so that the motor thread has to
+# win the GIL from it
+def busy(duration):
+    end = perf_counter_ns() + int(duration * 1e9)
+    text = "\n".join("key_{0} = {0} // comment".format(k) for k in range(200))
+    while perf_counter_ns() < end:
+        for line in re.split("\\[|\\]|\n", text):
+            line.split("//")[0].split("=")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+
+# A motor at 6 RPM has 12.5 ms between edges, so only a stall of several
+# milliseconds would count as a missed deadline
+def test_light_load_misses_no_deadlines(simulate):
+    simulate(1, [30.0 / (400 * 6.0)])
+    runFor(1.0)
+    assert stepperHandler.steps[0] >= 30
+    assert list(stepperHandler.missed_deadlines) == [0]
+
+
+def test_any_lateness_is_counted_with_no_allowance(simulate, monkeypatch):
+    monkeypatch.setattr(stepperHandler.GPIOHandler, "late_fraction", 0.0)
+    simulate(1, [30.0 / (400 * 60.0)])
+    runFor(0.5)
+    assert stepperHandler.missed_deadlines[0] > 0
+
+
+# Each edge is scheduled from the one before it was due, not from when it was
+# output, so lateness never accumulates: every edge lands near where a perfect
+# pulse train started at the first edge would put it
+@pytest.mark.parametrize("motor_count", [1, 3, 16])
+def test_edges_do_not_drift(simulate, motor_count):
+    # Slightly different speeds so that the motors' edges do not all coincide
+    half_periods = [halfPeriod(60.0 * (1.0 + 0.01 * i))
+        for i in range(motor_count)]
+    recorder = simulate(motor_count, half_periods)
+    runFor(1.0)
+
+    drifts = []
+    for i in range(motor_count):
+        times = recorder.edgeTimes(2 * i + 2)
+        assert len(times) >= 0.9 / half_periods[i]
+        drifts.extend(abs(times[k] - (times[0] + k * half_periods[i] * 1e9))
+            for k in range(len(times)))
+    assert percentile(drifts, 0.5) < half_periods[0] * 1e9
+
+
+# No pulse is started once the emergency stop is pressed, wherever in a pulse
+# it lands, and the motors stop within the pulse they were making
+def test_emergency_stop_starts_no_pulses(simulate):
+    trials = 20
+    half_period = halfPeriod(300.0)
+    recorder = simulate(3, [half_period] * 3)
+    pul_pins = set(stepperHandler.PUL)
+    handler = stepperHandler.GPIOHandler()
+    latencies = []
+    late_pulses = 0
+    for trial in range(trials):
+        recorder.trigger(stepperHandler.EMER, True)
+        handler.resumeThreads()
+        # Varied, so that presses land at different points in the pulses
+        sleep(0.02 + half_period * trial / trials)
+        recorder.reset()
+        pressed = perf_counter_ns()
+        recorder.trigger(stepperHandler.EMER, False)
+        sleep(0.02)
+
+        last_edge = pressed
+        for k in range(recorder.count):
+            if recorder.pins[k] in pul_pins:
+                last_edge = max(last_edge, recorder.times[k])
+                late_pulses += recorder.values[k]
+        latencies.append(last_edge - pressed)
+    handler.stopThreads()
+
+    assert late_pulses == 0
+    assert percentile(latencies, 0.5) < half_period * 1e9 + 1e6
+
+
+# Every pin changing at an edge is written in one call of set and clear
+# masks, rather than a call a pin
+def test_edges_are_written_with_masks(simulate):
+    half_periods = [halfPeriod(300.0 * (1.0 + 0.01 * i)) for i in range(3)]
+    recorder = simulate(3, half_periods)
+    handler = stepperHandler.GPIOHandler()
+    handler.resumeThreads()
+    sleep(0.1)
+    recorder.reset()
+    start = perf_counter_ns()
+    sleep(1.0)
+    calls = recorder.calls
+    edges = recorder.count
+    elapsed = (perf_counter_ns() - start) / 1e9
+    handler.stopThreads()
+
+    assert edges >= 0.9 * elapsed * sum(1.0 / half_period
+        for half_period in half_periods)
+    assert calls <= edges
+
+
+# Whilst paused the motor thread blocks rather than polling, and is woken
+# promptly when the motors are resumed
+def test_paused_thread_blocks_and_wakes(simulate):
+    recorder = simulate(1, [halfPeriod(60.0)])
+    handler = stepperHandler.GPIOHandler()
+    clock = pthread_getcpuclockid(handler.thread.ident)
+    sleep(0.05)
+    start = perf_counter_ns()
+    cpu_start = clock_gettime_ns(clock)
+    sleep(1.0)
+    cpu = clock_gettime_ns(clock) - cpu_start
+    elapsed = perf_counter_ns() - start
+
+    latencies = []
+    for trial in range(10):
+        recorder.reset()
+        resumed = perf_counter_ns()
+        handler.resumeThreads()
+        sleep(0.05) # Rather than spinning, which would hold the GIL
+        edges = recorder.edgeTimes(stepperHandler.PUL[0])
+        if edges:
+            latencies.append(edges[0] - resumed)
+        handler.pauseThreads()
+    handler.stopThreads()
+
+    assert cpu < 0.001 * elapsed
+    assert len(latencies) == 10
+    assert percentile(latencies, 0.5) < 5e6
+
+
+# The RPM motors achieve, as sampled by StepRateMonitor, is what they were
+# asked for, even with the main thread kept busy
+def test_achieved_rpm_follows_commanded(simulate):
+    rpms = (60.0, 150.0, 300.0)
+    simulate(len(rpms), [halfPeriod(rpm) for rpm in rpms])
+    monitor = stepperHandler.StepRateMonitor()
+    handler = stepperHandler.GPIOHandler()
+    handler.resumeThreads()
+    monitor.start()
+    busy(2.0)
+    monitor.stop()
+    snapshot = stepperHandler.telemetrySnapshot()
+    handler.stopThreads()
+
+    for i in range(len(rpms)):
+        # The first sample includes the motors starting up
+        achieved = [rate * 60.0 / 400 for time, rate in monitor.series(i)[1:]]
+        assert achieved
+        assert sum(achieved) / len(achieved) == pytest.approx(rpms[i], rel=0.1)
+        assert snapshot["position"][i] > 0
+
+
+# The status strip shows the RPM the motors achieve, and updating it, as
+# MainWindow does on the Tk main loop, is cheap
+@pytest.mark.parametrize("frame_rate", [4, 60])
+def test_status_strip_shows_achieved_rpm(simulate, frame_rate):
+    simulate(3, [halfPeriod(300.0)] * 3)
+    handler = stepperHandler.GPIOHandler()
+    handler.resumeThreads()
+    strip = stepperHandler.StatusStrip(3)
+    update_time = []
+    for k in range(frame_rate):
+        start = perf_counter_ns()
+        strip.update([400] * 3)
+        update_time.append(perf_counter_ns() - start)
+        sleep(1.0 / frame_rate)
+    handler.stopThreads()
+
+    for text in strip.texts:
+        assert float(text.split(" RPM")[0]) == pytest.approx(300.0, rel=0.1)
+    assert sum(update_time) / len(update_time) < 1e6
+
+
+# The engine process outputs the same pulses as the GPIO handler thread, from
+# the motor state it is given before resuming
+def test_engine_process_outputs_pulses(simulate):
+    half_period = halfPeriod(60.0)
+    simulate(3, [half_period] * 3)
+    engine = stepperHandler.EngineProcess(3, "recorder")
+    try:
+        for i in range(3):
+            stepperHandler.PUL[i] = 2 * i + 2
+            stepperHandler.DIR[i] = 2 * i + 3
+            stepperHandler.delay[i] = half_period
+            stepperHandler.operating[i] = 1
+        engine.resumeThreads()
+        busy(1.0)
+        engine.connection.send(("edges", list(stepperHandler.PUL)))
+        edges = engine.connection.recv()
+    finally:
+        engine.stopThreads()
+
+    for pin in stepperHandler.PUL:
+        times = edges[pin]
+        assert len(times) >= 0.5 / half_period
+        assert percentile([abs(times[k] - times[k - 1] - half_period * 1e9)
+            for k in range(1, len(times))], 0.5) < 0.1e9 * half_period
@@ -0,0 +1,121 @@
+import http.server
+import os
+import socket
+import threading
+
+import pytest
+
+import stepperHandler
+
+served = {
+    "/version.cfg" : "9.9.9",
+    "/stepperHandler.py" : "# The updated script\n"
+}
+
+
+# A stand-in update server on localhost, serving version.cfg and the script
+# with an ETag and answering a matching If-None-Match with 304. Returns its
+# URL and the (path, If-None-Match) of each request made of it
+@pytest.fixture
+def server():
+    pytest.importorskip("requests")
+    requests_made = []
+
+    class StandIn(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_made.append((self.path, self.headers.get(
+                "If-None-Match")))
+            if self.path not in served:
+                self.send_error(404)
+                return
+            body = served[self.path].encode()
+            etag = '"{0:x}"'.format(hash(body) & 0xffffffff)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    stand_in = http.server.HTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=stand_in.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield ("http://127.0.0.1:{0}/".format(stand_in.server_address[1]),
+            requests_made)
+    finally:
+        stand_in.shutdown()
+        stand_in.server_close()
+
+
+# A directory holding an older version of the script; the version the module
+# holds is put back afterwards, as an update changes it
+@pytest.fixture
+def installed(tmp_path, monkeypatch):
+    monkeypatch.setattr(stepperHandler, "version", stepperHandler.version)
+    stepperHandler.atomicWrite(str(tmp_path / "stepperHandler.py"),
+        "# The installed script\n")
+    stepperHandler.atomicWrite(str(tmp_path / "version.cfg"), "1.0.0")
+    return tmp_path
+
+
+# Runs an update check; returns whether it finished in time
+def check(url, directory):
+    checker = stepperHandler.UpdateChecker(url, str(directory))
+    checker.thread.join(10.0)
+    return not checker.thread.is_alive()
+
+
+def read(filepath):
+    with open(str(filepath), "r") as opened:
+        return opened.read()
+
+
+def test_newer_version_replaces_script(server, installed):
+    url, requests_made = server
+    assert check(url, installed)
+    assert read(installed / "stepperHandler.py") == served["/stepperHandler.py"]
+    assert read(installed / "version.cfg") == served["/version.cfg"]
+    assert read(installed / "updateCache.cfg").startswith("etag = ")
+
+
+# An unchanged version file is answered with 304, so nothing more is fetched
+# and updateCache.cfg is not rewritten
+def test_unchanged_version_fetches_nothing(server, installed):
+    url, requests_made = server
+    assert check(url, installed)
+    cache = os.stat(str(installed / "updateCache.cfg"))
+    made = len(requests_made)
+    assert check(url, installed)
+    assert requests_made[made:] == [("/version.cfg",
+        read(installed / "updateCache.cfg").split(" = ", 1)[1])]
+    assert os.stat(str(installed / "updateCache.cfg")).st_ino == cache.st_ino
+
+
+# An unreachable server ends the check without an exception escaping its
+# thread or any file changing
+def test_unreachable_server_ignored(installed, monkeypatch):
+    pytest.importorskip("requests")
+    uncaught = []
+    monkeypatch.setattr(threading, "excepthook",
+        lambda arguments: uncaught.append(arguments))
+    # A port which was free a moment ago, so the connection is refused
+    unused = socket.socket()
+    unused.bind(("127.0.0.1", 0))
+    port = unused.getsockname()[1]
+    unused.close()
+    contents = {name : read(installed / name) for name in os.listdir(
+        str(installed))}
+
+    assert check("http://127.0.0.1:{0}/".format(port), installed)
+    assert not uncaught
+    assert {name : read(installed / name) for name in os.listdir(
+        str(installed))} == contents
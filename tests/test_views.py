@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import tkinter as tk
+from os import path
+
+import pytest
+
+import stepperHandler
+
+
+@pytest.fixture(params=[3, 16])
+def window(simulate, request):
+    simulate(request.param, [0.0] * request.param)
+    try:
+        window = stepperHandler.MainWindow()
+    except tk.TclError:
+        pytest.skip("needs a display")
+    try:
+        yield window
+    finally:
+        window.destroy()
+
+
+# Each view has a frame of its own, and switching views swaps the frames
+# rather than regridding every widget
+def test_only_the_shown_view_is_packed(window):
+    for view in ("settings", "errors", "main", "errors", "settings"):
+        window.createWindow(view, error="Unc")
+        window.update()
+        assert [name for name in window.frames
+            if window.frames[name].winfo_manager()] == [view]
+
+
+# Only the main view is built on starting, after the phases before it; the
+# others are built the first time they are shown
+def test_views_built_on_first_use(window):
+    phases = [name for name, time in stepperHandler.startup_times]
+    assert phases.index("board pins") < phases.index("main view")
+    assert window.widgets["settings"] is None
+    assert window.widgets["errors"] is None
+    window.createWindow("settings")
+    assert window.widgets["settings"] is not None
+    assert window.widgets["errors"] is None
+
+
+# Modules which only some modes use are not imported with the script, so that
+# the user interface never waits for them
+def test_seldom_used_modules_not_imported():
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c",
+        "import stepperHandler"], cwd=path.dirname(stepperHandler.__file__),
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    imported = set(line.split("|")[-1].strip() for line in output.split("\n")
+        if line.startswith("import time:"))
+    assert "stepperHandler" in imported
+    for module in ("asyncio", "multiprocessing", "json", "socket",
+        "http.server", "requests", "subprocess", "tracemalloc"):
+        assert module not in imported